@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Measures the step latency of RtiNmpc against the horizon length without condensing, with
+full condensing and with partial condensing (block size 5), on the nonlinear chain model
+(ocp_modules.models.Chain) with 8 states and 2 controls. Reports the median of the preparation
+phase (QP data and condensing), the feedback phase (QP solution and expansion) and the whole
+step, averaged over a closed-loop run. Cases whose QP solver fails are reported as such.
+
+Run via:
+
+    python3 -m benchmarks.condensing
+"""
+
+import time
+import numpy as np
+
+from ocp_modules.controllers.RtiNmpc import RtiNmpc
+from ocp_modules.modules import DirectMultipleShootingConstraints, InitialValueConstraints
+from ocp_modules.modules import OcpParams, OcpVars, TrackingCosts
+from ocp_modules.models.Chain import Chain
+
+num_states = 8
+num_controls = 2
+sampling_time = 0.1
+horizon_lengths = (10, 20, 40, 80)
+modes = ('none', 'full', 'partial')
+block_size = 5
+
+
+def build(M, condensing, qpsol='qpoases'):
+    model = Chain(num_states, num_controls, nonlinear=True)
+    model_discrete = model.createTimeDiscreteFun(model.ode, sampling_time, num_states,
+                                                 num_controls)
+    state_weight = np.hstack([np.ones(num_states // 2), 0.1 * np.ones(num_states // 2)])
+    control_weight = 1e-2 * np.ones(num_controls)
+
+    var, lbw, ubw = OcpVars.gen(num_states, num_controls, M, None,
+                                np.array([[-10.] * num_controls, [10.] * num_controls]))
+    params = OcpParams.gen(num_states, num_controls, M)
+    costs = TrackingCosts.gen(var['x'][:], params['x_ref'][:], state_weight)
+    costs += TrackingCosts.gen(var['u'][:], params['u_ref'][:], control_weight)
+    constr = InitialValueConstraints.gen(var, params)
+    constr += DirectMultipleShootingConstraints.gen(var, model_discrete, M)
+
+    solver_opts = {'printLevel': 'none', 'sparse': condensing != 'full',
+                   'enableEqualities': True}
+    if qpsol != 'qpoases':
+        solver_opts = {'qpsol': qpsol}
+    ctrl = RtiNmpc(var, lbw, ubw, params, costs, constr, num_states, num_controls, M,
+                   np.zeros(var.size), state_weight, control_weight, solvOpts=solver_opts,
+                   recordOpts={'policy': 'off'}, condensing=condensing,
+                   condensingBlockSize=block_size)
+    return ctrl, params, model_discrete
+
+
+def measure(M, condensing, num_steps, qpsol='qpoases'):
+    ctrl, params, plant = build(M, condensing, qpsol)
+    packer = OcpParams.ParamPacker(params)
+    control_refs = np.zeros((num_controls, M))
+
+    x = np.zeros((num_states,))
+    durations = np.empty((num_steps, 2))
+    for i in range(num_steps):
+        setpoint = 0.5 * np.sin(0.5 * sampling_time * (i + np.arange(M + 1)))
+        state_refs = np.vstack([np.tile(setpoint, (num_states // 2, 1)),
+                                np.zeros((num_states // 2, M + 1))])
+        parameters = packer.pack({'x_cur': x, 'x_ref': state_refs, 'u_ref': control_refs})
+
+        tick = time.perf_counter()
+        ctrl.prepare(parameters)
+        tock = time.perf_counter()
+        u = ctrl.feedback(x)
+        durations[i] = (tock - tick, time.perf_counter() - tock)
+        x = np.array(plant(x, u[:, 0])).ravel()
+
+    return np.median(durations, axis=0) * 1e6, np.median(durations.sum(axis=1)) * 1e6
+
+
+def run(num_steps=100):
+    print('%5s %-9s %16s %16s %12s' % ('M', 'condensing', 'preparation [us]', 'feedback [us]',
+                                       'step [us]'))
+    for M in horizon_lengths:
+        for condensing in modes:
+            try:
+                (preparation, feedback), step = measure(M, condensing, num_steps)
+            except RuntimeError:
+                print('%5d %-10s %s' % (M, condensing, 'QP solver failed'))
+                continue
+            print('%5d %-10s %16.1f %16.1f %12.1f' % (M, condensing, preparation, feedback,
+                                                       step))
+
+
+if __name__ == '__main__':
+    run()
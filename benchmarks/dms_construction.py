@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Compares building and solving an NMPC for the 2D rocket with direct multiple shooting
+constraints generated per node (DirectMultipleShootingConstraints.gen) and via a mapped
+model function (DirectMultipleShootingConstraints.genMapped) for increasing horizon lengths.
+The variant 'MX' builds the whole OCP on MX variables and parameters (see OcpVars.gen), for
+which the constraints are generated via the mapped model function as well.
+
+Run via:
+
+    python3 -m benchmarks.dms_construction
+"""
+
+import time
+import numpy as np
+
+from ocp_modules.controllers.Nmpc import Nmpc
+from ocp_modules.modules import DirectMultipleShootingConstraints, InitialValueConstraints
+from ocp_modules.modules import OcpParams, OcpVars, TrackingCosts
+from ocp_modules.models.Rocket import Rocket
+
+sampling_time = 1e-1
+state_weight = np.array([1., 1., 0., 0., 0., 0.1]) * 1e-2
+control_weight = np.array([0.01, 1.0]) * 1e-4
+control_limits = np.array([[0, -2e1], [2e3, 2e1]])
+
+# symbolic type of the OCP and generator of the multiple shooting constraints per variant
+variants = {
+    'gen': ('SX', lambda var, fun, M: DirectMultipleShootingConstraints.gen(var, fun, M)),
+    'genMapped serial': ('SX', lambda var, fun, M: DirectMultipleShootingConstraints.genMapped(
+        var, fun, M, 'serial')),
+    'genMapped thread': ('SX', lambda var, fun, M: DirectMultipleShootingConstraints.genMapped(
+        var, fun, M, 'thread', 4)),
+    'MX': ('MX', lambda var, fun, M: DirectMultipleShootingConstraints.gen(var, fun, M)),
+}
+
+
+def build(variant, horizon_length):
+    model = Rocket()
+    num_states = model.NUMSTATES()
+    num_controls = model.NUMCONTROLS()
+    model_discrete = model.createTimeDiscreteFun(model.ode, sampling_time, num_states,
+                                                 num_controls)
+
+    sym_type, generator = variants[variant]
+    var, lbw, ubw = OcpVars.gen(num_states, num_controls, horizon_length, None, control_limits,
+                                sym_type)
+    params = OcpParams.gen(num_states, num_controls, horizon_length, sym_type)
+
+    costs = TrackingCosts.gen(var['x'][:], params['x_ref'][:], state_weight)
+    costs += TrackingCosts.gen(var['u'][:], params['u_ref'][:], control_weight)
+
+    constr = InitialValueConstraints.gen(var, params)
+    constr += generator(var, model_discrete, horizon_length)
+
+    ctrl = Nmpc(var, lbw, ubw, params, costs, constr, num_states, num_controls, horizon_length)
+    return ctrl, params
+
+
+def run(horizon_lengths=(10, 20, 50, 100, 200), num_steps=10):
+    print('%-18s %5s %12s %12s %12s' % ('variant', 'M', 'build [s]', 'first [ms]', 'step [ms]'))
+    for horizon_length in horizon_lengths:
+        for variant in variants:
+            tick = time.perf_counter()
+            ctrl, params = build(variant, horizon_length)
+            build_time = time.perf_counter() - tick
+
+            packer = OcpParams.ParamPacker(params)
+            packer.pack({'x_ref': np.array([10., 10., 0., 0., 0., 0.])})
+
+            durations = []
+            x = np.zeros((ctrl.NX,))
+            for _ in range(num_steps + 1):
+                tick = time.perf_counter()
+                ctrl.step(packer.pack({'x_cur': x}))
+                durations.append(time.perf_counter() - tick)
+
+                # follow the predicted trajectory, shifted into the initial guess
+                x = ctrl.w0[:ctrl.NX].ravel()
+
+            print('%-18s %5d %12.3f %12.2f %12.2f' %
+                  (variant, horizon_length, build_time, durations[0] * 1e3,
+                   np.median(durations[1:]) * 1e3))
+
+
+if __name__ == '__main__':
+    run()
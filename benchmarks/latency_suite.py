@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""Latency and memory benchmark suite of the controllers (Lqr, Nmpc, RtiNmpc) on the 2D rocket
+and on synthetic linear and nonlinear chains (see ocp_modules.models.Chain) of configurable
+size. RtiNmpc is run with each of its Hessian modes (rti: exact, rti_gn: Gauss-Newton,
+rti_constant: constant). Each case runs in a fresh process, such that the memory of one case does not affect
+the next one, and measures:
+
+* construction_ms: Time to build the controller, including the OCP
+* first_solve_ms: Time of the first control step (cold start)
+* step_p50_us, step_p95_us, step_p99_us, step_max_us: Latency percentiles of the following
+  steps in closed loop with a moving reference, measured with perf_counter_ns
+* step_peak_bytes: Peak Python allocation (tracemalloc) of a steady-state step
+* rss_peak_mb, rss_increase_mb: Peak resident memory (ru_maxrss) of the process at the end
+  of the case and its increase by the case
+
+The results are written as JSON together with the versions and the machine they were
+measured on. The compare mode flags metrics that got worse than a baseline by more than a
+relative tolerance (and an absolute noise floor) and exits with status 1 if any did.
+
+Run via:
+
+    python3 -m benchmarks.latency_suite run --output baseline.json
+    python3 -m benchmarks.latency_suite run --output results.json --compare baseline.json
+    python3 -m benchmarks.latency_suite compare baseline.json results.json
+
+Chain sizes are given as NX:NU:M, e.g. --chains 8:2:20 32:4:40. --filter selects cases by a
+substring of their name.
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import numpy as np
+import casadi as ca
+
+from ocp_modules.controllers.Lqr import Lqr
+from ocp_modules.controllers.Nmpc import Nmpc
+from ocp_modules.controllers.RtiNmpc import RtiNmpc
+from ocp_modules.modules import DirectMultipleShootingConstraints, InitialValueConstraints
+from ocp_modules.modules import OcpParams, OcpVars, TrackingCosts
+from ocp_modules.models.Chain import Chain
+from ocp_modules.models.Rocket import Rocket
+
+sampling_time = 1e-1
+default_chains = ('8:2:20', '24:4:40')
+
+# compared metrics with their absolute noise floor, differences below are never regressions
+compared_metrics = {'construction_ms': 5., 'first_solve_ms': 1., 'step_p50_us': 5.,
+                    'step_p95_us': 10., 'step_p99_us': 20., 'step_peak_bytes': 1024.}
+
+
+def make_model(name, NX=None, NU=None):
+    """Returns the model, its state and control weights, control bounds and a function of the
+    time returning the reference state."""
+
+    if name == 'rocket':
+        model = Rocket()
+        return (model, np.array([1., 1., 0., 0., 0., 0.1]) * 1e-2, np.array([0.01, 1.]) * 1e-4,
+                np.array([[0, -2e1], [2e3, 2e1]]),
+                lambda t: np.array([5. * np.sin(0.3 * t), 5. * (1. - np.cos(0.3 * t)),
+                                    0., 0., 0., 0.]))
+
+    model = Chain(NX, NU, nonlinear=name == 'nonlinear_chain')
+    numMasses = NX // 2
+    return (model, np.hstack([np.ones(numMasses), 0.1 * np.ones(numMasses)]), 1e-2 * np.ones(NU),
+            np.array([[-10.] * NU, [10.] * NU]),
+            lambda t: np.hstack([0.5 * np.sin(0.5 * t) * np.ones(numMasses), np.zeros(numMasses)]))
+
+
+def build_controller(controller, model, state_weight, control_weight, control_limits, M,
+                     hessian='exact'):
+    NX = model.NUMSTATES()
+    NU = model.NUMCONTROLS()
+    model_discrete = model.createTimeDiscreteFun(model.ode, sampling_time, NX, NU)
+
+    if controller == 'lqr':
+        x = ca.SX.sym('x', NX)
+        u = ca.SX.sym('u', NU)
+        x_next = model_discrete(x, u)
+        linearization = ca.Function('linearization', [x, u], [ca.jacobian(x_next, x),
+                                                               ca.jacobian(x_next, u)])
+        A, B = [np.array(J) for J in linearization(np.zeros(NX), np.zeros(NU))]
+        return Lqr(A, B, np.diag(state_weight), np.diag(control_weight), method='schur'), None
+
+    var, lbw, ubw = OcpVars.gen(NX, NU, M, None, control_limits)
+    params = OcpParams.gen(NX, NU, M)
+    costs = TrackingCosts.gen(var['x'][:], params['x_ref'][:], state_weight)
+    costs += TrackingCosts.gen(var['u'][:], params['u_ref'][:], control_weight)
+    constr = InitialValueConstraints.gen(var, params)
+    constr += DirectMultipleShootingConstraints.gen(var, model_discrete, M)
+
+    if controller == 'nmpc':
+        solver_opts = {'ipopt': dict(Nmpc.defaultSolverOptions['ipopt'], print_level=0),
+                       'print_time': 0}
+        return Nmpc(var, lbw, ubw, params, costs, constr, NX, NU, M, solvOpts=solver_opts,
+                    recordOpts={'policy': 'off'}), params
+
+    solver_opts = {'printLevel': 'none', 'sparse': True, 'enableEqualities': True}
+    return RtiNmpc(var, lbw, ubw, params, costs, constr, NX, NU, M, np.zeros(var.size),
+                   state_weight, control_weight, solvOpts=solver_opts,
+                   recordOpts={'policy': 'off'}, hessian=hessian), params
+
+
+def run_case(case, num_steps):
+    """Runs a single case and returns its metrics. Called in a fresh process."""
+
+    rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    model, state_weight, control_weight, control_limits, reference = make_model(
+        case['model'], case.get('NX'), case.get('NU'))
+    NX = model.NUMSTATES()
+    NU = model.NUMCONTROLS()
+    M = case['M']
+
+    tick = time.perf_counter_ns()
+    ctrl, params = build_controller(case['controller'], model, state_weight, control_weight,
+                                    control_limits, M, case.get('hessian', 'exact'))
+    construction = time.perf_counter_ns() - tick
+
+    plant = model.createTimeDiscreteFun(model.ode, sampling_time, NX, NU)
+    state_refs = np.stack([reference(sampling_time * i) for i in range(num_steps + M + 2)],
+                          axis=1)
+    control_refs = np.zeros((NU, num_steps + M + 1))
+
+    if params is None:
+        def step(x, i):
+            return ctrl.step(x, state_refs[:, i:i + 1], control_refs[:, i:i + 1])[0]
+    else:
+        packer = OcpParams.ParamPacker(params)
+
+        def step(x, i):
+            return ctrl.step(packer.pack({'x_cur': x, 'x_ref': state_refs[:, i:i + M + 1],
+                                          'u_ref': control_refs[:, i:i + M]}))[:, 0]
+
+    x = np.zeros((NX,))
+    durations = np.empty((num_steps + 1,), dtype=np.int64)
+    for i in range(num_steps + 1):
+        tick = time.perf_counter_ns()
+        u = step(x, i)
+        durations[i] = time.perf_counter_ns() - tick
+        x = np.array(plant(x, u)).ravel()
+
+    # allocations of a steady-state step, measured separately as tracemalloc slows it down
+    tracemalloc.start()
+    step(x, num_steps)
+    start, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    step(x, num_steps)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss_unit = 1 if sys.platform == 'darwin' else 1024
+    rss_end = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    steady = durations[1:] * 1e-3
+
+    return {'construction_ms': construction * 1e-6,
+            'first_solve_ms': durations[0] * 1e-6,
+            'step_p50_us': float(np.percentile(steady, 50)),
+            'step_p95_us': float(np.percentile(steady, 95)),
+            'step_p99_us': float(np.percentile(steady, 99)),
+            'step_max_us': float(steady.max()),
+            'num_steps': num_steps,
+            'step_peak_bytes': peak - start,
+            'rss_peak_mb': rss_end * rss_unit / 2**20,
+            'rss_increase_mb': (rss_end - rss_start) * rss_unit / 2**20}
+
+
+def make_cases(chains):
+    cases = {'nmpc/rocket/M20': {'controller': 'nmpc', 'model': 'rocket', 'M': 20}}
+    # names of the RtiNmpc cases per hessian mode
+    rti_names = {'exact': 'rti', 'gauss_newton': 'rti_gn', 'constant': 'rti_constant'}
+    for chain in chains:
+        NX, NU, M = [int(n) for n in chain.split(':')]
+        for model in ('linear_chain', 'nonlinear_chain'):
+            for controller in ('lqr', 'nmpc', 'rti'):
+                if controller == 'lqr' and model == 'nonlinear_chain':
+                    continue
+                for hessian in RtiNmpc.hessianModes if controller == 'rti' else ('exact',):
+                    name = '%s/%s/NX%d_NU%d_M%d' % (rti_names[hessian] if controller == 'rti'
+                                                    else controller, model, NX, NU, M)
+                    cases[name] = {'controller': controller, 'model': model, 'NX': NX,
+                                   'NU': NU, 'M': M, 'hessian': hessian}
+    return cases
+
+
+def run(chains=default_chains, num_steps=500, name_filter=''):
+    results = {'meta': {'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                        'python': platform.python_version(), 'numpy': np.__version__,
+                        'casadi': ca.__version__, 'machine': platform.machine(),
+                        'processor': platform.processor(), 'node': platform.node(),
+                        'num_steps': num_steps},
+               'cases': {}}
+
+    print('%-36s %10s %10s %10s %10s %10s %10s %10s' % (
+        'case', 'build [ms]', 'first [ms]', 'p50 [us]', 'p95 [us]', 'p99 [us]', 'max [us]',
+        'rss [MB]'))
+    context = multiprocessing.get_context('spawn')
+    for name, case in make_cases(chains).items():
+        if name_filter not in name:
+            continue
+        with ProcessPoolExecutor(1, mp_context=context) as pool:
+            try:
+                metrics = pool.submit(run_case, case, num_steps).result()
+            except Exception as e:
+                # e.g. a solver failing on a case, the remaining cases are still run
+                results['cases'][name] = dict(case, error=str(e))
+                print('%-36s failed: %s' % (name, str(e).splitlines()[0]))
+                continue
+        results['cases'][name] = dict(case, **metrics)
+        print('%-36s %10.1f %10.1f %10.1f %10.1f %10.1f %10.1f %10.1f' % (
+            name, metrics['construction_ms'], metrics['first_solve_ms'], metrics['step_p50_us'],
+            metrics['step_p95_us'], metrics['step_p99_us'], metrics['step_max_us'],
+            metrics['rss_increase_mb']))
+
+    return results
+
+
+def compare(baseline, results, tolerance=0.2):
+    """Prints the relative change of the compared metrics per case and returns the list of
+    regressions as (case, metric, baseline, current) tuples."""
+
+    regressions = []
+    print('%-36s %-16s %12s %12s %8s' % ('case', 'metric', 'baseline', 'current', 'change'))
+    for name, current in results['cases'].items():
+        reference = baseline['cases'].get(name)
+        if reference is None:
+            print('%-36s not in baseline' % name)
+            continue
+        if 'error' in current or 'error' in reference:
+            print('%-36s failed in %s' % (name, 'results' if 'error' in current else 'baseline'))
+            if 'error' in current and 'error' not in reference:
+                regressions.append((name, 'error', None, None))
+            continue
+        for metric, noise_floor in compared_metrics.items():
+            old, new = reference[metric], current[metric]
+            regression = new > old * (1. + tolerance) and new - old > noise_floor
+            change = (new - old) / old if old else float('inf') if new else 0.
+            print('%-36s %-16s %12.1f %12.1f %+7.0f%%%s' % (name, metric, old, new,
+                                                            change * 100.,
+                                                            '  REGRESSION' if regression else ''))
+            if regression:
+                regressions.append((name, metric, old, new))
+
+    for name in baseline['cases']:
+        if name not in results['cases']:
+            print('%-36s missing in results' % name)
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Run the benchmarks')
+    run_parser.add_argument('--output', help='JSON file the results are written to')
+    run_parser.add_argument('--compare', help='JSON file of a baseline to compare with')
+    run_parser.add_argument('--chains', nargs='+', default=default_chains,
+                            help='Chain sizes as NX:NU:M')
+    run_parser.add_argument('--steps', type=int, default=500,
+                            help='Number of steady-state steps per case')
+    run_parser.add_argument('--filter', default='', help='Only run cases containing this')
+    run_parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Relative tolerance of the comparison')
+
+    compare_parser = commands.add_parser('compare', help='Compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('results')
+    compare_parser.add_argument('--tolerance', type=float, default=0.2,
+                                help='Relative tolerance of the comparison')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        results = run(args.chains, args.steps, args.filter)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+        baseline_file = args.compare
+    else:
+        with open(args.results) as f:
+            results = json.load(f)
+        baseline_file = args.baseline
+
+    if baseline_file:
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+        print()
+        regressions = compare(baseline, results, args.tolerance)
+        if regressions:
+            print('\n%d regression(s) beyond %.0f%%' % (len(regressions), args.tolerance * 100))
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
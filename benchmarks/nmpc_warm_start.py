@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Compares the warm start strategies of Nmpc in a closed loop simulation of the 2D rocket,
+in terms of IPOPT iterations and computation time per control step. 'shift (primal)' is the
+shifted primal guess with IPOPT ignoring the multipliers, i.e. a primal-only warm start.
+'shift (mu_init)' additionally starts IPOPT with a small barrier parameter, which is only
+sensible if the guess is close to the solution.
+
+Run via:
+
+    python3 -m benchmarks.nmpc_warm_start
+"""
+
+import time
+import numpy as np
+
+from ocp_modules.controllers.Nmpc import Nmpc
+from ocp_modules.modules import DirectMultipleShootingConstraints, InitialValueConstraints
+from ocp_modules.modules import OcpParams, OcpVars, TrackingCosts
+from ocp_modules.models.Rocket import Rocket
+
+sampling_time = 1e-1
+horizon_length = 20
+state_weight = np.array([1., 1., 0., 0., 0., 0.1]) * 1e-2
+control_weight = np.array([0.01, 1.0]) * 1e-4
+control_limits = np.array([[0, -2e1], [2e3, 2e1]])
+
+variants = {
+    'shift': ('shift', {}),
+    'shift (primal)': ('shift', {'warm_start_init_point': 'no'}),
+    'shift (mu_init)': ('shift', {'mu_init': 1e-6}),
+    'reuse': ('reuse', {}),
+    'none': ('none', {}),
+}
+
+
+def build(warm_start, ipopt_opts):
+    model = Rocket()
+    num_states = model.NUMSTATES()
+    num_controls = model.NUMCONTROLS()
+    model_discrete = model.createTimeDiscreteFun(model.ode, sampling_time, num_states,
+                                                 num_controls)
+
+    var, lbw, ubw = OcpVars.gen(num_states, num_controls, horizon_length, None, control_limits)
+    params = OcpParams.gen(num_states, num_controls, horizon_length)
+
+    costs = TrackingCosts.gen(var['x'][:], params['x_ref'][:], state_weight)
+    costs += TrackingCosts.gen(var['u'][:], params['u_ref'][:], control_weight)
+
+    constr = InitialValueConstraints.gen(var, params)
+    constr += DirectMultipleShootingConstraints.gen(var, model_discrete, horizon_length)
+
+    solver_opts = {'ipopt': dict(Nmpc.defaultSolverOptions['ipopt'], print_level=0,
+                                 **ipopt_opts), 'print_time': 0}
+    ctrl = Nmpc(var, lbw, ubw, params, costs, constr, num_states, num_controls, horizon_length,
+                solvOpts=solver_opts, warmStart=warm_start)
+    return ctrl, params, model_discrete
+
+
+def run(num_steps=60):
+    print('%-16s %14s %14s %14s' % ('strategy', 'iterations', 'step [ms]', 'total [s]'))
+    for variant, (warm_start, ipopt_opts) in variants.items():
+        ctrl, params, model_discrete = build(warm_start, ipopt_opts)
+        packer = OcpParams.ParamPacker(params)
+        packer.pack({'x_ref': np.array([10., 10., 0., 0., 0., 0.])})
+
+        durations = []
+        x = np.zeros((ctrl.NX,))
+        for _ in range(num_steps):
+            tick = time.perf_counter()
+            u = ctrl.step(packer.pack({'x_cur': x}))
+            durations.append(time.perf_counter() - tick)
+            x = np.array(model_discrete(x, u[:, 0])).ravel()
+
+        iterations = ctrl.get_metadata().iterations.values
+        print('%-16s %14.1f %14.2f %14.3f' % (variant, iterations[1:].mean(),
+                                             np.median(durations[1:]) * 1e3, np.sum(durations)))
+
+
+if __name__ == '__main__':
+    run()
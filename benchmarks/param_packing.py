@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""Compares the per-step cost of packing OCP parameters with OcpParams.fill and with a
+precompiled OcpParams.ParamPacker.
+
+Run via:
+
+    python3 -m benchmarks.param_packing
+"""
+
+import timeit
+import numpy as np
+
+from ocp_modules.modules import OcpParams
+
+
+def run(num_states=6, num_controls=2, horizon_length=20, number=2000):
+    params = OcpParams.gen(num_states, num_controls, horizon_length)
+    packer = OcpParams.ParamPacker(params)
+
+    value_map = {'x_cur': np.random.rand(num_states),
+                 'x_ref': np.random.rand(num_states, horizon_length + 1),
+                 'u_ref': np.random.rand(num_controls, horizon_length)}
+    state_map = {'x_cur': value_map['x_cur']}
+    packer.pack(value_map)
+
+    cases = [('OcpParams.fill (full)', lambda: OcpParams.fill(params, value_map)),
+             ('ParamPacker.pack (full)', lambda: packer.pack(value_map)),
+             ('ParamPacker.pack (x_cur only)', lambda: packer.pack(state_map))]
+
+    print('NX=%d, NU=%d, M=%d, %d repetitions' %
+          (num_states, num_controls, horizon_length, number))
+    for name, fun in cases:
+        duration = min(timeit.repeat(fun, number=number, repeat=3)) / number
+        print('%-32s %10.2f us/step' % (name, duration * 1e6))
+
+
+if __name__ == '__main__':
+    run()
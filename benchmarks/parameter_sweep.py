@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Measures the throughput of ParameterSweep (closed loop scenarios of the 2D rocket with Nmpc
+per second) for an increasing number of worker processes, up to the number of processors.
+The scenarios vary the mass of the plant and two state weights, i.e. each worker builds at
+most two controllers. Scaling is close to linear as long as the workers are not limited by
+memory bandwidth or by BLAS threads competing for cores, so set OMP_NUM_THREADS=1 on machines
+with many cores.
+
+Run via:
+
+    OMP_NUM_THREADS=1 python3 -m benchmarks.parameter_sweep
+"""
+
+import os
+import time
+import numpy as np
+
+from ocp_modules.controllers.Nmpc import Nmpc
+from ocp_modules.modules import DirectMultipleShootingConstraints, InitialValueConstraints
+from ocp_modules.modules import OcpParams, OcpVars, TrackingCosts
+from ocp_modules.utils.parameter_sweep import ParameterSweep, gridScenarios
+from ocp_modules.models.Rocket import Rocket
+
+sampling_time = 1e-1
+horizon_length = 20
+num_steps = 40
+control_weight = np.array([0.01, 1.0]) * 1e-4
+control_limits = np.array([[0, -2e1], [2e3, 2e1]])
+
+
+def build_model(config):
+    return Rocket({'mass': config['mass']})
+
+
+def build_controller(config):
+    model = Rocket()
+    num_states = model.NUMSTATES()
+    num_controls = model.NUMCONTROLS()
+    model_discrete = model.createTimeDiscreteFun(model.ode, sampling_time, num_states,
+                                                 num_controls)
+
+    var, lbw, ubw = OcpVars.gen(num_states, num_controls, horizon_length, None, control_limits)
+    params = OcpParams.gen(num_states, num_controls, horizon_length)
+    costs = TrackingCosts.gen(var['x'][:], params['x_ref'][:],
+                              config['state_weight'] * np.array([1., 1., 0., 0., 0., 0.1]))
+    costs += TrackingCosts.gen(var['u'][:], params['u_ref'][:], control_weight)
+    constr = InitialValueConstraints.gen(var, params)
+    constr += DirectMultipleShootingConstraints.gen(var, model_discrete, horizon_length)
+
+    solver_opts = {'ipopt': dict(Nmpc.defaultSolverOptions['ipopt'], print_level=0),
+                   'print_time': 0}
+    return Nmpc(var, lbw, ubw, params, costs, constr, num_states, num_controls, horizon_length,
+                solvOpts=solver_opts)
+
+
+def run(scenarios_per_worker=8):
+    x0 = np.zeros((6,))
+    state_ref = np.zeros((6, num_steps + horizon_length + 1))
+    state_ref[:2] = 10.
+    control_ref = np.zeros((2, num_steps + horizon_length))
+
+    workers = [1]
+    while workers[-1] * 2 <= os.cpu_count():
+        workers.append(workers[-1] * 2)
+    if workers[-1] != os.cpu_count():
+        workers.append(os.cpu_count())
+
+    print('%8s %10s %10s %16s %10s' % ('workers', 'scenarios', 'total [s]', 'scenarios / s',
+                                       'speedup'))
+    base = None
+    for num_workers in workers:
+        num_scenarios = scenarios_per_worker * num_workers
+        scenarios = gridScenarios({'state_weight': [1e-2, 2e-2],
+                                   'mass': np.linspace(0.8, 1.2, num_scenarios // 2)})
+        sweep = ParameterSweep(build_controller, build_model, sampling_time, horizon_length,
+                               num_steps, controllerKeys=('state_weight',),
+                               maxWorkers=num_workers)
+
+        tick = time.perf_counter()
+        results = sweep.run(scenarios, x0, state_ref, control_ref)
+        total = time.perf_counter() - tick
+        assert np.all(results.errors.values == '')
+
+        throughput = len(scenarios) / total
+        base = base or throughput
+        print('%8d %10d %10.2f %16.2f %10.2f' % (num_workers, len(scenarios), total, throughput,
+                                                 throughput / base))
+
+
+if __name__ == '__main__':
+    run()
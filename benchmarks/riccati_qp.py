@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""Measures the step latency of RtiNmpc with the Riccati QP solver against qpOASES on the fully
+condensed QP, for long horizons on the nonlinear chain model (ocp_modules.models.Chain) with 8
+states and 2 controls (see benchmarks.condensing). Reports the median of the preparation phase,
+the feedback phase and the whole step over a closed-loop run. Cases whose QP solver fails are
+reported as such.
+
+Run via:
+
+    python3 -m benchmarks.riccati_qp
+"""
+
+from benchmarks.condensing import measure
+
+horizon_lengths = (20, 50, 100, 200, 400)
+# (QP solver, condensing)
+cases = (('qpoases', 'full'), ('riccati', 'none'))
+
+
+def run(num_steps=20):
+    print('%5s %-8s %-10s %16s %16s %12s' % ('M', 'qpsol', 'condensing', 'preparation [us]',
+                                             'feedback [us]', 'step [us]'))
+    for M in horizon_lengths:
+        for qpsol, condensing in cases:
+            try:
+                (preparation, feedback), step = measure(M, condensing, num_steps, qpsol)
+            except RuntimeError:
+                print('%5d %-8s %-10s %s' % (M, qpsol, condensing, 'QP solver failed'))
+                continue
+            print('%5d %-8s %-10s %16.1f %16.1f %12.1f' % (M, qpsol, condensing, preparation,
+                                                            feedback, step))
+
+
+if __name__ == '__main__':
+    run()
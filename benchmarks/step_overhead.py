@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Measures the per-step overhead of Nmpc and RtiNmpc on a tiny OCP (double integrator,
+horizon length 3), where the solver itself takes little time. Compares the controllers'
+step, which evaluates the solver on preallocated buffers and returns a view of the controls
+(copy=False), with calling the same casadi Functions the conventional way (keyword arguments,
+DM bounds, conversion of the results).
+Memory is measured with tracemalloc: 'peak' is the largest transient allocation during a step,
+'retained' the memory that is still allocated after 100 steps.
+
+Run via:
+
+    python3 -m benchmarks.step_overhead
+"""
+
+import time
+import tracemalloc
+import numpy as np
+import casadi as ca
+
+from ocp_modules.controllers.Nmpc import Nmpc
+from ocp_modules.controllers.RtiNmpc import RtiNmpc
+from ocp_modules.modules import DirectMultipleShootingConstraints, InitialValueConstraints
+from ocp_modules.modules import OcpParams, OcpVars, TrackingCosts
+
+num_states = 2
+num_controls = 1
+horizon_length = 3
+state_weight = np.array([1., 0.1])
+control_weight = np.array([0.01])
+
+
+def build(controller_class):
+    x = ca.SX.sym('x', num_states)
+    u = ca.SX.sym('u', num_controls)
+    model = ca.Function('F', [x, u], [ca.vertcat(x[0] + 0.1 * x[1], x[1] + 0.1 * u)])
+
+    var, lbw, ubw = OcpVars.gen(num_states, num_controls, horizon_length, None,
+                                np.array([[-1.], [1.]]))
+    params = OcpParams.gen(num_states, num_controls, horizon_length)
+    costs = TrackingCosts.gen(var['x'][:], params['x_ref'][:], state_weight)
+    costs += TrackingCosts.gen(var['u'][:], params['u_ref'][:], control_weight)
+    constr = InitialValueConstraints.gen(var, params)
+    constr += DirectMultipleShootingConstraints.gen(var, model, horizon_length)
+
+    if controller_class is Nmpc:
+        solver_opts = {'ipopt': dict(Nmpc.defaultSolverOptions['ipopt'], print_level=0),
+                       'print_time': 0}
+        ctrl = Nmpc(var, lbw, ubw, params, costs, constr, num_states, num_controls,
+                    horizon_length, solvOpts=solver_opts, recordOpts={'policy': 'off'},
+                    warmStart='reuse')
+    else:
+        solver_opts = {'printLevel': 'none', 'sparse': True, 'enableEqualities': True}
+        ctrl = RtiNmpc(var, lbw, ubw, params, costs, constr, num_states, num_controls,
+                       horizon_length, np.zeros(var.size), state_weight, control_weight,
+                       solvOpts=solver_opts, recordOpts={'policy': 'off'})
+
+    packer = OcpParams.ParamPacker(params)
+    parameters = packer.pack({'x_cur': np.array([0.5, 0.]), 'x_ref': np.zeros((num_states,)),
+                              'u_ref': np.zeros((num_controls,))}).copy()
+    return ctrl, lbw, ubw, parameters
+
+
+def conventional_call(controller_class):
+    """Returns a function that evaluates the solver of a controller like a step, including
+    the warm start by the last solution, but with keyword arguments and conversion of the
+    results."""
+
+    ctrl, lbw, ubw, parameters = build(controller_class)
+    w0 = ctrl.w0.copy()
+    lam_x = np.zeros_like(ctrl.lagrMulOptVars)
+    lam_g = np.zeros_like(ctrl.lagrMulConstr)
+
+    if controller_class is Nmpc:
+        def call():
+            res = ctrl.solver(x0=w0, lbx=lbw, ubx=ubw, lbg=ctrl.lbg, ubg=ctrl.ubg,
+                              p=parameters, lam_x0=lam_x, lam_g0=lam_g)
+            w0[:] = np.array(res['x']).ravel()
+            lam_x[:] = np.array(res['lam_x']).ravel()
+            lam_g[:] = np.array(res['lam_g']).ravel()
+            return w0
+    else:
+        def call():
+            data = ctrl.qpDataFun(w=w0, p=parameters, lam_g=lam_g)
+            g0 = np.array(data['g0']).ravel()
+            res = ctrl.solver(h=data['h'], g=data['g'], a=data['a'], lba=ctrl.lbg - g0,
+                              uba=ctrl.ubg - g0, lbx=lbw, ubx=ubw, x0=w0, lam_x0=lam_x,
+                              lam_a0=lam_g)
+            w0[:] = np.array(res['x']).ravel()
+            lam_x[:] = np.array(res['lam_x']).ravel()
+            lam_g[:] = np.array(res['lam_a']).ravel()
+            return w0
+
+    return call
+
+
+def buffered_step(controller_class):
+    ctrl, _, _, parameters = build(controller_class)
+    return lambda: ctrl.step(parameters, copy=False)
+
+
+def measure(fun, num_steps):
+    for _ in range(10):
+        fun()
+
+    durations = np.empty((num_steps,), dtype=np.int64)
+    for i in range(num_steps):
+        tick = time.perf_counter_ns()
+        fun()
+        durations[i] = time.perf_counter_ns() - tick
+
+    tracemalloc.start()
+    fun()
+    start, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    for _ in range(100):
+        fun()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return np.median(durations) * 1e-3, peak - start, current - start
+
+
+def run(num_steps=2000):
+    print('%-10s %-14s %12s %12s %14s' % ('controller', 'call', 'median [us]', 'peak [B]',
+                                          'retained [B]'))
+    for controller_class in (Nmpc, RtiNmpc):
+        for call, make in (('conventional', conventional_call), ('step', buffered_step)):
+            median, peak, retained = measure(make(controller_class), num_steps)
+            print('%-10s %-14s %12.1f %12d %14d' % (controller_class.__name__, call, median,
+                                                    peak, retained))
+
+
+if __name__ == '__main__':
+    run()
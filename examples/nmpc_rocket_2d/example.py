@@ -1,13 +1,14 @@
 #!/usr/bin/env python3
 
 from ocp_modules.utils.mse import mse
+from ocp_modules.utils.closed_loop_simulator import ClosedLoopSimulator
 from ocp_modules.controllers.Nmpc import Nmpc
 from ocp_modules.modules import TrackingCosts
 from ocp_modules.modules import DirectMultipleShootingConstraints, InitialValueConstraints
 from ocp_modules.modules import OcpParams
 from ocp_modules.modules import OcpVars
 #from plot_rocket import plotRocket
-from Rocket import Rocket as Model
+from ocp_modules.models.Rocket import Rocket as Model
 import numpy as np
 import matplotlib
 matplotlib.use('TkAgg')
@@ -29,10 +30,6 @@ dynamic_model_discrete = dynamic_model.createTimeDiscreteFun(dynamic_model.ode,
                                                              num_states,
                                                              num_controls)
 
-# expand weight parameters to full matrices
-state_weight_matrix = np.kron(np.eye(horizon_length+1), np.diag(np.asarray(state_weight)))
-control_weight_matrix = np.kron(np.eye(horizon_length), np.diag(np.asarray(control_weight)))
-
 x0 = dynamic_model.getNeutralState()
 u0 = np.zeros((4,))
 w0 = np.hstack([np.tile(x0, [horizon_length + 1, ]), np.tile(u0, [horizon_length, ])])
@@ -42,9 +39,10 @@ var, lbw, ubw = OcpVars.gen(
     num_states, num_controls, horizon_length, None, control_limits)
 params = OcpParams.gen(num_states, num_controls, horizon_length)
 
-costs = TrackingCosts.gen(var['x'][:], params['x_ref'][:], state_weight_matrix)
+# weights are applied to every node of the prediction horizon
+costs = TrackingCosts.gen(var['x'][:], params['x_ref'][:], state_weight)
 costs += TrackingCosts.gen(var['u'][:], params['u_ref']
-                           [:], control_weight_matrix)
+                           [:], control_weight)
 
 constr = InitialValueConstraints.gen(var, params)
 constr += DirectMultipleShootingConstraints.gen(var,
@@ -65,46 +63,29 @@ state_ref[:2, :] = np.ones((2, Nsim+horizon_length+1)) * 100
 
 
 # simulate
-def simulation_function(x, u): return np.array(dynamic_model.createTimeDiscreteFun(
-    dynamic_model.ode, sampling_time, num_states, num_controls)(x, u)).ravel()
-
-
-def control_function(xCurLoc, xRefLoc, uRefLoc):
-    param_value_map = {'x_cur': xCurLoc, 'x_ref': xRefLoc, 'u_ref': uRefLoc}
-    ocp_param_values = OcpParams.fill(params, param_value_map)
-    return ctrl.step(ocp_param_values)[:, 0]
-
-
-wSim = np.zeros((num_states + num_controls, Nsim+1))
-wSim[:num_states, 0] = x0
-
-for i in range(Nsim):
-    wSim[num_states:, i] = control_function(
-        wSim[:num_states, i], state_ref[:, i], control_ref[:, i])
-
-    wSim[:num_states, i +
-         1] = simulation_function(wSim[:num_states, i], wSim[num_states:, i])
+simulator = ClosedLoopSimulator(dynamic_model, ctrl, sampling_time, horizon_length, Nsim)
+xSim, uSim, durations = simulator.run(x0, state_ref, control_ref)
 
 
 # Compute MSE for position
-mseNlp = mse(wSim[:2, :], state_ref[:2, :-horizon_length])
+mseNlp = mse(xSim[:2, :], state_ref[:2, :-horizon_length])
 print('NLP position MSE: %f' % mseNlp)
 
 # plotting
 t = np.arange(0, Nsim+1) * sampling_time
-#plotRocket(wSim, state_ref, rocketColor='blue')
+#plotRocket(xSim, state_ref, rocketColor='blue')
 # plt.figure()
-#plt.plot(wSim[0,:], wSim[1,:])
+#plt.plot(xSim[0,:], xSim[1,:])
 # plt.show()
 
 
 plt.figure()
 plt.subplot(4, 1, 1)
-plt.plot(t, wSim[0:2, :].T)
+plt.plot(t, xSim[0:2, :].T)
 plt.subplot(4, 1, 2)
-plt.plot(t, wSim[2:4, :].T)
+plt.plot(t, xSim[2:4, :].T)
 plt.subplot(4, 1, 3)
-plt.plot(t, wSim[3, :].T)
+plt.plot(t, xSim[3, :].T)
 plt.subplot(4, 1, 4)
-plt.plot(t, wSim[4, :].T)
+plt.plot(t, xSim[4, :].T)
 plt.show()
@@ -0,0 +1,301 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import scipy.spatial
+
+from ocp_modules.controllers.ControllerBase import ControllerBase
+from ocp_modules.modules import OcpParams
+from ocp_modules.utils.grid_interpolation import GridInterpolation
+from ocp_modules.utils.step_hooks import StepHook
+
+
+class _SolutionHook (StepHook):
+    """Keeps the solution and the success flag of the last step."""
+
+    def postSolve(self, controller, step, values):
+        self.solution = np.array(values['solution'])
+        self.success = bool(values['success'])
+
+
+# state of a sampling worker process, set up by _initSampler
+_sampler = {}
+
+
+def _initSampler(buildController, baseState, stateRef, controlRef, stateIndices,
+                 referenceIndices):
+    controller = buildController()
+    hook = _SolutionHook()
+    controller.addHook(hook)
+    _sampler.clear()
+    _sampler.update(controller=controller, hook=hook,
+                    packer=OcpParams.ParamPacker(controller.params), baseState=baseState,
+                    stateRef=stateRef, controlRef=controlRef, stateIndices=stateIndices,
+                    referenceIndices=referenceIndices)
+
+
+def _solveSamples(points):
+    """Solves the OCP at the given points of the sampling space in a worker. Returns the first
+    controls, the solutions and whether the solver succeeded."""
+
+    controller = _sampler['controller']
+    hook = _sampler['hook']
+    numStateIndices = len(_sampler['stateIndices'])
+    x = _sampler['baseState'].copy()
+    xRefs = _sampler['stateRef'].copy()
+
+    controls = np.full((len(points), controller.NU), np.nan)
+    solutions = np.full((len(points), controller.var.size), np.nan)
+    success = np.zeros((len(points),), dtype=bool)
+    for i, point in enumerate(points):
+        x[_sampler['stateIndices']] = point[:numStateIndices]
+        xRefs[_sampler['referenceIndices']] = point[numStateIndices:, None]
+
+        controller.reset()
+        try:
+            u = controller.step(_sampler['packer'].pack(
+                {'x_cur': x, 'x_ref': xRefs, 'u_ref': _sampler['controlRef']}))
+        except RuntimeError:
+            continue
+        controls[i] = u[:, 0]
+        solutions[i] = hook.solution
+        success[i] = hook.success
+
+    return controls, solutions, success
+
+
+class ExplicitNmpc (ControllerBase):
+    """Explicit approximation of an Nmpc: the control law is sampled offline and interpolated
+    online.
+
+    The law is a function of the sampling space, which consists of the state variables
+    <stateIndices> and optionally the variables <referenceIndices> of the reference state,
+    i.e. a setpoint that is constant over the horizon. All other states and references are
+    fixed to the values the law was sampled with. For every sample, the first control move and
+    the complete optimal solution w are stored.
+
+    The samples either form a rectilinear grid spanned by <axes> (see :meth:`fromGrid`), which
+    is interpolated multilinearly, or are scattered (see :meth:`fromSamples`) and indexed by a
+    KD-tree, in which case the <neighbors> nearest samples are interpolated by inverse distance
+    weighting.
+
+    The interpolation error is estimated as the largest deviation of the controls of the
+    interpolated samples from the interpolated control. If the query lies outside of the
+    sampled region (outside of the grid, or farther than <maxDistance> from the nearest
+    sample), if the error estimate exceeds <errorTolerance> or if an interpolated sample
+    failed to solve, the step falls back to <onlineController>, if given. Its solver is warm
+    started with the interpolated solution. Without an online controller, the interpolated
+    (for queries outside of the grid: clamped) law is returned anyway.
+
+    The tables are usually computed offline via :meth:`fromGrid` or :meth:`fromSamples` and can
+    be stored to and restored from a file via :meth:`save` and :meth:`load`.
+
+    :param points: <N>x<d> matrix of the sampled points
+    :param controls: <N>x<NU> matrix of the first control move of each sample
+    :param solutions: <N>x<size of w> matrix of the optimal solution of each sample
+    :param stateIndices: Indices of the state variables spanning the sampling space
+    :param referenceIndices: Indices of the reference state variables spanning the sampling
+    space
+    :param valid: Boolean vector marking the samples that were solved successfully. Defaults to
+    all samples.
+    :param axes: A sequence of d strictly increasing 1D arrays if the samples form a grid in
+    C-order, None for scattered samples
+    :param onlineController: Nmpc used as fallback
+    :param errorTolerance: Largest error estimate (maximum norm of the controls) that is
+    accepted without fallback
+    :param maxDistance: Largest distance to the nearest scattered sample that is accepted
+    without fallback
+    :param neighbors: Number of scattered samples that are interpolated, defaults to d + 1
+    """
+
+    def __init__(self, points, controls, solutions, stateIndices, referenceIndices=(),
+                 valid=None, axes=None, onlineController=None, errorTolerance=np.inf,
+                 maxDistance=np.inf, neighbors=None):
+        self.points = np.ascontiguousarray(points, dtype=float)
+        self.controls = np.array(controls, dtype=float)
+        self.solutions = np.array(solutions, dtype=float)
+        self.stateIndices = np.asarray(stateIndices, dtype=int)
+        self.referenceIndices = np.asarray(referenceIndices, dtype=int)
+        self.valid = np.ones((len(self.points),), dtype=bool) if valid is None else \
+            np.asarray(valid, dtype=bool)
+        self.onlineController = onlineController
+        self.errorTolerance = errorTolerance
+        self.maxDistance = maxDistance
+        self.NU = self.controls.shape[1]
+
+        dimension = self.stateIndices.size + self.referenceIndices.size
+        if self.points.shape != (len(self.controls), dimension) or \
+                len(self.solutions) != len(self.points) or len(self.valid) != len(self.points):
+            raise ValueError('Sample tables of %d points of dimension %d do not match'
+                             % (len(self.points), dimension))
+
+        # NaNs of failed samples would spread into every interpolation using them, which
+        # falls back to the online controller instead
+        self.controls[~self.valid] = 0.
+        self.solutions[~self.valid] = 0.
+
+        self._query = np.zeros((dimension,))
+        if axes is not None:
+            self.axes = [np.asarray(ax, dtype=float) for ax in axes]
+            if int(np.prod([ax.size for ax in self.axes])) != len(self.points):
+                raise ValueError('Grid of shape %s does not match %d samples'
+                                 % (str(tuple(ax.size for ax in self.axes)), len(self.points)))
+            self._interpolation = GridInterpolation(self.axes)
+            self._lower = np.array([ax[0] for ax in self.axes])
+            self._upper = np.array([ax[-1] for ax in self.axes])
+            self._tree = None
+        else:
+            self.axes = None
+            self._tree = scipy.spatial.cKDTree(self.points[self.valid])
+            self._treeIndices = np.flatnonzero(self.valid)
+            self.neighbors = min(dimension + 1 if neighbors is None else neighbors,
+                                 self._treeIndices.size)
+
+        if onlineController is not None:
+            self._packer = OcpParams.ParamPacker(onlineController.params)
+
+        self.numSteps = 0
+        self.numFallbacks = 0
+
+    @classmethod
+    def fromGrid(cls, buildController, axes, stateIndices, referenceIndices=(), baseState=None,
+                 stateRef=None, controlRef=None, maxWorkers=None, **kwargs):
+        """fromGrid Samples the control law of an Nmpc on a rectilinear grid.
+
+        :param buildController: Picklable function without arguments returning the Nmpc. It is
+        called once per worker process and once in the calling process, whose controller is
+        the online fallback.
+        :param axes: A sequence of d strictly increasing 1D arrays spanning the grid over the
+        sampling space
+        :param stateIndices: Indices of the state variables spanning the sampling space
+        :param referenceIndices: Indices of the reference state variables spanning the
+        sampling space
+        :param baseState: State the samples are based on, defaults to zeros
+        :param stateRef: <NX>x<M+1> reference states the samples are based on, defaults to zeros
+        :param controlRef: <NU>x<M> reference controls, defaults to zeros
+        :param maxWorkers: Number of worker processes, defaults to the number of processors
+        :param kwargs: Further arguments of the constructor, e.g. errorTolerance
+        :returns: An ExplicitNmpc object
+        """
+
+        points = np.array(np.meshgrid(*axes, indexing='ij')).reshape((len(axes), -1)).T
+        return cls._sample(buildController, points, stateIndices, referenceIndices, baseState,
+                           stateRef, controlRef, maxWorkers, axes=axes, **kwargs)
+
+    @classmethod
+    def fromSamples(cls, buildController, points, stateIndices, referenceIndices=(),
+                    baseState=None, stateRef=None, controlRef=None, maxWorkers=None, **kwargs):
+        """fromSamples Samples the control law of an Nmpc at scattered points, e.g. drawn
+        randomly from the region of interest. See :meth:`fromGrid` for the parameters.
+
+        :param points: <N>x<d> matrix of points in the sampling space
+        :returns: An ExplicitNmpc object
+        """
+
+        return cls._sample(buildController, np.asarray(points, dtype=float), stateIndices,
+                           referenceIndices, baseState, stateRef, controlRef, maxWorkers,
+                           **kwargs)
+
+    @classmethod
+    def _sample(cls, buildController, points, stateIndices, referenceIndices, baseState,
+                stateRef, controlRef, maxWorkers, **kwargs):
+        controller = buildController()
+        NX, NU, M = controller.NX, controller.NU, controller.M
+        baseState = np.zeros((NX,)) if baseState is None else np.asarray(baseState, dtype=float)
+        stateRef = np.zeros((NX, M + 1)) if stateRef is None else \
+            np.asarray(stateRef, dtype=float).reshape((NX, M + 1))
+        controlRef = np.zeros((NU, M)) if controlRef is None else \
+            np.asarray(controlRef, dtype=float).reshape((NU, M))
+
+        numWorkers = maxWorkers or os.cpu_count()
+        size = max(1, math.ceil(len(points) / (4 * numWorkers)))
+        chunks = [points[i:i + size] for i in range(0, len(points), size)]
+        with ProcessPoolExecutor(numWorkers, initializer=_initSampler,
+                                 initargs=(buildController, baseState, stateRef, controlRef,
+                                           list(stateIndices), list(referenceIndices))) as pool:
+            results = list(pool.map(_solveSamples, chunks))
+
+        controls, solutions, valid = [np.concatenate(r) for r in zip(*results)]
+        return cls(points, controls, solutions, stateIndices, referenceIndices, valid,
+                   onlineController=controller, **kwargs)
+
+    def _interpolate(self):
+        """Returns the sample indices and weights of the current query, and whether the query
+        lies outside of the sampled region."""
+
+        if self._tree is None:
+            outside = np.any(self._query < self._lower) or np.any(self._query > self._upper)
+            indices, weights = self._interpolation.weights(self._query[None])
+            return indices[0], weights[0], outside
+
+        distances, indices = self._tree.query(self._query, self.neighbors)
+        distances, indices = np.atleast_1d(distances), self._treeIndices[np.atleast_1d(indices)]
+        if distances[0] == 0.:
+            weights = (distances == 0.).astype(float)
+        else:
+            weights = 1. / distances
+        return indices, weights / weights.sum(), distances[0] > self.maxDistance
+
+    def step(self, x0, xRefs, uRefs):
+        """step Performs a control step taking the current state (x0) and a reference trajectory
+        (xRefs, uRefs) and returns the controls for the current time step. The law is
+        interpolated at the current state and the first reference state.
+
+        :param x0: Current state (estimate)
+        :param xRefs: <NX>x<M+1> matrix where colums are reference states
+        :param uRefs: <NU>x<M> matrix where colums are reference controls, only used by the
+        online fallback
+        :returns A 2-tuple (u, dict), where u are the resulting controls and dict a dictionary
+        with metadata: 'fallback' (whether the online controller was used) and
+        'error_estimate'
+        """
+
+        numStateIndices = self.stateIndices.size
+        np.take(x0, self.stateIndices, out=self._query[:numStateIndices])
+        self._query[numStateIndices:] = xRefs[self.referenceIndices, 0]
+
+        indices, weights, outside = self._interpolate()
+        u = weights @ self.controls[indices]
+        used = weights > 0.
+        if self.valid[indices[used]].all():
+            errorEstimate = np.max(np.abs(self.controls[indices[used]] - u))
+        else:
+            errorEstimate = np.inf
+
+        self.numSteps += 1
+        fallback = self.onlineController is not None and \
+            (outside or errorEstimate > self.errorTolerance)
+        if fallback:
+            self.numFallbacks += 1
+            online = self.onlineController
+            np.copyto(online.w0, weights @ self.solutions[indices])
+            online.lagrMulOptVars.fill(0.)
+            online.lagrMulConstr.fill(0.)
+            u = online.step(self._packer.pack({'x_cur': x0, 'x_ref': xRefs,
+                                               'u_ref': uRefs}))[:, 0]
+
+        return u, {'f': None, 'fallback': fallback, 'error_estimate': errorEstimate}
+
+    def save(self, filename):
+        """save Stores the sampled law in a .npz file. The online controller is not stored.
+
+        :param filename: Path of the file
+        """
+        axes = {} if self.axes is None else {'axis_%d' % i: ax for i, ax in enumerate(self.axes)}
+        np.savez(filename, points=self.points, controls=self.controls,
+                 solutions=self.solutions, valid=self.valid, stateIndices=self.stateIndices,
+                 referenceIndices=self.referenceIndices, **axes)
+
+    @classmethod
+    def load(cls, filename, **kwargs):
+        """load Restores a law stored via :meth:`save`.
+
+        :param filename: Path of the file
+        :param kwargs: Further arguments of the constructor, e.g. onlineController
+        :returns: An ExplicitNmpc object
+        """
+        with np.load(filename) as data:
+            dimension = data['stateIndices'].size + data['referenceIndices'].size
+            axes = [data['axis_%d' % i] for i in range(dimension)] if 'axis_0' in data else None
+            return cls(data['points'], data['controls'], data['solutions'], data['stateIndices'],
+                       data['referenceIndices'], data['valid'], axes, **kwargs)
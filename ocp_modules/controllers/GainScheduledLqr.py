@@ -0,0 +1,138 @@
+import numpy as np
+
+from ocp_modules.controllers.ControllerBase import ControllerBase
+from ocp_modules.controllers.Lqr import Lqr
+from ocp_modules.utils.grid_interpolation import GridInterpolation
+
+
+class GainScheduledLqr (ControllerBase):
+    """Gain-scheduled Linear Quadratic Regulator
+
+    Nonlinear systems can be controlled by a family of LQRs, each of which is computed for a
+    linearization of the system around an operating point. This controller stores the gain
+    matrices for a rectilinear grid of operating points, spanned by a subset of the state
+    variables (the scheduling variables). At runtime, the gain matrix is interpolated
+    multilinearly between the grid points enclosing the current state.
+
+    The gain table is usually computed offline using :meth:`fromLinearizations` and can be
+    stored to and restored from a file via :meth:`save` and :meth:`load`.
+
+    :param axes: A sequence of d strictly increasing 1D arrays spanning the grid
+    :param schedulingIndices: Indices of the d state variables the gains are scheduled on
+    :param gains: Array of shape <len(axes[0])>x...x<len(axes[d-1])>x<NU>x<NX> containing the
+    gain matrix of each grid point
+    """
+
+    def __init__(self, axes, schedulingIndices, gains):
+        self.axes = [np.asarray(ax, dtype=float) for ax in axes]
+        self.schedulingIndices = np.asarray(schedulingIndices, dtype=int)
+        self.gains = np.ascontiguousarray(gains, dtype=float)
+        self.NU, self.NX = self.gains.shape[-2:]
+
+        if self.gains.shape[:-2] != tuple(len(ax) for ax in self.axes):
+            raise ValueError('Gain table of shape %s does not match the grid of shape %s' %
+                             (str(self.gains.shape), str(tuple(len(ax) for ax in self.axes))))
+
+        # flat view over all grid points for the interpolation
+        self._flatGains = self.gains.reshape((-1, self.NU * self.NX))
+        self._interpolation = GridInterpolation(self.axes)
+
+    @classmethod
+    def fromLinearizations(cls, linearizationFun, operatingPointFun, axes, schedulingIndices,
+                           Q, R, method='doubling'):
+        """fromLinearizations Computes the gain table by linearizing the system at every grid
+        point and solving the corresponding Riccati equation. Each Riccati equation is warm
+        started with the solution of a neighboring grid point.
+
+        :param linearizationFun: A function (xOp, uOp) -> (A, B) returning the time-discrete
+        linear system at the operating point, e.g. a Linearization. If it has a method
+        batch(xOps, uOps) like Linearization, all grid points are linearized in a single call.
+        :param operatingPointFun: A function mapping a vector of scheduling variable values to
+        an operating point (xOp, uOp)
+        :param axes: A sequence of d strictly increasing 1D arrays spanning the grid
+        :param schedulingIndices: Indices of the d state variables the gains are scheduled on
+        :param Q: State weight matrix
+        :param R: Control weight matrix
+        :param method: Riccati solver method, see :meth:`Lqr.solveRiccati`
+        :returns: A GainScheduledLqr object
+        """
+
+        shape = tuple(len(ax) for ax in axes)
+        gains = None
+        solutions = [None] * int(np.prod(shape))
+
+        operatingPoints = [operatingPointFun(np.array([ax[i] for ax, i in zip(axes, gridIdx)]))
+                           for gridIdx in np.ndindex(*shape)]
+        if hasattr(linearizationFun, 'batch'):
+            systems = zip(*linearizationFun.batch(
+                np.column_stack([np.ravel(xOp) for xOp, _ in operatingPoints]),
+                np.column_stack([np.ravel(uOp) for _, uOp in operatingPoints])))
+        else:
+            systems = (linearizationFun(*op) for op in operatingPoints)
+
+        for flatIdx, (gridIdx, (A, B)) in enumerate(zip(np.ndindex(*shape), systems)):
+            K, solutions[flatIdx], _ = Lqr.solveRiccati(
+                A, B, Q, R, method=method, P0=cls._neighborSolution(solutions, gridIdx, shape),
+                fullOutput=True)
+
+            if gains is None:
+                gains = np.empty(shape + K.shape)
+            gains[gridIdx] = K
+
+        return cls(axes, schedulingIndices, gains)
+
+    @staticmethod
+    def _neighborSolution(solutions, gridIdx, shape):
+        # the neighbor along the last axis that is not at its start has already been computed
+        for axis in reversed(range(len(gridIdx))):
+            if gridIdx[axis] > 0:
+                neighborIdx = list(gridIdx)
+                neighborIdx[axis] -= 1
+                return solutions[np.ravel_multi_index(neighborIdx, shape)]
+        return None
+
+    def gain(self, schedulingValues):
+        """gain Returns the interpolated gain matrix for the given scheduling variable values.
+
+        :param schedulingValues: Vector of the d scheduling variable values
+        :returns: A <NU>x<NX> gain matrix
+        """
+
+        indices, weights = self._interpolation.weights(np.reshape(schedulingValues, (1, -1)))
+        return (weights[0] @ self._flatGains[indices[0]]).reshape((self.NU, self.NX))
+
+    def step(self, x0, xRefs, uRefs):
+        """step Performs a control step taking the current state (x0) and a reference trajectory
+        (xRefs, uRefs) and returns the controls for the current time step. The gain matrix is
+        scheduled on the current state.
+
+        :param x0: Current state (estimate)
+        :param xRefs: Matrix where colums are reference states (uses only the first state)
+        :param uRefs: Matrix where colums are reference controls (uses only the first control)
+        :returns A 2-tuple (u, dict), where u are the resulting controls and dict a dictionary
+        with metadata
+        """
+        x0 = np.asarray(x0)
+        K = self.gain(x0[self.schedulingIndices])
+        u = - K @ (x0 - xRefs[:, 0]) + uRefs[:, 0]
+        return u, {'f': None}
+
+    def save(self, filename):
+        """save Stores the gain table in a .npz file.
+
+        :param filename: Path of the file
+        """
+        axes = {'axis_%d' % i: ax for i, ax in enumerate(self.axes)}
+        np.savez(filename, gains=self.gains, schedulingIndices=self.schedulingIndices, **axes)
+
+    @classmethod
+    def load(cls, filename):
+        """load Restores a gain table stored via :meth:`save`.
+
+        :param filename: Path of the file
+        :returns: A GainScheduledLqr object
+        """
+        with np.load(filename) as data:
+            schedulingIndices = data['schedulingIndices']
+            axes = [data['axis_%d' % i] for i in range(schedulingIndices.size)]
+            return cls(axes, schedulingIndices, data['gains'])
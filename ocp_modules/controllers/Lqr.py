@@ -1,5 +1,6 @@
 import time
 import numpy as np
+import scipy.linalg
 
 from ocp_modules.controllers.ControllerBase import ControllerBase
 
@@ -21,21 +22,77 @@ class Lqr (ControllerBase):
     (time-discrete).
     """
 
-    def __init__(self, A, B, Q, R):
-        self.K = Lqr.solveRiccati(A, B, Q, R)
+    def __init__(self, A, B, Q, R, method='iteration', P0=None):
+        self.K, self.P, self.riccatiInfo = Lqr.solveRiccati(A, B, Q, R, method=method, P0=P0,
+                                                            fullOutput=True)
+        self._stateErrors = np.empty((0, self.K.shape[1]))
 
     @staticmethod
-    def solveRiccati(A, B, Q, R, eps=1e-6, timeOut=1.):
+    def solveRiccati(A, B, Q, R, eps=1e-6, timeOut=1., method='iteration', P0=None,
+                     fullOutput=False):
+        """solveRiccati Solves the discrete-time algebraic Riccati equation (DARE) and returns
+        the optimal gain matrix.
+
+        Available methods are:
+
+        * 'iteration': Fixed-point iteration of the Riccati difference equation. Stops if the
+          change of all elements of P is smaller than <eps> or after <timeOut> seconds.
+        * 'doubling': Structure-preserving doubling algorithm (SDA). Converges quadratically,
+          i.e. usually within a few dozen iterations even for large systems. Stops if the
+          relative change of P is smaller than <eps> or after <timeOut> seconds.
+        * 'schur': Direct solution via the generalized Schur decomposition
+          (scipy.linalg.solve_discrete_are). Ignores <eps>, <timeOut> and <P0>.
+
+        :param A: System matrix
+        :param B: Input matrix
+        :param Q: State weight matrix
+        :param R: Control weight matrix
+        :param eps: Convergence threshold
+        :param timeOut: Maximum computation time in seconds for iterative methods
+        :param method: One of 'iteration', 'doubling' or 'schur'
+        :param P0: Optional initial guess for P (warm start), e.g. the solution of a similar
+        problem. Defaults to Q.
+        :param fullOutput: If True, returns a 3-tuple (K, P, info) instead of K only
+        :returns K, or if <fullOutput> is set, a 3-tuple (K, P, info), where info is a
+        dictionary with the keys 'method', 'iterations', 'residual' (maximum absolute residual
+        of the DARE) and 'converged'
+        """
+
+        if method == 'iteration':
+            P, count, converged = Lqr._riccatiIteration(A, B, Q, R, eps, timeOut, P0)
+        elif method == 'doubling':
+            P, count, converged = Lqr._riccatiDoubling(A, B, Q, R, eps, timeOut, P0)
+        elif method == 'schur':
+            P = scipy.linalg.solve_discrete_are(A, B, Q, R)
+            count, converged = 1, True
+        else:
+            raise ValueError('Unknown Riccati solver method "%s"' % method)
+
+        # compute the gain matrix
+        BtP = B.T @ P
+        K = np.linalg.solve(R + BtP @ B, BtP @ A)
+
+        if not fullOutput:
+            return K
+
+        residual = float(np.abs(A.T @ P @ A - (A.T @ BtP.T) @ K + Q - P).max())
+        info = {'method': method, 'iterations': count, 'residual': residual,
+                'converged': converged}
+
+        return K, P, info
+
+    @staticmethod
+    def _riccatiIteration(A, B, Q, R, eps, timeOut, P0):
         # initialize P with Q
-        P = Q
+        P = Q if P0 is None else P0
 
         # iterate over riccati equation to find P
         startTime = time.time()
         count = 0
         while True:
-            Pnext = A.T @ P @ A - (A.T @ P @ B) \
-                @ np.linalg.inv(R + B.T @ P @ B) \
-                @ (B.T @ P @ A) + Q
+            BtP = B.T @ P
+            Pnext = A.T @ P @ A - (A.T @ BtP.T) \
+                @ np.linalg.solve(R + BtP @ B, BtP @ A) + Q
 
             count += 1
 
@@ -43,21 +100,56 @@ class Lqr (ControllerBase):
                 raise RuntimeError('NaN in Pnext after %d iterations' % count)
 
             # if timeout or changes smaller than <eps>, stop
-            if time.time() - startTime > timeOut:
-                print('solveRiccati(): timeout (%fs) after %d iterations' %
-                      (timeOut, count))
-                break
-            elif (np.abs(P - Pnext) < eps).all():
-                print(
-                    'solveRiccati(): threshold (%f) reached after %d iterations' % (eps, count))
-                break
+            if (np.abs(P - Pnext) < eps).all():
+                return Pnext, count, True
+            elif time.time() - startTime > timeOut:
+                return Pnext, count, False
             else:
                 P = Pnext
 
-        # compute the gain matrix
-        K = np.linalg.inv(R + B.T @ P @ B) @ (B.T @ P @ A)
+    @staticmethod
+    def _riccatiDoubling(A, B, Q, R, eps, timeOut, P0):
+        NX = A.shape[0]
+        G = B @ np.linalg.solve(R, B.T)
+        H = Q
+
+        if P0 is not None:
+            # defect correction: the remainder X = P - P0 solves a DARE with the closed-loop
+            # system and the residual of P0 as state weight
+            W = np.linalg.solve(np.eye(NX) + G @ P0, np.hstack((A, G)))
+            H = Q + A.T @ P0 @ W[:, :NX] - P0
+            A, G = W[:, :NX], W[:, NX:]
+
+        startTime = time.time()
+        count = 0
+        while True:
+            # one factorization of (I + G H) per doubling step
+            W = np.linalg.solve(np.eye(NX) + G @ H, np.hstack((A, G @ A.T)))
+            Hnext = H + A.T @ H @ W[:, :NX]
+            G = G + A @ W[:, NX:]
+            A = A @ W[:, :NX]
+
+            # enforce symmetry against round-off drift
+            Hnext = (Hnext + Hnext.T) / 2
+            G = (G + G.T) / 2
+
+            count += 1
+
+            if not np.isfinite(Hnext).all():
+                raise RuntimeError('P diverged after %d doubling steps, is (A, B) stabilizable?'
+                                   % count)
 
-        return K
+            change = np.abs(Hnext - H).max()
+            H = Hnext
+            if change <= eps * max(1., np.abs(H).max()):
+                converged = True
+                break
+            elif time.time() - startTime > timeOut:
+                converged = False
+                break
+
+        P = H if P0 is None else P0 + H
+        return P, count, converged
 
     def step(self, x0, xRefs, uRefs):
         """step Performs a control step taking the current state (x0) and a reference trajectory
@@ -72,3 +164,29 @@ class Lqr (ControllerBase):
         u = - np.reshape(self.K @ np.reshape(x0 -
                                              xRefs[:, 0], (-1, 1)), (-1,)) + uRefs[:, 0]
         return u, {'f': None}
+
+    def stepBatch(self, x0s, xRefs, uRefs, out=None):
+        """stepBatch Performs a control step for a batch of N independent states at once using
+        a single matrix-matrix product. The results are equal to calling :meth:`step` for each
+        state up to floating point round-off.
+
+        The state error is computed in an internal buffer that is reused as long as N does not
+        change, so with <out> given no memory is allocated. Consequentially, a controller
+        object must not be used from several threads at the same time.
+
+        :param x0s: <N>x<NX> matrix where rows are current states (estimates)
+        :param xRefs: <N>x<NX> matrix where rows are the reference states of each sample
+        :param uRefs: <N>x<NU> matrix where rows are the reference controls of each sample
+        :param out: Optional <N>x<NU> array the controls are written to
+        :returns A <N>x<NU> matrix where rows are the resulting controls (<out>, if given)
+        """
+        if self._stateErrors.shape[0] != x0s.shape[0]:
+            self._stateErrors = np.empty(x0s.shape)
+        if out is None:
+            out = np.empty((x0s.shape[0], self.K.shape[0]))
+
+        np.subtract(x0s, xRefs, out=self._stateErrors)
+        np.matmul(self._stateErrors, self.K.T, out=out)
+        np.subtract(uRefs, out, out=out)
+
+        return out
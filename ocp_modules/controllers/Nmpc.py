@@ -4,11 +4,148 @@ import time
 import xarray as xr
 
 from ocp_modules.controllers.ControllerBase import ControllerBase
+from ocp_modules.utils.metadata_recorder import MetadataRecorder
+from ocp_modules.utils.horizon_shift import primalShiftIndices, constraintShiftIndices
+from ocp_modules.utils.function_buffer import BufferedFunction
+from ocp_modules.utils.solver_statistics import SolverStatistics, statisticsDataArrays
+
+
+class _IterationMonitor (ca.Callback):
+    """IPOPT iteration callback that keeps the best feasible iterate and stops the solver if
+    the next iteration is not expected to finish within the deadline of the step, or after a
+    maximum number of iterations. The duration of the next iteration is predicted as the
+    longest of the recent iterations. An iterate is feasible if it violates no constraint by
+    more than <tol>, which defaults to IPOPT's constr_viol_tol.
+    """
+
+    def __init__(self, nx, ng, npar, lbx, ubx, lbg, ubg, tol=1e-4, historyLength=5):
+        ca.Callback.__init__(self)
+        self.sizes = {'x': nx, 'f': 1, 'g': ng, 'lam_x': nx, 'lam_g': ng, 'lam_p': npar}
+        self.lbx, self.ubx, self.lbg, self.ubg = lbx, ubx, lbg, ubg
+        self.tol = tol
+        self.durations = np.zeros((historyLength,))
+        # all outputs of the solver that belong to the iterate, so that a fallback step is
+        # consistent
+        self.best = {name: np.zeros((self.sizes[name],))
+                     for name in ('x', 'f', 'g', 'lam_x', 'lam_g')}
+        self.start(None, None)
+        self.construct('iteration_monitor', {})
+
+    def get_n_in(self):
+        return ca.nlpsol_n_out()
+
+    def get_n_out(self):
+        return 1
+
+    def get_name_in(self, i):
+        return ca.nlpsol_out(i)
+
+    def get_name_out(self, i):
+        return 'ret'
+
+    def get_sparsity_in(self, i):
+        return ca.Sparsity.dense(self.sizes[ca.nlpsol_out(i)], 1)
+
+    def start(self, deadline, maxIterations):
+        """start Resets the monitor before a solver call.
+
+        :param deadline: Time budget in seconds, measured from now, or None
+        :param maxIterations: Maximum number of iterations, or None
+        """
+        self.deadline = deadline
+        self.maxIterations = maxIterations
+        self.tick = self.lastTick = time.perf_counter()
+        self.iterations = 0
+        self.stopped = False
+        self.feasible = False
+        self.best['f'][0] = np.inf
+
+    def eval(self, arg):
+        now = time.perf_counter()
+        if self.iterations > 0:
+            self.durations[self.iterations % self.durations.size] = now - self.lastTick
+        self.lastTick = now
+
+        # keep the best feasible iterate
+        values = dict(zip(ca.nlpsol_out(), (np.array(a).ravel() for a in arg)))
+        x, g = values['x'], values['g']
+        violation = max(np.max(self.lbx - x, initial=0.), np.max(x - self.ubx, initial=0.),
+                        np.max(self.lbg - g, initial=0.), np.max(g - self.ubg, initial=0.))
+        if violation <= self.tol and values['f'][0] < self.best['f'][0]:
+            self.feasible = True
+            for name, array in self.best.items():
+                array[:] = values[name]
+
+        self.iterations += 1
+        if self.maxIterations is not None and self.iterations > self.maxIterations:
+            self.stopped = True
+        elif self.deadline is not None and \
+                now - self.tick + np.max(self.durations[:self.iterations]) > self.deadline:
+            self.stopped = True
+
+        return [1 if self.stopped else 0]
 
 
 class Nmpc (ControllerBase):
+    """Nonlinear MPC that solves the OCP with IPOPT in every control step.
+
+    The solution of a step is the initial guess of the next one. The warm start strategy
+    <warmStart> determines how:
+
+    * 'shift': The primal solution and the bound and constraint multipliers are shifted by one
+      stage (default)
+    * 'reuse': The primal-dual solution is reused without shifting
+    * 'none': Every step starts from <w0> and zero multipliers
+
+    Warm started steps are solved by a second solver (warmSolver) with IPOPT's warm start
+    options (warmStartOptions), which are overridden by the ones in <solvOpts>. Since these
+    options slow down cold starts, the first step and the steps of the strategy 'none' are
+    solved without them. The second solver is built on the first warm started step, which
+    takes correspondingly longer. With a <solverCache> (see
+    ocp_modules.utils.solver_compilation.SolverCache), both solvers are compiled and cached
+    separately, i.e. a warm started controller compiles the OCP twice.
 
-    def __init__(self, ocpVars, lbw, ubw, ocpParams, ocpCosts, ocpConstr, NX, NU, M, w0=None, solvOpts={}):
+    With <anytime>, a step can be given a deadline and a maximum number of iterations. If the
+    solver is stopped before convergence, the step returns the best feasible iterate or, if
+    there is none, the last iterate. The objective, constraint values and multipliers of the
+    solver output and the metadata are the ones of the returned iterate. The taken fallback is
+    available as attribute fallback and recorded in the metadata, along with whether the
+    deadline was missed.
+
+    Every step is timed per phase (stepPhases) and the solver statistics (iterations, return
+    status, time and calls per solverPhases) are recorded in the metadata. Hooks registered
+    via :meth:`addHook` are called before and after the solver.
+
+    With a <warmStartStore> (see ocp_modules.utils.warm_start_store.WarmStartStore), converged
+    solutions are stored by the features of their parameters. A step starts from the stored
+    solution nearest to its parameters if that is closer than the problem the warm start
+    strategy's guess was computed for, e.g. after a reference jump or a reset. Hits are
+    recorded in the metadata, along with the hit rate and the mean iterations saved by a hit.
+    """
+
+    warmStartStrategies = ('shift', 'reuse', 'none')
+    fallbacks = ('none', 'best_feasible', 'last_iterate')
+
+    defaultSolverOptions = {'ipopt': {'print_level': 1, 'linear_solver': 'mumps'},
+                            'print_time': 0}
+
+    # IPOPT only uses the passed multipliers with warm_start_init_point, and by default pushes
+    # the warm started iterate far into the interior, which undoes most of the warm start. On
+    # a cold start, i.e. zero multipliers, these options slow down the solver.
+    warmStartOptions = {'warm_start_init_point': 'yes',
+                        'warm_start_bound_push': 1e-9,
+                        'warm_start_bound_frac': 1e-9,
+                        'warm_start_slack_bound_push': 1e-9,
+                        'warm_start_slack_bound_frac': 1e-9,
+                        'warm_start_mult_bound_push': 1e-9}
+
+    # phases of a step timed in the metadata (phase_times) and of the solver statistics
+    stepPhases = ('parameters', 'solve', 'postprocessing')
+    solverPhases = ('nlp_f', 'nlp_g', 'nlp_grad_f', 'nlp_jac_g', 'nlp_hess_l', 'callback_fun')
+
+    def __init__(self, ocpVars, lbw, ubw, ocpParams, ocpCosts, ocpConstr, NX, NU, M, w0=None, solvOpts={},
+                 recordOpts={}, solverCache=None, warmStart='shift', anytime=False,
+                 warmStartStore=None):
         self.var = ocpVars
         self.params = ocpParams
         self.costs = sum(ocpCosts)
@@ -20,47 +157,248 @@ class Nmpc (ControllerBase):
 
         if w0 is None:
             w0 = np.zeros((ocpVars.size,))
-        self.w0 = w0
+        self.w0Init = np.array(w0, dtype=float).ravel()
 
         self.NX = NX
         self.NU = NU
         self.M = M
 
+        if warmStart not in self.warmStartStrategies:
+            raise ValueError('Unknown warm start strategy %s, expected one of %s'
+                             % (warmStart, self.warmStartStrategies))
+        self.warmStart = warmStart
+        self._primalShift = primalShiftIndices(NX, NU, M)
+        self._constraintShift = constraintShiftIndices([c[0] for c in ocpConstr], self.var.cat,
+                                                       NX, NU, M)
+
         if not solvOpts:
-            solvOpts = {'ipopt': {'print_level': 1, 'linear_solver': 'mumps',
-                                  'warm_start_entire_iterate': 'yes'}, 'print_time': 0}
+            solvOpts = self.defaultSolverOptions
+
+        self.anytime = anytime
+        self.fallback = 'none'
+        if anytime:
+            self._monitor = _IterationMonitor(
+                self.var.size, self.g.numel(), self.params.size, np.array(lbw).ravel(),
+                np.array(ubw).ravel(), np.array(self.lbg).ravel(), np.array(self.ubg).ravel())
+            solvOpts = dict(solvOpts, iteration_callback=self._monitor)
 
         nlp = {'x': self.var, 'f': self.costs, 'g': self.g, 'p': self.params}
 
-        self.solver = ca.nlpsol('solver', 'ipopt', nlp, solvOpts)
+        # IPOPT's options are fixed, so warm started steps use a second solver with the warm
+        # start options, which user options override. The solver of cold starts ignores them.
+        ipoptOpts = solvOpts.get('ipopt', {})
+        coldOpts = dict(solvOpts, ipopt={name: value for name, value in ipoptOpts.items()
+                                         if not name.startswith('warm_start')})
+        warmOpts = dict(solvOpts, ipopt=dict(self.warmStartOptions, **ipoptOpts))
+
+        def nlpsol(opts):
+            if solverCache is None:
+                return ca.nlpsol('solver', 'ipopt', nlp, opts)
+            # compiled solver, loaded from the cache if the problem is unchanged
+            return solverCache.nlpsol('solver', 'ipopt', nlp, opts)
+
+        self.solver = nlpsol(coldOpts)
+        # built on the first warm started step
+        self.warmSolver = None
+        self._buildWarmSolver = lambda: nlpsol(warmOpts)
+
+        # the solvers are bound to the same preallocated buffers. The input buffers hold the
+        # bounds, the parameters and the warm start, which is updated in place after every step.
+        self._solverBuffer = BufferedFunction(self.solver)
+        self._warmSolverBuffer = None
+        args = self._solverBuffer.args
+        for name, value in (('lbx', lbw), ('ubx', ubw), ('lbg', self.lbg), ('ubg', self.ubg),
+                            ('x0', self.w0Init)):
+            args[name][:] = np.array(value, dtype=float).ravel()
+        self.w0 = args['x0']
+        self.lagrMulOptVars = args['lam_x0']
+        self.lagrMulConstr = args['lam_g0']
+        self._controls = self._solverBuffer.res['x'][-NU * M:].reshape((NU, M), order='F')
+
+        self.warmStartStore = warmStartStore
+        if warmStartStore is not None:
+            if (warmStartStore.numParameters, warmStartStore.numVariables,
+                    warmStartStore.numConstraints) != (self.params.size, self.var.size,
+                                                       self.g.numel()):
+                raise ValueError('The warm start store does not match the problem dimensions')
+            self._features = np.zeros((warmStartStore.featureIndices.size,))
+            self._guessFeatures = np.zeros_like(self._features)
+        # the features of the problem the current initial guess was computed for, if any
+        self._guessValid = False
+        # whether the initial guess is a previous solution, i.e. the next step is warm started
+        self._warm = False
+
+        self.hooks = []
+        self._phaseTimes = np.zeros((len(self.stepPhases),))
+        # the statistics are accumulated per solver
+        self._coldSolverStats = SolverStatistics(self.solverPhases)
+        self._warmSolverStats = SolverStatistics(self.solverPhases)
+        self._solverStats = self._coldSolverStats
+
+        # recordOpts are passed to the recorder, e.g. {'policy': 'last', 'capacity': 1000}
+        self.recorder = MetadataRecorder({'solution': self.var.size,
+                                          'objective': (),
+                                          'multipliers_variables': self.var.size,
+                                          'multipliers_constraints': self.g.numel(),
+                                          'computation_time': (),
+                                          'iterations': (),
+                                          'deadline_missed': (),
+                                          'fallback': (),
+                                          'warm_start_hit': (),
+                                          'phase_times': len(self.stepPhases),
+                                          **self._solverStats.channels()}, **recordOpts)
+
+    def addHook(self, hook):
+        """Registers a hook that is called before and after the solver of every step.
+
+        Args:
+            hook (StepHook): An object with the methods preSolve and postSolve, see
+                ocp_modules.utils.step_hooks.StepHook
+        """
+
+        self.hooks.append(hook)
+
+    def step(self, nlpParamValues, shift=None, reset_meta=False, deadline=None,
+             maxIterations=None, copy=True):
+        """Solves the OCP and returns the complete predicted control trajectory.
 
-        self.solverResults = []
-        self.durations = []
+        Args:
+            nlpParamValues (numpy.ndarray): OCP parameter vector
+            shift (bool, optional): Overrides the warm start strategy for the next step, True
+                for 'shift' and False for 'reuse'. Defaults to None, i.e. the configured
+                strategy.
+            reset_meta (bool, optional): Discards the recorded metadata before the step
+            deadline (float, optional): Time budget of this step in seconds, requires anytime
+            maxIterations (int, optional): Maximum number of iterations of this step, requires
+                anytime
+            copy (bool, optional): If False, the returned controls are a view into the solution
+                buffer instead of a copy, which saves an allocation but is overwritten by the
+                next step. Defaults to True.
+
+        Raises:
+            ValueError: If a deadline or a maximum number of iterations is given without anytime
+
+        Returns:
+            numpy.ndarray: A <number_controls>x<horizon_length> matrix containing the predicted
+            controls
+        """
 
-    def step(self, nlpParamValues, shift=True, reset_meta=False):
         if reset_meta:
-            self.solverResults = []
-            self.durations = []
+            self.recorder.reset()
+
+        tick = time.perf_counter()
+        np.copyto(self._solverBuffer.args['p'], nlpParamValues)
+
+        hit = False
+        store = self.warmStartStore
+        if store is not None:
+            store.features(self._solverBuffer.args['p'], out=self._features)
+            guessDistance = np.linalg.norm(self._features - self._guessFeatures) \
+                if self._guessValid else np.inf
+            hit, _ = store.lookup(self._features, guessDistance, self.w0,
+                                  self.lagrMulOptVars, self.lagrMulConstr)
 
-        tick = time.time()
-        res = self.solver(x0=self.w0, lbx=self.lbw, ubx=self.ubw,
-                          lbg=self.lbg, ubg=self.ubg, p=nlpParamValues)
-        dt = time.time() - tick
+        if self.anytime:
+            self._monitor.start(deadline, maxIterations)
+        elif deadline is not None or maxIterations is not None:
+            raise ValueError('A deadline or maximum number of iterations requires anytime=True')
+
+        for hook in self.hooks:
+            hook.preSolve(self, self.recorder.stepCount)
+
+        # the warm start options only pay off if the initial guess is a previous solution
+        solverBuffer, solverStats = self._solverBuffer, self._coldSolverStats
+        if self._warm or hit:
+            solverBuffer, solverStats = self._warmStartedSolver(), self._warmSolverStats
+        self._solverStats = solverStats
+
+        solveStart = time.perf_counter()
+        solverBuffer()
+        solveEnd = time.perf_counter()
+        dt = solveEnd - solveStart
+
+        res = self._solverBuffer.res
+
+        # the solver returns the last iterate if stopped early
+        self.fallback = 'none'
+        if self.anytime and self._monitor.stopped:
+            self.fallback = 'last_iterate'
+            if self._monitor.feasible:
+                self.fallback = 'best_feasible'
+                for name, array in self._monitor.best.items():
+                    np.copyto(res[name], array)
 
         # save result as initial guess for next iteration
-        xsol = np.array(res['x'][:self.NX * (self.M + 1)])
-        usol = np.array(res['x'][-self.NU * self.M:])
-        if shift:
-            self.w0 = np.concatenate(
-                (xsol[self.NX:], xsol[-self.NX:], usol[self.NU:], usol[-self.NU:]))
+        strategy = self.warmStart if shift is None else ('shift' if shift else 'reuse')
+        if strategy == 'shift':
+            np.take(res['x'], self._primalShift, out=self.w0)
+            np.take(res['lam_x'], self._primalShift, out=self.lagrMulOptVars)
+            np.take(res['lam_g'], self._constraintShift, out=self.lagrMulConstr)
+        elif strategy == 'reuse':
+            np.copyto(self.w0, res['x'])
+            np.copyto(self.lagrMulOptVars, res['lam_x'])
+            np.copyto(self.lagrMulConstr, res['lam_g'])
         else:
-            self.w0 = res['x']
+            np.copyto(self.w0, self.w0Init)
+            self.lagrMulOptVars.fill(0.)
+            self.lagrMulConstr.fill(0.)
+        self._warm = strategy != 'none'
+
+        # the statistics are read in every step, also if it is not recorded, since the solver
+        # accumulates them over all calls
+        solverStats.reset()
+        solverStats.add(solverBuffer.stats())
+
+        if store is not None:
+            if self._solverStats.success and self.fallback == 'none':
+                store.insert(self._features, res['x'], res['lam_x'], res['lam_g'],
+                             self._solverStats.iterations)
+            np.copyto(self._guessFeatures, self._features)
+            self._guessValid = strategy != 'none'
+
+        self._phaseTimes[0] = solveStart - tick
+        self._phaseTimes[1] = dt
+        self._phaseTimes[2] = time.perf_counter() - solveEnd
 
         # save solver results
-        self.solverResults.append(res)
-        self.durations.append(dt)
+        values = dict(solution=res['x'], objective=res['f'], multipliers_variables=res['lam_x'],
+                      multipliers_constraints=res['lam_g'], computation_time=dt,
+                      iterations=self._solverStats.iterations,
+                      deadline_missed=deadline is not None and dt > deadline,
+                      fallback=self.fallbacks.index(self.fallback), warm_start_hit=hit,
+                      phase_times=self._phaseTimes, **self._solverStats.values())
+        self.recorder.record(**values)
+        for hook in self.hooks:
+            hook.postSolve(self, self.recorder.stepCount - 1, values)
+
+        return self._controls.copy() if copy else self._controls
 
-        return np.reshape(usol, (self.NU, -1), order='F')
+    def _warmStartedSolver(self):
+        """Returns the buffered solver with the warm start options, which is built on the first
+        call and bound to the buffers of the solver of cold starts."""
+
+        if self._warmSolverBuffer is None:
+            self.warmSolver = self._buildWarmSolver()
+            self._warmSolverBuffer = BufferedFunction(self.warmSolver)
+            for name, array in self._solverBuffer.args.items():
+                self._warmSolverBuffer.bindArg(name, array)
+            for name, array in self._solverBuffer.res.items():
+                self._warmSolverBuffer.bindRes(name, array)
+        return self._warmSolverBuffer
+
+    def reset(self):
+        """Restores the initial guess, clears the multipliers and discards the recorded
+        metadata, i.e. the next step behaves like the first step of a new controller. The
+        entries of a warm start store are kept.
+        """
+
+        np.copyto(self.w0, self.w0Init)
+        self.lagrMulOptVars.fill(0.)
+        self.lagrMulConstr.fill(0.)
+        self.fallback = 'none'
+        self._guessValid = False
+        self._warm = False
+        self.recorder.reset()
 
     def get_metadata(self) -> xr.Dataset:
         """Returns a xarray dataset containing artifact data of this class and its member classes
@@ -69,22 +407,59 @@ class Nmpc (ControllerBase):
             xr.Dataset: A xarray.Dataset
         """
 
+        return self.metadata_from_records(self.metadata_attributes(), *self.recorder.data())
+
+    def metadata_attributes(self) -> dict:
+        """Returns the static (i.e. not per control step) metadata of this controller
+
+        Returns:
+            dict: A dictionary with the number of states, controls and the horizon length
+        """
+
+        return {'num_states': self.NX, 'num_controls': self.NU, 'horizon_length': self.M}
+
+    @staticmethod
+    def metadata_from_records(static, steps, records) -> xr.Dataset:
+        """Assembles the metadata dataset from recorded data, see :meth:`get_metadata`
+
+        Args:
+            static (dict): Static metadata as returned by :meth:`metadata_attributes`
+            steps (numpy.ndarray): Indices of the recorded control steps
+            records (dict): Recorded arrays per channel as returned by MetadataRecorder.data
+
+        Returns:
+            xr.Dataset: A xarray.Dataset
+        """
+
         meta = {}
         meta['controller_name'] = xr.DataArray('NMPC')
-        meta['num_states'] = self.NX
-        meta['num_controls'] = self.NU
-        meta['horizon_length'] = self.M
-        meta['residuals'] = xr.DataArray([float(res['f']) for res in self.solverResults],
-                                         dims=('control_step'))
-        if not self.solverResults:
-            meta['solutions'] = xr.DataArray(np.zeros((1, 0)), dims=('solution', 'control_step'))
-        else:
-            solutions = np.array([np.asarray(res['x']).ravel() for res in self.solverResults],
-                                 ndmin=2).T
-            meta['solutions'] = xr.DataArray(solutions, dims=('solution', 'control_step'))
-        # here one could also add lagrange multipliers to the dataset
-        meta['computation_times'] = xr.DataArray(self.durations, dims=('control_step'))
+        meta.update(static)
+        meta['residuals'] = xr.DataArray(records['objective'], dims=('control_step'))
+        meta['solutions'] = xr.DataArray(records['solution'].T, dims=('solution', 'control_step'))
+        meta['multipliers_variables'] = xr.DataArray(records['multipliers_variables'].T,
+                                                     dims=('solution', 'control_step'))
+        meta['multipliers_constraints'] = xr.DataArray(records['multipliers_constraints'].T,
+                                                       dims=('constraint', 'control_step'))
+        meta['computation_times'] = xr.DataArray(records['computation_time'],
+                                                 dims=('control_step'))
+        meta['iterations'] = xr.DataArray(records['iterations'], dims=('control_step'))
+        meta['deadline_missed'] = xr.DataArray(records['deadline_missed'].astype(bool),
+                                               dims=('control_step'))
+        meta['fallback'] = xr.DataArray(np.array(Nmpc.fallbacks)[
+            records['fallback'].astype(int)], dims=('control_step'))
+        # the savings are estimated as the mean iterations of steps without a hit minus the
+        # mean iterations of steps with a hit
+        hits = records['warm_start_hit'].astype(bool)
+        meta['warm_start_hit'] = xr.DataArray(hits, dims=('control_step'))
+        meta['warm_start_hit_rate'] = xr.DataArray(hits.mean() if hits.size else 0.)
+        meta['warm_start_iteration_savings'] = xr.DataArray(
+            records['iterations'][~hits].mean() - records['iterations'][hits].mean()
+            if hits.any() and not hits.all() else np.nan)
+        meta['phase_times'] = xr.DataArray(records['phase_times'].T,
+                                           dims=('step_phase', 'control_step'),
+                                           coords={'step_phase': list(Nmpc.stepPhases)})
+        meta.update(statisticsDataArrays(records, Nmpc.solverPhases))
 
-        meta_dataset = xr.Dataset(data_vars=meta)
+        meta_dataset = xr.Dataset(data_vars=meta, coords={'control_step': steps})
 
         return meta_dataset
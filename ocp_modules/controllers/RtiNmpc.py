@@ -4,12 +4,75 @@ import xarray as xr
 import time
 
 from ocp_modules.controllers.ControllerBase import ControllerBase
-from ocp_modules.utils.linearize_casadi import linearize_casadi as linearize
+from ocp_modules.utils.metadata_recorder import MetadataRecorder
+from ocp_modules.utils.function_buffer import BufferedFunction
+from ocp_modules.utils.condensing import Condensing
+from ocp_modules.utils.linearize_casadi import valueAndJacobian
+from ocp_modules.utils.riccati_qp import RiccatiQpSolver
+from ocp_modules.utils.solver_statistics import SolverStatistics, statisticsDataArrays
 
 
 class RtiNmpc (ControllerBase):
-
-    def __init__(self, ocpVars, lbw, ubw, ocpParams, ocpCosts, ocpConstr, NX, NU, M, w0, Q, R, solvOpts={}):
+    """Nonlinear MPC based on the real-time iteration scheme, i.e. a single QP per control step
+    around the previous solution.
+
+    A control step is split into two phases: :meth:`prepare` evaluates the QP data (Hessian,
+    gradient and constraint linearization) around the previous iterate, which does not depend
+    on the current state and can be done while waiting for the next measurement. Afterwards,
+    :meth:`feedback` embeds the measured state into the prepared QP and solves it. :meth:`step`
+    runs both phases at once.
+
+    Every step is timed per phase (stepPhases) and the QP solver statistics (QP iterations,
+    return status, time and calls per solverPhases, summed over the QPs of a step) are
+    recorded in the metadata. Hooks registered via :meth:`addHook` are called before the
+    first QP and at the end of the feedback phase.
+
+    With <condensing> (see ocp_modules.utils.condensing.Condensing), the states are eliminated
+    from the QP via the multiple shooting constraints before it is passed to the QP solver:
+
+    * 'none': The QP in all states and controls is solved (default)
+    * 'full': A dense QP in the controls is solved
+    * 'partial': The states at the start of every block of <condensingBlockSize> stages are
+      kept, i.e. a smaller, but still sparse QP is solved
+
+    The QP solver's solution is expanded to the full primal-dual iterate, which remains the
+    warm start and linearization point of the next step.
+
+    The Hessian of the QP is chosen by <hessian>:
+
+    * 'exact': Hessian of the Lagrangian, evaluated at every iterate (default)
+    * 'gauss_newton': Gauss-Newton approximation 2 J'WJ of the costs, built from the Jacobian J
+      of the weighted residuals <costResiduals> (see TrackingCosts.residuals), evaluated at
+      every iterate. Without residuals, the Hessian of the costs is used, which is the same for
+      tracking costs of a linear error, but ignores the curvature of the constraints.
+    * 'constant': The block-diagonal matrix of the stage weights Q and R, i.e. the Gauss-Newton
+      Hessian of the tracking costs of states and controls. It is fixed data of the QP rather
+      than evaluated at every iterate. Q and R are only used for this Hessian, the gradient of
+      the QP is always the one of the costs.
+
+    The QP solver is selected by the entry 'qpsol' of <solvOpts>, the remaining entries are its
+    options. It defaults to casadi's qpOASES interface, other casadi conic plugins (e.g.
+    'hpipm' or 'osqp') are accepted as well. With 'riccati', the QP is solved by
+    ocp_modules.utils.riccati_qp.RiccatiQpSolver, whose cost grows linearly with the horizon
+    length. It requires the structure of a multiple shooting OCP (initial value and multiple
+    shooting constraints only, stage-wise costs) and can not be combined with condensing.
+    """
+
+    fallbacks = ('none', 'previous_iterate')
+    condensingModes = ('none', 'full', 'partial')
+    hessianModes = ('exact', 'gauss_newton', 'constant')
+
+    # further SQP iterations stop if no element of the iterate changes by more than this
+    stepTolerance = 1e-8
+
+    # phases of a step timed in the metadata (phase_times) and of the solver statistics
+    stepPhases = ('parameters', 'qp_data', 'condensing', 'offset', 'solve', 'postprocessing',
+                  'iterations')
+    solverPhases = ('preprocessing', 'solver', 'postprocessing')
+
+    def __init__(self, ocpVars, lbw, ubw, ocpParams, ocpCosts, ocpConstr, NX, NU, M, w0, Q, R, solvOpts={},
+                 recordOpts={}, solverCache=None, condensing='none', condensingBlockSize=5,
+                 hessian='exact', costResiduals=None):
         self.var = ocpVars
         self.lbw = lbw
         self.ubw = ubw
@@ -18,58 +81,387 @@ class RtiNmpc (ControllerBase):
         self.g = ca.vertcat(*[c[0] for c in ocpConstr])
         self.lbg = ca.vertcat(*[c[1] for c in ocpConstr])
         self.ubg = ca.vertcat(*[c[2] for c in ocpConstr])
-        self.w0 = w0
-        self.lagrMulConstr = np.zeros((self.g.numel(),))
-        self.lagrMulOptVars = np.zeros((self.var.cat.numel(),))
-
         self.NX = NX
         self.NU = NU
         self.M = M
 
-        # symbolic variables
-        w = ca.vertcat(self.var['x'][:], self.var['u']
-                       [:])  # primal decision variables
+        if condensing not in self.condensingModes:
+            raise ValueError('Unknown condensing mode %s, expected one of %s'
+                             % (condensing, self.condensingModes))
+        self.condensing = condensing
+        if hessian not in self.hessianModes:
+            raise ValueError('Unknown hessian mode %s, expected one of %s'
+                             % (hessian, self.hessianModes))
+        self.hessian = hessian
+
+        # symbolic variables of the backend of the OCP, SX or MX (see OcpVars.gen)
+        w = self.var.cat  # primal decision variables, also the linearization point
         # constraint lagrange multipliers (lambda + mu, i.e. dual decision variables)
-        lagrMult = ca.SX.sym('lagrMult', self.g.size())
-        wGuess = ca.SX.sym('wGuess', w.shape)  # guess / linearization point
+        lagrMult = type(w).sym('lagrMult', self.g.size())
+
+        if hessian == 'exact':
+            L = self.costs + lagrMult.T @ self.g
+            B = ca.hessian(L, w)[0]
+        elif hessian == 'gauss_newton' and costResiduals:
+            B = sum(2 * ca.mtimes([ca.jacobian(r, w).T, weight, ca.jacobian(r, w)])
+                    for r, weight in costResiduals)
+        elif hessian == 'gauss_newton':
+            B = ca.hessian(self.costs, w)[0]
+        else:
+            # gauss-newton hessian 2W of the tracking costs (w - wRef)'W(w - wRef), with the
+            # block-diagonal weight matrix W of all decision variables from the stage weights
+            # (vectors or matrices)
+            B = 2 * ca.diagcat(*[ca.sparsify(ca.DM(np.diag(weight) if np.ndim(weight) == 1
+                                                   else weight))
+                                 for weight in [Q] * (M + 1) + [R] * M])
+        # gradient of the costs
+        J = ca.gradient(self.costs, w)
+        # constraints and their jacobian in one pass
+        g, A = valueAndJacobian(self.g, w)
+
+        # QP in absolute variables around the linearization point wGuess:
+        #   min 1/2 w'Bw + (J - B wGuess)'w + c0
+        #   lbg - g0 <= Aw <= ubg - g0,  g0 = g(wGuess) - A wGuess
+        # c0 is chosen such that the objective is the quadratic model of the costs. The
+        # constraint offset depends on the current state only through dg0/dx_cur, which allows
+        # the feedback phase to update it without reevaluating the linearization.
+        # A constant Hessian is not part of the QP data evaluated at every iterate.
+        c0 = self.costs + 1./2. * w.T @ B @ w - J.T @ w
+        # the entries of an MX struct are not symbolic, so the jacobian with respect to the
+        # current state is taken from the one with respect to all parameters
+        dg0dxCur = ca.jacobian(self.g, self.params.cat)[:, self.params.f['x_cur']]
+        qpData = [J - B @ w, A, g - A @ w, c0, dg0dxCur]
+        qpDataNames = ['g', 'a', 'g0', 'c0', 'dg0_dx']
+        if hessian != 'constant':
+            qpData.insert(0, B)
+            qpDataNames.insert(0, 'h')
+        # the hessian, jacobians and costs are derived separately, common subexpressions
+        # between them are shared by eliminating them from the QP data as a whole
+        self.qpDataFun = ca.Function('qp_data', [w, self.params.cat, lagrMult], ca.cse(qpData),
+                                     ['w', 'p', 'lam_g'], qpDataNames)
+        if solverCache is not None:
+            # QP data is evaluated by a compiled library, loaded from the cache if the problem
+            # is unchanged
+            self.qpDataFun = solverCache.function(self.qpDataFun)
+
+        self._condensing = None
+        qpSparsity = {'h': B.sparsity(), 'a': A.sparsity()}
+        if condensing != 'none':
+            self._condensing = Condensing(
+                B.sparsity(), A.sparsity(), self.qpDataFun.sparsity_out('dg0_dx'), self.lbg,
+                self.ubg, lbw, ubw, NX, NU, M,
+                condensingBlockSize if condensing == 'partial' else None)
+            qpSparsity = {'h': self._condensing.hSparsity, 'a': self._condensing.aSparsity}
+
+        # assemble QP, a fully condensed QP is dense
+        solvOpts = dict(solvOpts)
+        self.qpsol = solvOpts.pop('qpsol', 'qpoases')
+        if not solvOpts and self.qpsol == 'qpoases':
+            solvOpts = {'jit': False, 'print_time': 0, 'printLevel': 'low',
+                        'sparse': condensing != 'full', 'enableEqualities': True}
+            #solvOpts = {'jit' : True, 'print_time' : 0, 'printLevel' : 'high', 'sparse' : True}
 
-        # single weight matrix for all decision variables
-        W = np.diag(np.concatenate([np.tile(Q, M+1), np.tile(R, M)]))
+        if self.qpsol == 'riccati':
+            if condensing != 'none':
+                raise ValueError('The Riccati QP solver can not be combined with condensing')
+            self.solver = RiccatiQpSolver(qpSparsity['h'], qpSparsity['a'], NX, NU, M,
+                                          solvOpts)
+        else:
+            self.solver = ca.conic('S', self.qpsol, qpSparsity, solvOpts)
+
+        # constraint bounds of the QP after embedding the current state
+        g0 = ca.SX.sym('g0', self.g.numel())
+        dg0dx = ca.SX.sym('dg0_dx', self.qpDataFun.sparsity_out('dg0_dx'))
+        xFeedback = ca.SX.sym('x_cur', NX)
+        xPrepared = ca.SX.sym('x_prepared', NX)
+        offset = g0 + dg0dx @ (xFeedback - xPrepared)
+        self.offsetFun = ca.Function('qp_offset', [g0, dg0dx, xFeedback, xPrepared],
+                                     [self.lbg - offset, self.ubg - offset],
+                                     ['g0', 'dg0_dx', 'x_cur', 'x_prepared'], ['lba', 'uba'])
+
+        # all functions are bound to preallocated buffers, which are shared between them: the
+        # prepared QP data is the input of the QP solver, and the warm start is updated in
+        # place after every step
+        self._qpData = BufferedFunction(self.qpDataFun)
+        self._hessianValues = np.array(B.nonzeros()) if hessian == 'constant' else \
+            self._qpData.res['h']
+        self._offset = BufferedFunction(self.offsetFun)
+        # the Riccati solver evaluates on buffers itself
+        self._solver = self.solver if self.qpsol == 'riccati' else BufferedFunction(self.solver)
+
+        for name in ('g0', 'dg0_dx'):
+            self._offset.bindArg(name, self._qpData.res[name])
+        if self._condensing is None:
+            self._solver.bindArg('h', self._hessianValues)
+            for name in ('g', 'a'):
+                self._solver.bindArg(name, self._qpData.res[name])
+            for name in ('lba', 'uba'):
+                self._solver.bindArg(name, self._offset.res[name])
+            self._solver.args['lbx'][:] = np.array(lbw, dtype=float).ravel()
+            self._solver.args['ubx'][:] = np.array(ubw, dtype=float).ravel()
+            self.w0 = self._solver.args['x0']
+            self.lagrMulConstr = self._solver.args['lam_a0']
+            self.lagrMulOptVars = self._solver.args['lam_x0']
+        else:
+            # the solver works on the condensed QP, the full iterate is kept separately
+            for name, array in self._condensing.qp.items():
+                self._solver.bindArg(name, array)
+            self.w0 = np.zeros((self.var.size,))
+            self.lagrMulConstr = np.zeros((self.g.numel(),))
+            self.lagrMulOptVars = np.zeros((self.var.size,))
+
+        self.w0Init = np.array(w0, dtype=float).ravel()
+        np.copyto(self.w0, self.w0Init)
+        self._qpData.bindArg('w', self.w0)
+        self._qpData.bindArg('lam_g', self.lagrMulConstr)
+
+        self._xCurIndices = np.array(self.params.f['x_cur'])
+        self._w0State = self.w0[:NX]
+        self._controls = self.w0[-NU * M:].reshape((NU, M), order='F')
+        self._parameterNans = np.zeros(self._qpData.args['p'].shape, dtype=bool)
+        self._stateNans = np.zeros((NX,), dtype=bool)
+        self._stateDifference = np.zeros((NX,))
+        self._prepared = False
+
+        # state for further SQP iterations within a deadline
+        self.fallback = 'none'
+        self._iterationDurations = np.zeros((5,))
+        self._numIterationDurations = 0
+        self._backup = {name: np.zeros_like(getattr(self, name))
+                        for name in ('w0', 'lagrMulOptVars', 'lagrMulConstr')}
+
+        self.hooks = []
+        self._phaseTimes = np.zeros((len(self.stepPhases),))
+        self._solverStats = SolverStatistics(self.solverPhases)
+
+        # recordOpts are passed to the recorder, e.g. {'policy': 'last', 'capacity': 1000}
+        self.recorder = MetadataRecorder({'solution': self.var.size,
+                                          'objective': (),
+                                          'multipliers_variables': self.var.size,
+                                          'multipliers_constraints': self.g.numel(),
+                                          'computation_time': (),
+                                          'preparation_time': (),
+                                          'feedback_time': (),
+                                          'iterations': (),
+                                          'qp_iterations': (),
+                                          'deadline_missed': (),
+                                          'fallback': (),
+                                          'phase_times': len(self.stepPhases),
+                                          **self._solverStats.channels()}, **recordOpts)
+
+    def addHook(self, hook):
+        """Registers a hook that is called before the first QP and at the end of the feedback
+        phase of every step.
 
-        L = self.costs + lagrMult.T @ self.g
-        B = ca.Function('B', [w], [ca.hessian(L,w)[0]])(wGuess)
+        Args:
+            hook (StepHook): An object with the methods preSolve and postSolve, see
+                ocp_modules.utils.step_hooks.StepHook
+        """
 
-        wErr = w - wGuess
-        # reference as QP parameters
-        wRef = ca.vertcat(self.params['x_ref'][:], self.params['u_ref'][:])
+        self.hooks.append(hook)
 
-        #B = W  # gauss-newton hessian approximation
-        J = W @ (wGuess - wRef)
+    def prepare(self, ocp_parameter_values):
+        """Preparation phase: evaluates the QP around the current initial guess, i.e. the
+        previous solution. Should be called before the next state measurement is available, in
+        which case the state parameter x_cur can be a prediction (e.g. the second state of the
+        last solution). It is corrected in :meth:`feedback`.
 
-        fqp = 1./2. * wErr.T @ B @ wErr + J.T @ wErr
-        gqp = linearize(self.g, w, wGuess)
-        pqp = ca.vertcat(self.params.cat, wGuess, lagrMult)
+        Args:
+            ocp_parameter_values (numpy.ndarray): OCP parameter vector
 
-        # assemble QP
-        if not solvOpts:
-            solvOpts = {'jit': False, 'print_time': 0, 'printLevel': 'low',
-                        'sparse': True, 'enableEqualities': True}
-            #solvOpts = {'jit' : True, 'print_time' : 0, 'printLevel' : 'high', 'sparse' : True}
+        Raises:
+            RuntimeError: If the passed parameter values contain NaNs, this exception is raised
+        """
 
-        qp = {'x': self.var, 'f': fqp, 'g': gqp, 'p': pqp}
-        self.solver = ca.qpsol('S', 'qpoases', qp, solvOpts)
+        tick = time.perf_counter()
 
-        self.solverResults = []
-        self.durations = []
+        parameters = self._qpData.args['p']
+        np.copyto(parameters, ocp_parameter_values)
+        if np.isnan(parameters, out=self._parameterNans).any():
+            raise RuntimeError("OCP parameters contain NaNs")
 
-    def step(self, ocp_parameter_values):
+        # update initial guess with (predicted) state
+        np.take(parameters, self._xCurIndices, out=self._w0State)
+        np.take(parameters, self._xCurIndices, out=self._offset.args['x_prepared'])
+
+        qpDataStart = time.perf_counter()
+        self._qpData()
+        condensingStart = time.perf_counter()
+        self._condense()
+        self._prepared = True
+
+        self._preparationTime = time.perf_counter() - tick
+        self._phaseTimes[0] = qpDataStart - tick
+        self._phaseTimes[1] = condensingStart - qpDataStart
+        self._phaseTimes[2] = self._preparationTime - (condensingStart - tick)
+
+    def feedback(self, x_cur, deadline=None, maxIterations=None, copy=True):
+        """Feedback phase: embeds the current state into the QP prepared by :meth:`prepare`,
+        solves it and returns the complete predicted control trajectory.
+
+        Given a deadline or a maximum number of iterations, further SQP iterations (QP
+        evaluation and solution around the latest iterate) follow as long as the next one is
+        expected to finish within the deadline, i.e. if the elapsed time plus the longest of
+        the recent iteration durations is within the deadline. Iterations stop early if the
+        iterate does not change anymore. If the QP of a further iteration cannot be solved, the
+        previous iterate is kept (fallback 'previous_iterate').
+
+        Args:
+            x_cur (numpy.ndarray): Current state estimate
+            deadline (float, optional): Time budget of this phase in seconds
+            maxIterations (int, optional): Maximum number of QPs solved in this phase
+            copy (bool, optional): If False, the returned controls are a view into the solution
+                buffer instead of a copy, which saves an allocation but is overwritten by the
+                next step. Defaults to True.
+
+        Raises:
+            RuntimeError: If no QP is prepared or the state contains NaNs
+
+        Returns:
+            numpy.ndarray: Returns a <number_controls>x<horizon_length> matrix containing the
+            predicted controls
+        """
+
+        start = time.perf_counter()
+
+        if not self._prepared:
+            raise RuntimeError("No prepared QP, call prepare() before feedback()")
+        np.copyto(self._offset.args['x_cur'], x_cur)
+        if np.isnan(self._offset.args['x_cur'], out=self._stateNans).any():
+            raise RuntimeError("Current state contains NaNs")
+        self._prepared = False
+
+        # solve QP. The statistics are read after every QP, also if the step is not recorded,
+        # since the solver accumulates them over all calls
+        self._embedState()
+        for hook in self.hooks:
+            hook.preSolve(self, self.recorder.stepCount)
+        solveStart = time.perf_counter()
+        self._solver()
+        solveEnd = time.perf_counter()
+        self._solverStats.reset()
+        self._solverStats.add(self._solver.stats())
+        objective = self._storeSolution()
+        iterationsStart = time.perf_counter()
+
+        # the duration of an SQP iteration is measured by preparation and solve of every step
+        # as well as by further iterations
+        self._addIterationDuration(self._preparationTime + time.perf_counter() - start)
+
+        iterations = 1
+        self.fallback = 'none'
+        if deadline is not None or maxIterations is not None:
+            # further iterations use the current state, i.e. no correction of the offset
+            np.put(self._qpData.args['p'], self._xCurIndices, self._offset.args['x_cur'])
+            np.copyto(self._offset.args['x_prepared'], self._offset.args['x_cur'])
+
+        while (deadline is not None or maxIterations is not None) and \
+                (maxIterations is None or iterations < maxIterations) and \
+                (deadline is None or time.perf_counter() - start +
+                 self._iterationDurations[:self._numIterationDurations].max() <= deadline):
+            iterationStart = time.perf_counter()
+            for name, array in self._backup.items():
+                np.copyto(array, getattr(self, name))
+
+            try:
+                self._qpData()
+                self._condense()
+                self._embedState()
+                self._solver()
+            except RuntimeError:
+                for name, array in self._backup.items():
+                    np.copyto(getattr(self, name), array)
+                self.fallback = 'previous_iterate'
+                break
+
+            self._solverStats.add(self._solver.stats())
+            objective = self._storeSolution()
+            self._addIterationDuration(time.perf_counter() - iterationStart)
+            iterations += 1
+
+            if np.max(np.abs(self.w0 - self._backup['w0']), initial=0.) <= self.stepTolerance:
+                break
+
+        # stop time
+        end = time.perf_counter()
+        dt = end - start
+        self._phaseTimes[3] = solveStart - start
+        self._phaseTimes[4] = solveEnd - solveStart
+        self._phaseTimes[5] = iterationsStart - solveEnd
+        self._phaseTimes[6] = end - iterationsStart
+
+        # save meta data
+        values = dict(solution=self.w0, objective=objective,
+                      multipliers_variables=self.lagrMulOptVars,
+                      multipliers_constraints=self.lagrMulConstr,
+                      computation_time=self._preparationTime + dt,
+                      preparation_time=self._preparationTime, feedback_time=dt,
+                      iterations=iterations, qp_iterations=self._solverStats.iterations,
+                      deadline_missed=deadline is not None and dt > deadline,
+                      fallback=self.fallbacks.index(self.fallback),
+                      phase_times=self._phaseTimes, **self._solverStats.values())
+        self.recorder.record(**values)
+        for hook in self.hooks:
+            hook.postSolve(self, self.recorder.stepCount - 1, values)
+
+        return self._controls.copy() if copy else self._controls
+
+    def _addIterationDuration(self, duration):
+        self._iterationDurations[self._numIterationDurations % self._iterationDurations.size] = \
+            duration
+        self._numIterationDurations += 1
+
+    def _condense(self):
+        """Condenses the prepared QP data, if condensing is enabled."""
+
+        if self._condensing is not None:
+            res = self._qpData.res
+            self._condensing.prepare(self._hessianValues, res['g'], res['a'], res['g0'],
+                                     res['dg0_dx'])
+
+    def _embedState(self):
+        """Updates the QP for the current state and, with condensing, sets the warm start of
+        the condensed QP."""
+
+        if self._condensing is None:
+            self._offset()
+            return
+
+        args = self._offset.args
+        np.subtract(args['x_cur'], args['x_prepared'], out=self._stateDifference)
+        self._condensing.feedback(self._stateDifference)
+        self._condensing.reduce(self.w0, self.lagrMulOptVars, self.lagrMulConstr,
+                                self._solver.args['x0'], self._solver.args['lam_x0'],
+                                self._solver.args['lam_a0'])
+
+    def _storeSolution(self):
+        """Saves the QP solution as new iterate and returns its objective."""
+
+        res = self._solver.res
+        if self._condensing is not None:
+            return self._condensing.expand(res['x'], res['lam_x'], res['lam_a'], self.w0,
+                                           self.lagrMulOptVars, self.lagrMulConstr) + \
+                self._qpData.res['c0'][0]
+
+        np.copyto(self.lagrMulConstr, res['lam_a'])
+        np.copyto(self.lagrMulOptVars, res['lam_x'])
+        np.copyto(self.w0, res['x'])
+
+        return res['cost'][0] + self._qpData.res['c0'][0]
+
+    def step(self, ocp_parameter_values, deadline=None, maxIterations=None, copy=True):
         """Computes the solution to the configured OCP and returns the complete
-        predicted control trajectory.
+        predicted control trajectory. Equivalent to :meth:`prepare` followed by
+        :meth:`feedback` with the state contained in the parameters.
 
         Args:
             ocp_parameter_values (dict): Dictionary with keys that match the symbolic OCP
             parameters. The values are filled in according to the structure of the symbolic
             expression.
+            deadline (float, optional): Time budget of the step in seconds, see :meth:`feedback`
+            maxIterations (int, optional): Maximum number of QPs solved, see :meth:`feedback`
+            copy (bool, optional): Whether to return a copy of the controls or a view into the
+                solution buffer, see :meth:`feedback`
 
         Raises:
             RuntimeError: If the passed parameter values contain NaNs, this exception is raised
@@ -79,71 +471,95 @@ class RtiNmpc (ControllerBase):
             predicted controls
         """
 
-        tick = time.time()
+        start = time.perf_counter()
+        self.prepare(ocp_parameter_values)
+        if deadline is not None:
+            deadline -= time.perf_counter() - start
 
-        # update initial guess with current state estimate
-        self.w0[:self.NX] = ocp_parameter_values[:self.NX]
+        return self.feedback(self._offset.args['x_prepared'], deadline, maxIterations, copy)
 
-        # assemble ocp parameter vector
-        extended_parameter_values = np.concatenate(
-            [ocp_parameter_values, self.w0, self.lagrMulConstr])
+    def reset(self):
+        """Restores the initial guess, clears the multipliers, the iteration duration history
+        and the recorded metadata, i.e. the next step behaves like the first step of a new
+        controller.
+        """
 
-        if any(np.isnan(extended_parameter_values)):
-            raise RuntimeError("OCP parameters contain NaNs")
+        np.copyto(self.w0, self.w0Init)
+        self.lagrMulOptVars.fill(0.)
+        self.lagrMulConstr.fill(0.)
+        self._prepared = False
+        self.fallback = 'none'
+        self._numIterationDurations = 0
+        self.recorder.reset()
 
-        # solve QP
-        res = self.solver(x0=self.w0,
-                          lbx=self.lbw,
-                          ubx=self.ubw,
-                          lbg=self.lbg,
-                          ubg=self.ubg,
-                          p=extended_parameter_values,
-                          lam_x0=self.lagrMulOptVars,
-                          lam_g0=self.lagrMulConstr)
+    def get_metadata(self) -> xr.Dataset:
+        """Returns a xarray dataset containing artifact data of this class and its member classes
 
-        # stop time
-        dt = time.time() - tick
+        Returns:
+            xr.Dataset: A xarray.Dataset
+        """
 
-        # save result as initial guess for next iteration
-        self.lagrMulConstr = np.array(res['lam_g']).ravel()
-        self.lagrMulOptVars = np.array(res['lam_x']).ravel()
+        return self.metadata_from_records(self.metadata_attributes(), *self.recorder.data())
 
-        self.w0 = np.array(res['x']).ravel()
+    def metadata_attributes(self) -> dict:
+        """Returns the static (i.e. not per control step) metadata of this controller
 
-        # save meta data
-        self.solverResults.append(res)
-        self.durations.append(dt)
+        Returns:
+            dict: A dictionary with the number of states, controls and the horizon length
+        """
 
-        return np.reshape(np.array(res['x'][-self.NU * self.M:]), (self.NU, -1), order='F')
+        return {'num_states': self.NX, 'num_controls': self.NU, 'horizon_length': self.M}
 
-    def get_metadata(self) -> xr.Dataset:
-        """Returns a xarray dataset containing artifact data of this class and its member classes
+    @staticmethod
+    def metadata_from_records(static, steps, records) -> xr.Dataset:
+        """Assembles the metadata dataset from recorded data, see :meth:`get_metadata`
+
+        Args:
+            static (dict): Static metadata as returned by :meth:`metadata_attributes`
+            steps (numpy.ndarray): Indices of the recorded control steps
+            records (dict): Recorded arrays per channel as returned by MetadataRecorder.data
 
         Returns:
             xr.Dataset: A xarray.Dataset
         """
 
+        NX, NU, M = static['num_states'], static['num_controls'], static['horizon_length']
+        solutions = records['solution']
+
         meta = {}
         meta['controller_name'] = xr.DataArray('RTI_NMPC')
-        meta['num_states'] = self.NX
-        meta['num_controls'] = self.NU
-        meta['horizon_length'] = self.M
-        meta['residuals'] = xr.DataArray([float(res['f']) for res in self.solverResults],
-                                         dims=('control_step'))
-
-        solution_state_data = np.zeros((self.NX, self.M+1, len(self.solverResults)))
-        solution_control_data = np.zeros((self.NU, self.M, len(self.solverResults)))
+        meta.update(static)
+        meta['residuals'] = xr.DataArray(records['objective'], dims=('control_step'))
 
-        for i, res in enumerate(self.solverResults):
-            solution_state_data[:,:,i] = np.reshape(res['x'][:self.NX * (self.M + 1)], (self.NX, self.M + 1), order='F')
-            solution_control_data[:,:,i] = np.reshape(res['x'][-self.NU * self.M:], (self.NU, self.M), order='F')
+        # solutions are stored as rows of [x_0, ..., x_M, u_0, ..., u_M-1]
+        solution_state_data = solutions[:, :NX * (M + 1)].reshape(
+            (-1, M + 1, NX)).transpose((2, 1, 0))
+        solution_control_data = solutions[:, NX * (M + 1):].reshape(
+            (-1, M, NU)).transpose((2, 1, 0))
 
         meta['solution_states'] = xr.DataArray(solution_state_data, dims=('state', 'control_state_horizon', 'control_step'))
         meta['solution_controls'] = xr.DataArray(solution_control_data, dims=('control', 'control_action_horizon', 'control_step'))
 
-        # here one could also add lagrange multipliers to the dataset
-        meta['computation_times'] = xr.DataArray(self.durations, dims=('control_step'))
-
-        meta_dataset = xr.Dataset(data_vars=meta)
+        meta['multipliers_variables'] = xr.DataArray(records['multipliers_variables'].T,
+                                                     dims=('solution', 'control_step'))
+        meta['multipliers_constraints'] = xr.DataArray(records['multipliers_constraints'].T,
+                                                       dims=('constraint', 'control_step'))
+        meta['computation_times'] = xr.DataArray(records['computation_time'],
+                                                 dims=('control_step'))
+        meta['preparation_times'] = xr.DataArray(records['preparation_time'],
+                                                 dims=('control_step'))
+        meta['feedback_times'] = xr.DataArray(records['feedback_time'], dims=('control_step'))
+        meta['iterations'] = xr.DataArray(records['iterations'], dims=('control_step'))
+        meta['qp_iterations'] = xr.DataArray(records['qp_iterations'], dims=('control_step'))
+        meta['deadline_missed'] = xr.DataArray(records['deadline_missed'].astype(bool),
+                                               dims=('control_step'))
+        meta['fallback'] = xr.DataArray(np.array(RtiNmpc.fallbacks)[
+            records['fallback'].astype(int)], dims=('control_step'))
+        meta['phase_times'] = xr.DataArray(records['phase_times'].T,
+                                           dims=('step_phase', 'control_step'),
+                                           coords={'step_phase': list(RtiNmpc.stepPhases)})
+        meta.update(statisticsDataArrays(records, RtiNmpc.solverPhases))
+
+        meta_dataset = xr.Dataset(data_vars=meta, coords={'control_step': steps})
 
         return meta_dataset
@@ -0,0 +1,52 @@
+import casadi as ca
+
+from ocp_modules.models.ModelBase import ModelBase
+
+
+class Chain(ModelBase):
+    """Chain of <NX>/2 unit masses connected by springs and dampers, with both ends attached
+    to walls. The state holds the positions followed by the velocities of the masses. The
+    <NU> controls are forces acting on masses spread evenly along the chain. With <nonlinear>,
+    the springs are stiffening, i.e. the force of a spring with elongation d is
+    d + stiffening * d**3.
+    """
+
+    def __init__(self, NX, NU, nonlinear=False, stiffness=1., damping=0.1, stiffening=1.):
+        if NX % 2 or NX < 2 or NU < 1 or NU > NX // 2:
+            raise ValueError('Chain requires an even number of states and 1 to NX/2 controls')
+
+        self.numMasses = NX // 2
+        self.stateLabels = ['p%d' % i for i in range(self.numMasses)] + \
+            ['v%d' % i for i in range(self.numMasses)]
+        self.controlLabels = ['f%d' % i for i in range(NU)]
+        self.nonlinear = nonlinear
+        self.stiffness = stiffness
+        self.damping = damping
+        self.stiffening = stiffening
+        self.actuated = [i * self.numMasses // NU for i in range(NU)]
+
+    def NUMSTATES(self):
+        return len(self.stateLabels)
+
+    def NUMCONTROLS(self):
+        return len(self.controlLabels)
+
+    def ode(self, currentState, controls):
+        n = self.numMasses
+        p = currentState[:n]
+        v = currentState[n:]
+
+        # elongation of the n + 1 springs, including the ones attached to the walls
+        d = ca.vertcat(p, 0) - ca.vertcat(0, p)
+        force = self.stiffness * d
+        if self.nonlinear:
+            force += self.stiffening * d ** 3
+
+        a = force[1:] - force[:-1] - self.damping * v
+        for i, mass in enumerate(self.actuated):
+            a[mass] += controls[i]
+
+        return ca.vertcat(v, a)
+
+    def getNeutralState(self):
+        return [0.] * self.NUMSTATES()
@@ -16,7 +16,11 @@ class ModelBase(ABC):
         if integratorType == 'rk':
             return ca.Function('intg', [x,u], [rk4step(ode,x,u,stepSize)])
         else:
-            return lambda x0, u: ca.integrator('intg', integratorType, modelProps, {'tf': stepSize})(x0=x0, p=u)['xf']
+            # the integrator is created once and wrapped into a function of (x, u)
+            intg = ca.integrator('intg', integratorType, modelProps, 0., stepSize)
+            x0 = ca.MX.sym('x0', NX)
+            p = ca.MX.sym('u', NU)
+            return ca.Function('intg', [x0, p], [intg(x0=x0, p=p)['xf']])
 
     @staticmethod
     def createPerturbedTimeDiscreteFun(ode, stepSize, NX, NU, integratorType='rk'):
@@ -29,7 +33,11 @@ class ModelBase(ABC):
         if integratorType == 'rk':
             return ca.Function('intg', [x,u,v], [rk4step(ode,x+v,u,stepSize)])
         else:
-            return lambda x0, u, v: ca.integrator('intg', integratorType, modelProps, {'tf': stepSize})(x0=x0+v, p=u)['xf']
+            intg = ca.integrator('intg', integratorType, modelProps, 0., stepSize)
+            x0 = ca.MX.sym('x0', NX)
+            p = ca.MX.sym('u', NU)
+            w = ca.MX.sym('v', NX)
+            return ca.Function('intg', [x0, p, w], [intg(x0=x0+w, p=p)['xf']])
 
     @staticmethod
     def createTimeContFun(ode, NX, NU):
@@ -44,16 +52,19 @@ class ModelBase(ABC):
         pass
 
     def getDiscreteLinearSystem(self, ode, xLin, uLin, samplingTime):
-        if ~hasattr(self, 'dfdx') or ~hasattr(self, 'dfdu'):
-            NX = xLin.size
-            NU = uLin.size
+        # the jacobian functions are created once per ode and evaluated at every call
+        if getattr(self, '_linearizedOde', None) != ode:
+            NX = np.size(xLin)
+            NU = np.size(uLin)
             x = ca.SX.sym('x', NX)
             u = ca.SX.sym('u', NU)
-            self.dfdx = np.array(ca.Function('dfdx', [x,u], [ca.jacobian(ode(x,u), x)])(xLin, uLin))
-            self.dfdu = np.array(ca.Function('dfdu', [x,u], [ca.jacobian(ode(x,u), u)])(xLin, uLin))
+            self._dfFun = ca.Function('df', [x, u], [ca.jacobian(ode(x, u), x),
+                                                     ca.jacobian(ode(x, u), u)])
+            self._linearizedOde = ode
 
-        A = np.eye(NX) + self.dfdx * samplingTime
-        B = self.dfdu * samplingTime
+        dfdx, dfdu = self._dfFun(xLin, uLin)
+        A = np.eye(dfdx.size1()) + np.array(dfdx) * samplingTime
+        B = np.array(dfdu) * samplingTime
         return (A, B)
 
     @classmethod
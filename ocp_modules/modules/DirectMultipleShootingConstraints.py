@@ -6,6 +6,10 @@ def gen(ocpVars, modelFun, M):
     """gen Generates the cosistency constraints emerging from applying
     direct multiple shooting to the prediction horizon discretization problem.
 
+    For MX variables (see OcpVars.gen), the constraints of all nodes are generated by
+    :func:`genMapped`, i.e. the model is a single call node instead of being repeated for every
+    node. The stacked constraints are the same.
+
     :param ocpVars: A casadi struct_symSX object with fields x and u of correct size
     :param modelFun: A function defining a continuous-time dynamic model as an ODE. Must be evaluatable symbolically.
     :param M: Prediction horizon length
@@ -13,6 +17,9 @@ def gen(ocpVars, modelFun, M):
     :returns: A list of 3-tuples where each 3-tuple has the form <(symbolic constraint expression, lower bound, upper bound)>
     """
 
+    if isinstance(ocpVars['x'], MX):
+        return genMapped(ocpVars, modelFun, M)
+
     constrList = []
 
     for i in range(M):
@@ -32,3 +39,45 @@ def gen(ocpVars, modelFun, M):
         constrList += [(g, lbg, ubg)]
 
     return constrList
+
+
+def genMapped(ocpVars, modelFun, M, parallelization='serial', maxNumThreads=1):
+    """genMapped Generates the same consistency constraints as :func:`gen`, but evaluates the
+    time-discrete model once for all shooting nodes via casadi's Function.map instead of
+    inlining a copy of the model for every node. This keeps the expression graph small, which
+    reduces the time required to build and differentiate the OCP for long horizons.
+
+    The model is embedded as a single call node, which allows to evaluate the shooting nodes
+    in parallel: 'thread' parallelizes the evaluation by casadi's virtual machine, 'openmp'
+    the evaluation in generated code (compile with -fopenmp).
+
+    :param ocpVars: A casadi struct_symSX object with fields x and u of correct size
+    :param modelFun: A function defining a time-discrete dynamic model. Must be evaluatable symbolically.
+    :param M: Prediction horizon length
+    :param parallelization: One of 'serial', 'unroll', 'thread' or 'openmp'
+    :param maxNumThreads: Maximum number of threads for parallelization 'thread'
+
+    :returns: A list with a single 3-tuple <(symbolic constraint expression, lower bound, upper bound)>
+    where the constraint expression stacks the constraints of all nodes in the order of :func:`gen`
+    """
+
+    x = ocpVars['x']
+    u = ocpVars['u']
+
+    # wrap the model into a function that is kept as a call node
+    symType = SX if isinstance(x, SX) else MX
+    x_k = symType.sym('x_k', x.shape[0])
+    u_k = symType.sym('u_k', u.shape[0])
+    nodeFun = Function('modelFun', [x_k, u_k], [modelFun(x_k, u_k)], {'never_inline': True})
+
+    if parallelization == 'thread':
+        mappedFun = nodeFun.map(M, parallelization, maxNumThreads)
+    else:
+        mappedFun = nodeFun.map(M, parallelization)
+
+    # integration has to land on the start of next block
+    g = vec(x[:, 1:M+1] - mappedFun(x[:, :M], u[:, :M]))
+    lbg = np.zeros(g.shape)
+    ubg = np.zeros(g.shape)
+
+    return [(g, lbg, ubg)]
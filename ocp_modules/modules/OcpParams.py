@@ -1,8 +1,9 @@
 import numpy as np
 import casadi as ca
 from casadi.tools import struct_symSX, entry
+from ocp_modules.modules.OcpVars import structTypes
 
-def gen(NX, NU, M):
+def gen(NX, NU, M, symType='SX'):
     """gen Generates a casadi struct containing the symbolic optimization parameters
     x_cur (the initial state), x_ref (the reference states) and u_cur (the reference controls).
     x_cur is a <NX>x<1> vector, x_ref is a <NX>x<M+1> matrix, u_ref is a <NU>x<M> matrix
@@ -10,11 +11,16 @@ def gen(NX, NU, M):
     :param NX: Number of reference state variables
     :param NU: Number of reference control variables
     :param M: Prediction horizon length
+    :param symType: Symbolic backend, 'SX' or 'MX', must match the one of OcpVars.gen
 
-    :returns: A casadi struct_symSX object
+    :returns: A casadi struct_symSX or struct_symMX object
     """
 
-    params = struct_symSX([
+    if symType not in structTypes:
+        raise ValueError('Unknown symbolic type %s, expected one of %s'
+                         % (symType, tuple(structTypes)))
+
+    params = structTypes[symType]([
         entry('x_cur', shape=NX),
         entry('x_ref', shape=(NX,M+1)),
         entry('u_ref', shape=(NU,M))])
@@ -22,6 +28,10 @@ def gen(NX, NU, M):
     return params
 
 def fill(params, valueMap):
+    if not isinstance(params, struct_symSX):
+        # the entries of an MX struct are not symbolic, they are packed by their indices
+        return ParamPacker(params).pack(valueMap).copy()
+
     paramFun = ca.Function('paramFun', [params[key] for key in valueMap.keys()], [params.cat])
     try:
         valueVec = np.array(paramFun(*valueMap.values())).ravel()
@@ -32,3 +42,70 @@ def fill(params, valueMap):
         raise re
 
     return valueVec
+
+
+class ParamPacker:
+    """ParamPacker Writes parameter values into a preallocated flat parameter vector.
+
+    The flat index layout of every entry of the parameter struct is resolved once on
+    construction, so packing values only costs a slice assignment per entry instead of
+    building a casadi Function on every call (see :func:`fill`). Entries that are not
+    passed keep their previous value, which allows to update e.g. only x_cur if the
+    reference has not changed.
+
+    Usage::
+
+        packer = OcpParams.ParamPacker(params)
+        packer.pack({'x_cur': x, 'x_ref': xRef, 'u_ref': uRef})
+        ...
+        ocpParamValues = packer.pack({'x_cur': x})  # reference unchanged
+
+    :param params: A casadi struct_symSX or struct_symMX object as returned by :func:`gen`
+    """
+
+    def __init__(self, params):
+        self.values = np.zeros((params.size,))
+        self.shapes = {}
+        self.views = {}
+        self.indices = {}
+
+        for key in params.keys():
+            shape = params[key].shape
+            idx = np.array(params.f[key], dtype=int)
+            self.shapes[key] = shape
+
+            if idx.size and (np.diff(idx) == 1).all():
+                # contiguous entry: keep a column-major view into the buffer
+                self.views[key] = self.values[idx[0]:idx[-1] + 1].reshape(shape, order='F')
+            else:
+                self.indices[key] = idx.reshape(shape, order='F')
+
+    def pack(self, valueMap):
+        """pack Writes the given values into the parameter buffer and returns it.
+
+        Values are broadcast like in :func:`fill`, i.e. a vector with as many elements as
+        the entry has rows is repeated for every column.
+
+        :param valueMap: A dictionary mapping entry names to values. Entries that are
+        not contained keep their previous values.
+
+        :returns: The flat parameter vector. Note that this is the internal buffer, which is
+        overwritten by subsequent calls; copy it if it has to be kept.
+        """
+
+        for key, value in valueMap.items():
+            value = np.asarray(value, dtype=float)
+            shape = self.shapes[key]
+            if value.ndim == 1 and value.size == shape[0]:
+                value = value.reshape((-1, 1))
+
+            try:
+                if key in self.views:
+                    self.views[key][...] = value
+                else:
+                    self.values[self.indices[key]] = value
+            except ValueError as ve:
+                raise RuntimeError('Failed to pack values of shape %s into entry %s of shape %s'
+                                   % (str(value.shape), key, str(shape))) from ve
+
+        return self.values
@@ -1,20 +1,36 @@
 import numpy as np
 import casadi as ca
-from casadi.tools import struct_symSX, struct_SX, entry
+from casadi.tools import struct_symSX, struct_symMX, struct_SX, entry
 
-def gen(NX, NU, M, stateBounds=None, controlBounds=None):
+# symbolic struct types of the SX and MX backends
+structTypes = {'SX': struct_symSX, 'MX': struct_symMX}
+
+def gen(NX, NU, M, stateBounds=None, controlBounds=None, symType='SX'):
     """gen Generates a casadi struct containing the symbolic optimization variables required
     for direct multiple shooting. x is a <NX>x<M+1> matrix, u is a <NU>x<M> matrix.
 
+    With symType 'MX', the variables are a single MX symbol. The modules generating costs and
+    constraints from the variables (e.g. DirectMultipleShootingConstraints) then build MX
+    expressions, in which models are embedded as call nodes instead of being inlined at every
+    node. This keeps build time and memory independent of the model size for large models and
+    long horizons. Both backends yield the same layout of the variables and constraints.
+
     :param NX: Number of state variables
     :param NU: Number of control variables
     :param M: Prediction horizon length
+    :param stateBounds: <2>x<NX> matrix of lower and upper state bounds, unbounded if None
+    :param controlBounds: <2>x<NU> matrix of lower and upper control bounds, unbounded if None
+    :param symType: Symbolic backend, 'SX' or 'MX'
 
-    :returns: A casadi struct_symSX object
+    :returns: A casadi struct_symSX or struct_symMX object and the lower and upper bounds
     """
 
+    if symType not in structTypes:
+        raise ValueError('Unknown symbolic type %s, expected one of %s'
+                         % (symType, tuple(structTypes)))
+
     # decision (free) variables
-    variables = struct_symSX([
+    variables = structTypes[symType]([
         entry('x', shape=(NX,M+1)),
         entry('u', shape=(NU,M))])
 
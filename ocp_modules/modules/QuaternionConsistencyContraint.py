@@ -7,6 +7,11 @@ def gen(ocpVars):
     constrList = []
     M = ocpVars['u'].shape[1]
 
+    if isinstance(ocpVars['u'], ca.MX):
+        # a single expression for all nodes, stacked like the constraints per node
+        g = ca.vec(ca.sum1(ocpVars['u'][1:5, :] ** 2)) - 1
+        return [(g, np.zeros(g.shape), np.zeros(g.shape))]
+
     for i in range(M):
         quat = ocpVars['u'][1:5, i]
 
@@ -3,21 +3,129 @@ import operator
 from casadi import *
 from casadi.tools import struct_symSX, entry
 
-def gen(vecA, vecB, weightMatrix, errorFun=None):
+def gen(vecA, vecB, weightMatrix, errorFun=None, terminalWeight=None):
     """gen Generates a cost expression based on the weighted quadratic error between the
     specified symbolic variables.
 
+    The weights can be given in several forms. Stage-wise weights apply to consecutive blocks
+    of the error vector, e.g. the states of each node of the prediction horizon. They produce
+    a cost expression and Hessian whose number of nonzeros grows linearly with the horizon
+    length (diagonal or block-diagonal instead of dense):
+
+    * A scalar: Uniform diagonal weight
+    * A vector of size <size(vecA)>: Diagonal of the weight matrix
+    * A vector of size <n>, where <size(vecA)> is a multiple of <n>: Diagonal of the weight
+      matrix of every stage
+    * A square matrix of size <n>, where <size(vecA)> is a multiple of <n>: Weight matrix of
+      every stage
+    * A list of vectors or square matrices: Weights for each stage separately
+    * A square matrix of size <size(vecA)>: Full weight matrix. Zero entries are dropped, i.e.
+      a (block-)diagonal matrix results in a (block-)diagonal Hessian as well.
+    * A casadi matrix or scipy.sparse matrix of size <size(vecA)>: Full weight matrix with
+      its own sparsity pattern
+
     :param vecA: Vector of symbolic variables
     :param vecB: Vector of symbolic variables
-    :param weightMatrix: A matrix of size <size(vecA)>x<size(vecB)>
+    :param weightMatrix: Weights in one of the forms described above
     :param errorFun: Allows to use a custom difference operator. If none (default), operator.sub is used.
+    :param terminalWeight: Optional vector or square matrix that replaces the weight of the
+    last stage. Requires stage-wise weights.
 
     :returns: A list of cost expressions
     """
 
+    errVec = _error(vecA, vecB, errorFun)
+    weights = _weights(weightMatrix, errVec.numel(), terminalWeight)
+
+    if not isinstance(weights, list):
+        return [bilin(weights, errVec, errVec)]
+
+    if all(w.ndim == 1 for w in weights):
+        # diagonal weights: weighted sum of squares
+        cost = dot(DM(np.concatenate(weights)), errVec * errVec)
+    else:
+        cost = bilin(_blockDiagonal(weights), errVec, errVec)
+
+    return [cost]
+
+def residuals(vecA, vecB, weightMatrix, errorFun=None, terminalWeight=None):
+    """residuals Generates the weighted residual of the cost expression generated by
+    :func:`gen` with the same arguments, i.e. the error vector e and the sparse weight matrix
+    W of the cost e'We. Allows to build a Gauss-Newton Hessian 2 J'WJ from the Jacobian J of
+    the residual (see the hessian argument of RtiNmpc).
+
+    :returns: A list with a tuple of the error vector and the weight matrix as casadi DM
+    """
+
+    errVec = _error(vecA, vecB, errorFun)
+    weights = _weights(weightMatrix, errVec.numel(), terminalWeight)
+    if isinstance(weights, list):
+        weights = _blockDiagonal(weights)
+
+    return [(errVec, weights)]
+
+def _error(vecA, vecB, errorFun):
     if errorFun is None:
         errorFun = operator.sub
-    errVec = errorFun(vecA, vecB)
-    cost = mtimes(mtimes(errVec.T, weightMatrix), errVec)
+    # row vectors, e.g. the controls of a single-input system, are treated as columns
+    return vec(errorFun(vecA, vecB))
 
-    return [cost]
+def _weights(weightMatrix, n, terminalWeight):
+    """_weights Returns the list of per-stage weights including the terminal weight, or the
+    full weight matrix as casadi DM.
+    """
+
+    stageWeights = _stageWeights(weightMatrix, n)
+
+    if stageWeights is None:
+        if terminalWeight is not None:
+            raise ValueError('A terminal weight requires stage-wise weights')
+        if hasattr(weightMatrix, 'tocsc'):
+            weightMatrix = DM(weightMatrix.tocsc())
+        elif isinstance(weightMatrix, np.ndarray):
+            weightMatrix = sparsify(DM(weightMatrix))
+        return weightMatrix
+
+    if terminalWeight is not None:
+        terminalWeight = np.asarray(terminalWeight, dtype=float)
+        if terminalWeight.shape[0] != stageWeights[-1].shape[0]:
+            raise ValueError('Terminal weight of size %d does not match the stage size %d'
+                             % (terminalWeight.shape[0], stageWeights[-1].shape[0]))
+        stageWeights = stageWeights[:-1] + [terminalWeight]
+
+    return stageWeights
+
+def _blockDiagonal(stageWeights):
+    """_blockDiagonal Assembles per-stage weight vectors or matrices to a sparse block-diagonal
+    weight matrix.
+    """
+
+    return diagcat(*[sparsify(DM(np.diag(w) if w.ndim == 1 else w)) for w in stageWeights])
+
+def _stageWeights(weightMatrix, n):
+    """_stageWeights Splits weights into a list of per-stage weight vectors or matrices.
+    Returns None if the weights are given as full weight matrix.
+    """
+
+    if isinstance(weightMatrix, (list, tuple)):
+        stageWeights = [np.asarray(w, dtype=float) for w in weightMatrix]
+        size = int(np.sum([w.shape[0] for w in stageWeights]))
+        if size != n:
+            raise ValueError('Stage weights cover %d elements, but the error has %d' % (size, n))
+        return stageWeights
+
+    # a scalar is a uniform diagonal weight
+    if np.isscalar(weightMatrix) or (isinstance(weightMatrix, np.ndarray) and
+                                     weightMatrix.ndim == 0):
+        return [np.full((n,), float(weightMatrix))]
+    if not isinstance(weightMatrix, np.ndarray):
+        return None
+
+    stageSize = weightMatrix.shape[0]
+    if weightMatrix.ndim == 2 and stageSize == n:
+        return None
+    if n % stageSize != 0:
+        raise ValueError('Weights of size %d do not match an error of size %d'
+                         % (stageSize, n))
+
+    return [weightMatrix.astype(float)] * (n // stageSize)
@@ -0,0 +1,117 @@
+import time
+import numpy as np
+
+from ocp_modules.modules import OcpParams
+from ocp_modules.utils.function_buffer import BufferedFunction
+
+
+class ClosedLoopSimulator:
+    """Simulates a controller in closed loop with a model of the plant.
+
+    The plant integrator is created once from the model and evaluated on preallocated buffers.
+    The state, control and timing trajectories are preallocated for <Nsim> steps and reused by
+    every call of :meth:`run`, i.e. the arrays returned by :meth:`run` are overwritten by the
+    next run. The reference windows passed to the controller are views into the reference
+    trajectories.
+
+    Controllers based on an OCP (i.e. with an attribute params, like Nmpc and RtiNmpc) are
+    passed the parameter vector with the current state and the reference windows as x_cur,
+    x_ref and u_ref, and the first column of the predicted controls is applied. Other
+    controllers are called as step(x, xRefs, uRefs) according to ControllerBase.
+
+    With <processNoise>, the plant is created by createPerturbedTimeDiscreteFun and the state
+    is perturbed by normally distributed noise before every integration step.
+
+    :param model: Model of the plant, e.g. a ModelBase
+    :param controller: A ControllerBase
+    :param samplingTime: Sampling time of the controller, i.e. the integration step size
+    :param horizonLength: Horizon length of the controller, i.e. the number of reference
+    states passed per step minus one
+    :param Nsim: Number of simulated steps
+    :param integratorType: Integrator of the plant, 'rk' or a casadi integrator plugin
+    :param processNoise: Standard deviation of the process noise per state, or None
+    :param seed: Seed of the noise generator
+    """
+
+    def __init__(self, model, controller, samplingTime, horizonLength, Nsim,
+                 integratorType='rk', processNoise=None, seed=None):
+        self.controller = controller
+        self.NX = model.NUMSTATES()
+        self.NU = model.NUMCONTROLS()
+        self.M = horizonLength
+        self.Nsim = Nsim
+
+        if processNoise is None:
+            plant = model.createTimeDiscreteFun(model.ode, samplingTime, self.NX, self.NU,
+                                                integratorType)
+        else:
+            plant = model.createPerturbedTimeDiscreteFun(model.ode, samplingTime, self.NX,
+                                                         self.NU, integratorType)
+            self.processNoise = np.asarray(processNoise, dtype=float).reshape((-1, 1))
+            self.rng = np.random.default_rng(seed)
+        self.plant = BufferedFunction(plant)
+        self._plantState, self._plantControl = [self.plant.args[name]
+                                                for name in plant.name_in()[:2]]
+        self._plantResult = self.plant.res[plant.name_out(0)]
+
+        if hasattr(controller, 'params'):
+            self.packer = OcpParams.ParamPacker(controller.params)
+        else:
+            self.packer = None
+
+        self.states = np.zeros((self.NX, Nsim + 1))
+        self.controls = np.zeros((self.NU, Nsim))
+        self.durations = np.zeros((Nsim,))
+        self.noise = np.zeros((self.NX, Nsim)) if processNoise is not None else None
+
+    def controlStep(self, x, xRefs, uRefs):
+        """controlStep Performs a control step and returns the controls for the current step.
+
+        :param x: Current state
+        :param xRefs: <NX>x<M+1> matrix of reference states
+        :param uRefs: <NU>x<M> matrix of reference controls
+        :returns: Vector of controls
+        """
+
+        if self.packer is not None:
+            ocpParamValues = self.packer.pack({'x_cur': x, 'x_ref': xRefs, 'u_ref': uRefs})
+            return self.controller.step(ocpParamValues)[:, 0]
+
+        return self.controller.step(x, xRefs, uRefs)[0]
+
+    def run(self, x0, stateRef, controlRef):
+        """run Simulates <Nsim> steps starting at <x0>.
+
+        :param x0: Initial state
+        :param stateRef: <NX>x<Nsim+M+1> matrix of reference states
+        :param controlRef: <NU>x<Nsim+M> matrix of reference controls
+        :returns: A 3-tuple (states, controls, durations) of the <NX>x<Nsim+1> state
+        trajectory, the <NU>x<Nsim> control trajectory and the computation times of the
+        controller per step in seconds
+        """
+
+        if stateRef.shape[1] < self.Nsim + self.M + 1 or controlRef.shape[1] < self.Nsim + self.M:
+            raise ValueError('References must cover %d states and %d controls'
+                             % (self.Nsim + self.M + 1, self.Nsim + self.M))
+
+        if self.noise is not None:
+            self.rng.standard_normal(out=self.noise)
+            self.noise *= self.processNoise
+            perturbation = self.plant.args[self.plant.function.name_in(2)]
+
+        self.states[:, 0] = x0
+        for i in range(self.Nsim):
+            tick = time.perf_counter()
+            self.controls[:, i] = self.controlStep(self.states[:, i],
+                                                   stateRef[:, i:i + self.M + 1],
+                                                   controlRef[:, i:i + self.M])
+            self.durations[i] = time.perf_counter() - tick
+
+            np.copyto(self._plantState, self.states[:, i])
+            np.copyto(self._plantControl, self.controls[:, i])
+            if self.noise is not None:
+                np.copyto(perturbation, self.noise[:, i])
+            self.plant()
+            self.states[:, i + 1] = self._plantResult
+
+        return self.states, self.controls, self.durations
@@ -0,0 +1,355 @@
+import numpy as np
+import casadi as ca
+import scipy.sparse
+
+
+def stateDefinitions(A, eq, NX, NU, M):
+    """stateDefinitions Finds the row of the constraint Jacobian that defines each state of the
+    decision variable vector [x_0, ..., x_M, u_0, ..., u_M-1], i.e. an equality constraint
+    that depends on the state x_k,i, but on no other state of stage k and otherwise only on
+    the states and controls of stage k-1 (e.g. the multiple shooting constraint
+    x_k+1 - f(x_k, u_k) or the initial value constraint x_0 - x_cur).
+
+    :param A: casadi Sparsity of the constraint Jacobian
+    :param eq: Boolean array marking the equality constraints
+    :param NX: Number of states
+    :param NU: Number of controls
+    :param M: Horizon length
+    :returns: An array of shape <M+1>x<NX> with the defining row of every state
+
+    :raises ValueError: If a state has no defining row
+    """
+
+    numStateVars = NX * (M + 1)
+    rows, columns = A.get_triplet()
+    rowColumns = [[] for _ in range(A.size1())]
+    for row, column in zip(rows, columns):
+        rowColumns[row].append(column)
+
+    definitions = -np.ones((M + 1, NX), dtype=int)
+    for row, cols in enumerate(rowColumns):
+        if not eq[row] or not cols:
+            continue
+        stateCols = [c for c in cols if c < numStateVars]
+        if not stateCols:
+            continue
+        stage = max(stateCols) // NX
+        defined = [c for c in stateCols if c // NX == stage]
+        previous = set(range(NX * (stage - 1), NX * stage)) | set(
+            range(numStateVars + NU * (stage - 1), numStateVars + NU * stage)) \
+            if stage > 0 else set()
+        if len(defined) == 1 and set(cols) - set(defined) <= previous and \
+                definitions[stage, defined[0] % NX] < 0:
+            definitions[stage, defined[0] % NX] = row
+
+    if (definitions < 0).any():
+        stage, index = np.argwhere(definitions < 0)[0]
+        raise ValueError('Condensing requires a defining equality constraint for every state, '
+                         'found none for state %d of stage %d' % (index, stage))
+
+    return definitions
+
+
+def definitionBlocks(A, definitions, NX, NU, M):
+    """definitionBlocks Returns the nonzero indices of the blocks of the defining constraints
+    of each stage (see :func:`stateDefinitions`)
+
+        D_k x_k + E_k x_k-1 + F_k u_k-1 = b_k
+
+    with diagonal D_k. Structural zeros point to the element after the last nonzero of A, i.e.
+    the blocks are gathered from the nonzeros extended by a zero.
+
+    :param A: casadi Sparsity of the constraint Jacobian
+    :param definitions: Defining rows as returned by :func:`stateDefinitions`
+    :param NX: Number of states
+    :param NU: Number of controls
+    :param M: Horizon length
+    :returns: A 3-tuple of index arrays of shape <M+1>x<NX>, <M+1>x<NX>x<NX> and
+    <M+1>x<NX>x<NU>. The blocks E_0 and F_0 are meaningless.
+    """
+
+    def nonzeros(rows, columns):
+        rows, columns = np.broadcast_arrays(rows, columns)
+        index = np.array([A.get_nz(int(r), int(c)) for r, c in
+                          zip(rows.ravel(), columns.ravel())], dtype=int).reshape(rows.shape)
+        index[index < 0] = A.nnz()
+        return index
+
+    stages = np.arange(M + 1)[:, None, None]
+    rows = definitions[:, :, None]
+    return (nonzeros(definitions, NX * stages[:, :, 0] + np.arange(NX)),
+            nonzeros(rows, NX * np.maximum(stages - 1, 0) + np.arange(NX)),
+            nonzeros(rows, NX * (M + 1) + NU * np.maximum(stages - 1, 0) + np.arange(NU)))
+
+
+class Condensing:
+    """Eliminates the states from the QP of a multiple shooting OCP in the variables
+    w = [x_0, ..., x_M, u_0, ..., u_M-1]:
+
+        min 1/2 w'Hw + g'w   s.t.  lba <= Aw <= uba,  lbx <= w <= ubx
+
+    Every state must be defined by an equality constraint in terms of the states and controls
+    of the previous stage, like the initial value and multiple shooting constraints. These
+    constraints are solved for the states by a forward recursion over the stages, which
+    expresses the QP in the remaining variables z. With full condensing, z holds the
+    controls only and the QP is dense. With partial condensing, the states at the start of
+    every block of <blockSize> stages are kept, together with their defining constraints, such
+    that the QP stays sparse but has fewer variables. Bounds of eliminated states become
+    general constraints.
+
+    The condensing is split like the RTI steps: :meth:`prepare` condenses the QP data and its
+    sensitivity with respect to the current state, which enters the constraint offsets, and
+    :meth:`feedback` updates the condensed QP for the actual state at the cost of a few
+    matrix-vector products. After solving, :meth:`expand` recovers the full primal-dual
+    solution, including the multipliers of the eliminated constraints.
+
+    The QP data is read from and the condensed QP written to preallocated buffers, whose
+    nonzeros match the casadi sparsities of the QPs.
+
+    :param hSparsity: casadi Sparsity of H
+    :param aSparsity: casadi Sparsity of A
+    :param dg0dxSparsity: casadi Sparsity of the derivative of the constraint offsets with
+    respect to the current state
+    :param lbg: Lower bounds of the constraints
+    :param ubg: Upper bounds of the constraints
+    :param lbw: Lower bounds of the decision variables
+    :param ubw: Upper bounds of the decision variables
+    :param NX: Number of states
+    :param NU: Number of controls
+    :param M: Horizon length
+    :param blockSize: Number of stages per block, None for full condensing
+    """
+
+    def __init__(self, hSparsity, aSparsity, dg0dxSparsity, lbg, ubg, lbw, ubw, NX, NU, M,
+                 blockSize=None):
+        lbg = np.array(lbg, dtype=float).ravel()
+        ubg = np.array(ubg, dtype=float).ravel()
+        lbw = np.array(lbw, dtype=float).ravel()
+        ubw = np.array(ubw, dtype=float).ravel()
+        if blockSize is not None and blockSize < 1:
+            raise ValueError('The block size of partial condensing must be positive')
+
+        self.NX, self.NU, self.M = NX, NU, M
+        nw = NX * (M + 1) + NU * M
+        ng = lbg.size
+        self._nw, self._ng = nw, ng
+        eq = np.isfinite(lbg) & (lbg == ubg)
+        definitions = stateDefinitions(aSparsity, eq, NX, NU, M)
+
+        # the states of every <blockSize>-th stage are kept, except for the initial state
+        keptStages = [] if blockSize is None else list(range(blockSize, M, blockSize))
+        self._eliminatedStages = [k for k in range(M + 1) if k not in keptStages]
+        self._eliminatedSet = set(self._eliminatedStages)
+        keptStates = np.array([NX * k + i for k in keptStages for i in range(NX)], dtype=int)
+        self._zColumns = np.concatenate((keptStates, np.arange(NX * (M + 1), nw)))
+        nz = self._zColumns.size
+        eliminatedRows = definitions[self._eliminatedStages].ravel()
+        self._rows = np.setdiff1d(np.arange(ng), eliminatedRows)
+        eliminated = np.setdiff1d(np.arange(NX * (M + 1)), keptStates)
+        self._boundedStates = eliminated[np.isfinite(lbw[eliminated]) |
+                                         np.isfinite(ubw[eliminated])]
+        self._definitions = definitions
+
+        # sparse matrices of the QP data, their nonzeros are updated in place
+        self._H = self._sparse(hSparsity)
+        self._A = self._sparse(aSparsity)
+        self._a = np.zeros((aSparsity.nnz() + 1,))
+        self._g = np.zeros((nw,))
+        self._g0 = np.zeros((ng,))
+        self._dg0dxRows, self._dg0dxColumns = (np.array(i, dtype=int)
+                                               for i in dg0dxSparsity.get_triplet())
+        self._dg0dx = np.zeros((ng, NX))
+        self._lbg, self._ubg = lbg, ubg
+
+        # blocks D_k x_k + E_k x_k-1 + F_k u_k-1 = b_k of the defining constraints
+        self._nzD, self._nzE, self._nzF = definitionBlocks(aSparsity, definitions, NX, NU, M)
+
+        # affine map of the prepared QP: w = Wz z + Sx dx + wt, where dx is the difference of
+        # the current state and the state the QP was prepared for, as columns [Wz, Sx, wt]
+        self._Y = np.zeros((nw, nz + NX + 1))
+        self._Y[self._zColumns, np.arange(nz)] = 1.
+        self._Wz = self._Y[:, :nz]
+        self._Sx = self._Y[:, nz:nz + NX]
+        self._wt = self._Y[:, -1]
+
+        # sparsity of the condensed QP, derived from the structure of the recursion
+        pattern = np.zeros((nw, nz))
+        pattern[self._zColumns, np.arange(nz)] = 1.
+        for k in self._eliminatedStages:
+            if k > 0:
+                _, E, F = self._blocks(np.ones((aSparsity.nnz(),)), k)
+                pattern[NX * k:NX * (k + 1)] = E @ pattern[NX * (k - 1):NX * k] + \
+                    F @ pattern[NX * (M + 1) + NU * (k - 1):NX * (M + 1) + NU * k]
+        H = self._sparse(hSparsity, 1.)
+        A = self._sparse(aSparsity, 1.)
+        hPattern = pattern.T @ (H @ pattern)
+        aPattern = np.vstack(((A @ pattern)[self._rows], pattern[self._boundedStates]))
+        self.hSparsity = ca.Sparsity.triplet(nz, nz, *np.nonzero(hPattern))
+        self.aSparsity = ca.Sparsity.triplet(*aPattern.shape, *np.nonzero(aPattern))
+        self._hIndices = tuple(np.array(i, dtype=int) for i in self.hSparsity.get_triplet())
+        self._aIndices = tuple(np.array(i, dtype=int) for i in self.aSparsity.get_triplet())
+
+        # buffers of the condensed QP
+        numRows = self._rows.size + self._boundedStates.size
+        self.qp = {'h': np.zeros((self.hSparsity.nnz(),)), 'g': np.zeros((nz,)),
+                   'a': np.zeros((self.aSparsity.nnz(),)), 'lba': np.zeros((numRows,)),
+                   'uba': np.zeros((numRows,)), 'lbx': lbw[self._zColumns],
+                   'ubx': ubw[self._zColumns]}
+        self._gPrepared = np.zeros((nz,))
+        self._gx = np.zeros((nz, NX))
+        self._lbaPrepared = np.zeros((numRows,))
+        self._ubaPrepared = np.zeros((numRows,))
+        self._ax = np.zeros((numRows, NX))
+        self._lbb = lbw[self._boundedStates]
+        self._ubb = ubw[self._boundedStates]
+        self._dx = np.zeros((NX,))
+        self._lamA = np.zeros((ng,))
+        self._residual = np.zeros((nw,))
+
+    @staticmethod
+    def _sparse(sparsity, value=0.):
+        return scipy.sparse.csc_matrix((np.full((sparsity.nnz(),), value), sparsity.row(),
+                                        sparsity.colind()), shape=sparsity.shape)
+
+    @property
+    def size(self):
+        """Number of variables of the condensed QP."""
+        return self._zColumns.size
+
+    def _blocks(self, a, k):
+        # the blocks D_k (diagonal), E_k and F_k of the defining constraints of stage k
+        a = np.append(a, 0.)
+        return a[self._nzD[k]], a[self._nzE[k]], a[self._nzF[k]]
+
+    def prepare(self, h, g, a, g0, dg0dx):
+        """prepare Condenses the QP data evaluated for the prepared state.
+
+        :param h: Nonzeros of H
+        :param g: Gradient g
+        :param a: Nonzeros of A
+        :param g0: Constraint offsets, i.e. the bounds are lbg - g0 and ubg - g0
+        :param dg0dx: Nonzeros of the derivative of g0 with respect to the current state
+        """
+
+        NX, NU, M = self.NX, self.NU, self.M
+        nz = self.size
+        np.copyto(self._H.data, h)
+        np.copyto(self._A.data, a)
+        np.copyto(self._a[:-1], a)
+        np.copyto(self._g, g)
+        np.copyto(self._g0, g0)
+        self._dg0dx[self._dg0dxRows, self._dg0dxColumns] = dg0dx
+
+        # forward recursion x_k = (b_k - E_k x_k-1 - F_k u_k-1) / D_k, where the bounds b_k of
+        # the defining constraints depend on the state via -dg0dx
+        D = self._a[self._nzD]
+        E = self._a[self._nzE]
+        F = self._a[self._nzF]
+        Y = self._Y
+        numStateVars = NX * (M + 1)
+        for k in self._eliminatedStages:
+            rows = self._definitions[k]
+            x = Y[NX * k:NX * (k + 1)]
+            if k > 0:
+                np.matmul(E[k], Y[NX * (k - 1):NX * k], out=x)
+                x += F[k] @ Y[numStateVars + NU * (k - 1):numStateVars + NU * k]
+                np.negative(x, out=x)
+            else:
+                x.fill(0.)
+            x[:, nz:nz + NX] -= self._dg0dx[rows]
+            x[:, -1] += self._lbg[rows] - self._g0[rows]
+            x /= D[k][:, None]
+
+        # condensed Hessian, gradient and constraints, with their sensitivities
+        Q = self._Wz.T @ (self._H @ Y)
+        hc = Q[:, :nz]
+        np.copyto(self._gx, Q[:, nz:nz + NX])
+        np.add(Q[:, -1], self._Wz.T @ self._g, out=self._gPrepared)
+
+        AY = self._A @ Y
+        numRows = self._rows.size
+        ac = np.vstack((AY[self._rows, :nz], self._Wz[self._boundedStates]))
+        offset = self._g0[self._rows] + AY[self._rows, -1]
+        np.subtract(self._lbg[self._rows], offset, out=self._lbaPrepared[:numRows])
+        np.subtract(self._ubg[self._rows], offset, out=self._ubaPrepared[:numRows])
+        np.subtract(self._lbb, self._wt[self._boundedStates], out=self._lbaPrepared[numRows:])
+        np.subtract(self._ubb, self._wt[self._boundedStates], out=self._ubaPrepared[numRows:])
+        np.add(self._dg0dx[self._rows], AY[self._rows, nz:nz + NX], out=self._ax[:numRows])
+        np.copyto(self._ax[numRows:], self._Sx[self._boundedStates])
+        np.negative(self._ax, out=self._ax)
+
+        self.qp['h'][:] = hc[self._hIndices]
+        self.qp['a'][:] = ac[self._aIndices]
+
+    def feedback(self, dx):
+        """feedback Updates the gradient and constraint bounds of the condensed QP for the
+        current state.
+
+        :param dx: Difference of the current state and the state the QP was prepared for
+        """
+
+        np.copyto(self._dx, dx)
+        np.matmul(self._gx, self._dx, out=self.qp['g'])
+        self.qp['g'] += self._gPrepared
+        np.matmul(self._ax, self._dx, out=self.qp['uba'])
+        np.add(self._lbaPrepared, self.qp['uba'], out=self.qp['lba'])
+        self.qp['uba'] += self._ubaPrepared
+
+    def reduce(self, w, lamX, lamA, z, lamZ, lamC):
+        """reduce Extracts the warm start of the condensed QP from a full primal-dual iterate.
+
+        :param w: Decision variables
+        :param lamX: Bound multipliers
+        :param lamA: Constraint multipliers
+        :param z: Output buffer of the condensed variables
+        :param lamZ: Output buffer of the condensed bound multipliers
+        :param lamC: Output buffer of the condensed constraint multipliers
+        """
+
+        numRows = self._rows.size
+        np.take(w, self._zColumns, out=z)
+        np.take(lamX, self._zColumns, out=lamZ)
+        np.take(lamA, self._rows, out=lamC[:numRows])
+        np.take(lamX, self._boundedStates, out=lamC[numRows:])
+
+    def expand(self, z, lamZ, lamC, w, lamX, lamA):
+        """expand Recovers the solution of the full QP from the solution of the condensed QP.
+
+        :param z: Solution of the condensed QP
+        :param lamZ: Bound multipliers of the condensed QP
+        :param lamC: Constraint multipliers of the condensed QP
+        :param w: Output buffer of the decision variables
+        :param lamX: Output buffer of the bound multipliers
+        :param lamA: Output buffer of the constraint multipliers
+        :returns: The objective 1/2 w'Hw + g'w of the full QP
+        """
+
+        NX, M = self.NX, self.M
+        numRows = self._rows.size
+        np.matmul(self._Sx, self._dx, out=w)
+        w += self._wt
+        w += self._Wz @ z
+
+        lamX.fill(0.)
+        lamX[self._zColumns] = lamZ
+        lamX[self._boundedStates] = lamC[numRows:]
+        lamA.fill(0.)
+        lamA[self._rows] = lamC[:numRows]
+
+        # the multipliers of the eliminated constraints follow from stationarity with respect
+        # to the eliminated states, Hw + g + A'lamA + lamX = 0, by a backward recursion
+        Hw = self._H @ w
+        objective = 0.5 * w @ Hw + self._g @ w
+        residual = self._residual
+        np.add(Hw, self._g, out=residual)
+        residual += self._A.T @ lamA
+        residual += lamX
+        D = self._a[self._nzD]
+        E = self._a[self._nzE]
+        for k in reversed(self._eliminatedStages):
+            r = -residual[NX * k:NX * (k + 1)]
+            if k < M and k + 1 in self._eliminatedSet:
+                r -= E[k + 1].T @ lamA[self._definitions[k + 1]]
+            lamA[self._definitions[k]] = r / D[k]
+
+        return objective
@@ -0,0 +1,62 @@
+import numpy as np
+
+
+class BufferedFunction:
+    """Evaluates a casadi Function on preallocated NumPy buffers.
+
+    The Function is bound once to one buffer per input and output via casadi's buffer API.
+    Evaluating it neither matches arguments by name nor converts them, and allocates no Python
+    objects. Buffers hold the nonzeros of the respective input or output, i.e. a dense vector
+    for dense inputs and the column-major nonzeros for sparse matrices. Buffers can be shared
+    between functions, e.g. an output of one function can be bound as input of another one.
+
+    :param function: casadi Function
+    """
+
+    def __init__(self, function):
+        self.function = function
+        self._buffer, self._eval = function.buffer()
+        self.args = {}
+        self.res = {}
+
+        for i, name in enumerate(function.name_in()):
+            self.bindArg(name, np.zeros((function.nnz_in(i),)))
+        for i, name in enumerate(function.name_out()):
+            self.bindRes(name, np.zeros((function.nnz_out(i),)))
+
+    def _check(self, array, nnz, name):
+        if array.dtype != np.float64 or not array.flags.c_contiguous or array.size != nnz:
+            raise ValueError('Buffer for %s must be a contiguous float64 array with %d elements'
+                             % (name, nnz))
+
+    def bindArg(self, name, array):
+        """bindArg Uses <array> as buffer of input <name>. The array is not copied, i.e. the
+        function evaluates its current content.
+        """
+
+        index = self.function.index_in(name)
+        self._check(array, self.function.nnz_in(index), name)
+        self._buffer.set_arg(index, memoryview(array))
+        self.args[name] = array
+
+    def bindRes(self, name, array):
+        """bindRes Uses <array> as buffer of output <name>, which is overwritten by every
+        evaluation.
+        """
+
+        index = self.function.index_out(name)
+        self._check(array, self.function.nnz_out(index), name)
+        self._buffer.set_res(index, memoryview(array))
+        self.res[name] = array
+
+    def __call__(self):
+        """__call__ Evaluates the function on the current input buffers. Raises a RuntimeError
+        like a regular call of the function if the evaluation fails.
+        """
+
+        self._eval()
+
+    def stats(self):
+        """stats Returns the statistics of the last evaluation, see casadi.Function.stats."""
+
+        return self._buffer.stats()
@@ -0,0 +1,50 @@
+import itertools
+import numpy as np
+
+
+class GridInterpolation:
+    """Computes the corner indices and weights required to linearly interpolate values stored
+    on a rectilinear grid at arbitrary query points. Everything that only depends on the grid
+    is precomputed on construction. Queries outside of the grid are clamped to its boundary.
+
+    :param axes: A sequence of d strictly increasing 1D arrays spanning the grid
+    """
+
+    def __init__(self, axes):
+        self.axes = [np.asarray(ax, dtype=float) for ax in axes]
+        self.shape = tuple(ax.size for ax in self.axes)
+
+        # offsets of the 2^d corners of a grid cell and strides of the flat (C-order) index
+        self.offsets = np.array(list(itertools.product((0, 1), repeat=len(self.axes))),
+                                dtype=int)
+        self.strides = np.array([int(np.prod(self.shape[j + 1:])) for j in range(len(self.axes))],
+                                dtype=int)
+        self.upper = np.array(self.shape, dtype=int) - 1
+
+    def weights(self, points):
+        """weights Computes corner indices and interpolation weights for the given points.
+
+        :param points: A <N>x<d> matrix of query points
+
+        :returns: A 2-tuple (indices, weights) of <N>x<2^d> matrices. indices are flat (C-order)
+        indices of the grid points enclosing each query point, weights the interpolation
+        weights, i.e. an interpolated value is np.sum(weights[..., None] * values[indices], 1)
+        """
+
+        points = np.atleast_2d(points)
+        lower = np.zeros(points.shape, dtype=int)
+        frac = np.zeros(points.shape)
+
+        for j, ax in enumerate(self.axes):
+            if ax.size == 1:
+                continue
+            p = np.minimum(np.maximum(points[:, j], ax[0]), ax[-1])
+            idx = np.minimum(np.searchsorted(ax, p, side='right') - 1, ax.size - 2)
+            lower[:, j] = idx
+            frac[:, j] = (p - ax[idx]) / (ax[idx + 1] - ax[idx])
+
+        corners = np.minimum(lower[:, None, :] + self.offsets, self.upper)
+        indices = corners @ self.strides
+        weights = np.where(self.offsets == 1, frac[:, None, :], 1. - frac[:, None, :]).prod(-1)
+
+        return indices, weights
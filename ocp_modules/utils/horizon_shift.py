@@ -0,0 +1,90 @@
+import numpy as np
+import casadi as ca
+
+
+def _columnLabels(NX, NU, M):
+    """_columnLabels Returns the kind (0: state, 1: control), the stage and the index within the
+    stage of each element of the decision variable vector [x_0, ..., x_M, u_0, ..., u_M-1].
+    """
+
+    numStateVars = NX * (M + 1)
+    columns = np.arange(numStateVars + NU * M)
+    isControl = columns >= numStateVars
+    stage = np.where(isControl, (columns - numStateVars) // NU, columns // NX)
+    index = np.where(isControl, (columns - numStateVars) % NU, columns % NX)
+
+    return isControl.astype(int), stage, index
+
+
+def primalShiftIndices(NX, NU, M):
+    """primalShiftIndices Returns indices that shift the decision variable vector
+    [x_0, ..., x_M, u_0, ..., u_M-1] by one stage, i.e. w[indices] is
+    [x_1, ..., x_M, x_M, u_1, ..., u_M-1, u_M-1]. The indices apply to the bound multipliers
+    as well.
+
+    :param NX: Number of states
+    :param NU: Number of controls
+    :param M: Horizon length
+
+    :returns: An integer array of the size of the decision variable vector
+    """
+
+    isControl, stage, index = _columnLabels(NX, NU, M)
+
+    return np.where(isControl,
+                    NX * (M + 1) + NU * np.minimum(stage + 1, M - 1) + index,
+                    NX * np.minimum(stage + 1, M) + index)
+
+
+def constraintShiftIndices(constraints, w, NX, NU, M):
+    """constraintShiftIndices Returns indices that shift the constraint multipliers by one
+    stage, i.e. lam_g[indices] is the shifted vector.
+
+    The stage of a constraint row is the first stage of the decision variables it depends on,
+    e.g. k for the multiple shooting constraint x_k+1 - f(x_k, u_k). A row of stage k takes the
+    multiplier of the row of stage k+1 that has the same sparsity pattern relative to its stage
+    and the same position among the rows of its stage within its constraint expression. This
+    works for constraint expressions per stage as well as for expressions covering all stages
+    (e.g. DirectMultipleShootingConstraints.genMapped). Rows without such a successor (e.g.
+    initial value or terminal constraints) keep their multiplier.
+
+    :param constraints: List of symbolic constraint expressions, in the order they are stacked
+    :param w: Symbolic decision variable vector [x_0, ..., x_M, u_0, ..., u_M-1]
+    :param NX: Number of states
+    :param NU: Number of controls
+    :param M: Horizon length
+
+    :returns: An integer array of the size of the stacked constraints
+    """
+
+    expressions = np.concatenate([np.zeros((0,), dtype=int)] + [
+        np.repeat(i, c.numel()) for i, c in enumerate(constraints)])
+    numRows = expressions.size
+    rows, columns = ca.jacobian(ca.vertcat(*[ca.vec(c) for c in constraints]), w).sparsity() \
+        .get_triplet()
+
+    isControl, stage, index = _columnLabels(NX, NU, M)
+    rowColumns = [[] for _ in range(numRows)]
+    for row, column in zip(rows, columns):
+        rowColumns[row].append(column)
+
+    # group rows by stage and signature, keeping their order
+    rowKeys = []
+    rowsPerKey = {}
+    rowsPerStage = {}
+    for row in range(numRows):
+        rowStage = min((stage[c] for c in rowColumns[row]), default=0)
+        position = rowsPerStage.get((expressions[row], rowStage), 0)
+        rowsPerStage[(expressions[row], rowStage)] = position + 1
+        signature = (position,) + tuple(sorted(
+            (isControl[c], stage[c] - rowStage, index[c]) for c in rowColumns[row]))
+        rowsPerKey.setdefault((rowStage, signature), []).append(row)
+        rowKeys.append((rowStage, signature, len(rowsPerKey[(rowStage, signature)]) - 1))
+
+    indices = np.arange(numRows)
+    for row, (rowStage, signature, occurrence) in enumerate(rowKeys):
+        successors = rowsPerKey.get((rowStage + 1, signature), [])
+        if occurrence < len(successors):
+            indices[row] = successors[occurrence]
+
+    return indices
@@ -0,0 +1,121 @@
+import casadi as ca
+import numpy as np
+
+from ocp_modules.utils.function_buffer import BufferedFunction
+
+
+class Linearization:
+    """Evaluates the linearization x+ = A x + B u of a time-discrete model around operating
+    points.
+
+    The Jacobian of the discrete model function with respect to its state and controls is
+    built once into a single casadi Function, which returns both A and B. Since it is derived
+    from the discrete model function, A and B are exact for the integrator the function is
+    based on (e.g. RK4 or a casadi integrator, see ModelBase.createTimeDiscreteFun), unlike the
+    Euler approximation of ModelBase.getDiscreteLinearSystem. Single operating points are
+    evaluated on preallocated buffers (see BufferedFunction), batches of operating points via
+    a mapped Function.
+
+    The Function can be JIT-compiled by casadi (<jit>) or compiled via a SolverCache, which
+    keeps the compiled library across processes.
+
+    :param discreteFun: casadi Function (x, u) -> x+ of the time-discrete model
+    :param jit: JIT-compiles the Function
+    :param jitOptions: Options of the JIT compiler, e.g. {'flags': ['-O3']}
+    :param solverCache: Optional SolverCache the compiled Function is loaded from
+    :param parallelization: Parallelization of batches, one of casadi's map modes 'serial',
+    'openmp' or 'thread'
+    """
+
+    def __init__(self, discreteFun, jit=False, jitOptions=None, solverCache=None,
+                 parallelization='serial'):
+        self.NX = discreteFun.size1_in(0)
+        self.NU = discreteFun.size1_in(1)
+        self.parallelization = parallelization
+
+        # SX functions (e.g. RK4) are linearized symbolically, casadi integrators via MX
+        sym = ca.SX if discreteFun.is_a('SXFunction') else ca.MX
+        x = sym.sym('x', self.NX)
+        u = sym.sym('u', self.NU)
+        xNext = discreteFun(x, u)
+        jac = ca.densify(ca.jacobian(xNext, ca.vertcat(x, u)))
+
+        opts = {}
+        if jit:
+            opts = {'jit': True, 'compiler': 'shell',
+                    'jit_options': jitOptions or {'flags': ['-O2']}}
+        self.function = ca.Function('linearization', [x, u], [xNext, jac], ['x', 'u'],
+                                    ['x_next', 'jac'], opts)
+        if solverCache is not None:
+            self.function = solverCache.function(self.function)
+
+        self._buffer = BufferedFunction(self.function)
+        # column-major views into the dense Jacobian [A, B]
+        jac = self._buffer.res['jac'].reshape((self.NX, self.NX + self.NU), order='F')
+        self.A = jac[:, :self.NX]
+        self.B = jac[:, self.NX:]
+        self._batchFunctions = {}
+
+    @classmethod
+    def fromModel(cls, model, samplingTime, integratorType='rk', **kwargs):
+        """fromModel Creates the linearization of a model discretized by
+        ModelBase.createTimeDiscreteFun.
+
+        :param model: Model, e.g. a ModelBase
+        :param samplingTime: Step size of the integrator
+        :param integratorType: 'rk' or a casadi integrator plugin, e.g. 'cvodes'
+        :param kwargs: Further arguments of the constructor
+        :returns: A Linearization object
+        """
+        NX = model.NUMSTATES()
+        NU = model.NUMCONTROLS()
+        return cls(model.createTimeDiscreteFun(model.ode, samplingTime, NX, NU, integratorType),
+                   **kwargs)
+
+    def __call__(self, xOp, uOp):
+        """__call__ Linearizes the model around an operating point.
+
+        :param xOp: State of the operating point
+        :param uOp: Controls of the operating point
+        :returns: A 2-tuple (A, B). The matrices are views into the output buffer, which is
+        overwritten by the next call.
+        """
+        self._buffer.args['x'][:] = np.ravel(xOp)
+        self._buffer.args['u'][:] = np.ravel(uOp)
+        self._buffer()
+        return self.A, self.B
+
+    def nextState(self):
+        """nextState Returns the successor state of the operating point of the last call, i.e.
+        the value of the discrete model the linearization is taken at.
+        """
+        return self._buffer.res['x_next']
+
+    def batch(self, xOps, uOps):
+        """batch Linearizes the model around several operating points in a single call.
+
+        :param xOps: <NX>x<N> matrix whose columns are the states of the operating points
+        :param uOps: <NU>x<N> matrix whose columns are the controls of the operating points
+        :returns: A 2-tuple (A, B) of arrays of shape <N>x<NX>x<NX> and <N>x<NX>x<NU>. The
+        arrays are views into an output buffer, which is overwritten by the next batch of the
+        same size.
+        """
+        xOps = np.reshape(xOps, (self.NX, -1))
+        uOps = np.reshape(uOps, (self.NU, -1))
+        N = xOps.shape[1]
+        if uOps.shape[1] != N:
+            raise ValueError('Got %d states but %d controls' % (N, uOps.shape[1]))
+
+        # mapped functions are built once per batch size and bound to buffers
+        if N not in self._batchFunctions:
+            self._batchFunctions[N] = BufferedFunction(
+                self.function.map(N, self.parallelization))
+        buffer = self._batchFunctions[N]
+        buffer.args['x'][:] = xOps.ravel(order='F')
+        buffer.args['u'][:] = uOps.ravel(order='F')
+        buffer()
+
+        # the Jacobians of the operating points are concatenated horizontally
+        jac = buffer.res['jac'].reshape((self.NX, self.NX + self.NU, N), order='F')
+        jac = jac.transpose((2, 0, 1))
+        return jac[:, :, :self.NX], jac[:, :, self.NX:]
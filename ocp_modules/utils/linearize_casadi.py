@@ -1,16 +1,66 @@
 import casadi as ca
 
-def linearize_casadi(f,x,xLinPoint):
+linearizationModes = ('jacobian', 'jtimes')
+
+def valueAndJacobian(f, x):
+    """valueAndJacobian Returns a symbolic casadi expression and its Jacobian, with the common
+    subexpressions of both eliminated, i.e. an evaluation computes them in a single pass. The
+    Jacobian keeps its structural sparsity pattern.
+
+    :param f: Expression to be differentiated
+    :param x: Input variable of f
+    :returns: A 2-tuple of f and the Jacobian of vec(f) with respect to vec(x)
+    """
+
+    value, jac = ca.cse([f, ca.jacobian(f, x)])
+    return value, jac
+
+def linearize_casadi(f, x, xLinPoint=None, mode='jacobian', asFunction=False, jit=False,
+                     jitOptions=None):
     """linearize_casadi Returns the first order approximation of a symbolic casadi expression.
 
+    The value and the derivative at the linearization point are built in one pass with shared
+    subexpressions. In mode 'jacobian', the approximation is f(xLinPoint) + J (x - xLinPoint)
+    with the sparse Jacobian J, i.e. only its structural nonzeros enter the product. In mode
+    'jtimes', the Jacobian is not formed, but the product is a forward directional derivative
+    along x - xLinPoint, which is cheaper if f has many outputs or a dense Jacobian.
+
     :param f: Function to be linearized
     :param x: Input variable of f
-    :param xLinPoint: Linearization point
+    :param xLinPoint: Linearization point, a new symbol of the shape of x if None
+    :param mode: 'jacobian' or 'jtimes'
+    :param asFunction: Returns a casadi Function (x, x_lin) -> f_lin instead of an expression.
+    Requires f to depend on x only and xLinPoint to be purely symbolic.
+    :param jit: JIT-compiles the Function
+    :param jitOptions: Options of the JIT compiler, e.g. {'flags': ['-O3']}
+    :returns: The linearization as expression of x and xLinPoint, or as Function
     """
 
-    fLinFun = ca.Function('fLinFun', [x], [f])
-    fJacFun = ca.Function('fJacFun', [x], [ca.jacobian(f,x)])
-    return fLinFun(xLinPoint) + ca.mtimes(fJacFun(xLinPoint),(x - xLinPoint))
+    if mode not in linearizationModes:
+        raise ValueError('Unknown linearization mode %s, expected one of %s'
+                         % (mode, linearizationModes))
+    if xLinPoint is None:
+        xLinPoint = type(x).sym('xLinPoint', x.sparsity())
+
+    dx = x - xLinPoint
+    if mode == 'jacobian':
+        value, jac = valueAndJacobian(f, x)
+        value, jac = ca.substitute([value, jac], [x], [xLinPoint])
+        product = ca.reshape(ca.mtimes(jac, ca.vec(dx)), f.shape)
+    else:
+        direction = type(x).sym('direction', x.sparsity())
+        value, product = ca.cse([f, ca.jtimes(f, x, direction)])
+        # the symbols are substituted simultaneously, i.e. dx still refers to x
+        value, product = ca.substitute([value, product], [x, direction], [xLinPoint, dx])
+    fLin = value + product
+
+    if not asFunction:
+        return fLin
+
+    opts = {}
+    if jit:
+        opts = {'jit': True, 'compiler': 'shell', 'jit_options': jitOptions or {'flags': ['-O2']}}
+    return ca.Function('linearization', [x, xLinPoint], [fLin], ['x', 'x_lin'], ['f_lin'], opts)
 
 
 
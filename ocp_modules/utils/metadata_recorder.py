@@ -0,0 +1,118 @@
+import numpy as np
+
+
+class MetadataRecorder:
+    """Records per-step controller data into preallocated numpy arrays.
+
+    Each recorded quantity (channel) has a fixed shape per step. Which steps are recorded is
+    determined by a recording policy:
+
+    * 'all': Records every step. The arrays grow by doubling their size when full.
+    * 'off': Records nothing.
+    * 'last': Records every step into a ring buffer, i.e. keeps the last <capacity> steps.
+    * 'every': Records every <every>-th step. If a <capacity> is given, only the last
+      <capacity> records are kept, otherwise the arrays grow as needed.
+
+    :param channels: A dictionary mapping channel names to the shape of a single record (an
+    int for vectors, () for scalars)
+    :param policy: One of 'all', 'off', 'last' or 'every'
+    :param capacity: Number of records kept by a ring buffer, required for policy 'last'
+    :param every: Recording interval in steps for policy 'every'
+    """
+
+    def __init__(self, channels, policy='all', capacity=None, every=1):
+        if policy not in ('all', 'off', 'last', 'every'):
+            raise ValueError('Unknown recording policy "%s"' % policy)
+        if policy == 'last' and not capacity:
+            raise ValueError('Recording policy "last" requires a capacity')
+
+        self.policy = policy
+        self.every = every if policy == 'every' else 1
+        self.ring = policy == 'last' or (policy == 'every' and capacity is not None)
+        self.shapes = {name: shape if isinstance(shape, tuple) else (shape,)
+                       for name, shape in channels.items()}
+
+        self._initialCapacity = capacity if self.ring else 64
+        self.sinks = []
+        self.reset()
+
+    def addSink(self, sink):
+        """addSink Registers a sink (e.g. a MetadataSink) that receives the values of every
+        step, independent of the recording policy.
+
+        :param sink: An object with a method push(step, values)
+        """
+        self.sinks.append(sink)
+
+    def reset(self):
+        """reset Discards all records and resets the step counter."""
+        self.stepCount = 0
+        self.numRecords = 0
+        self._allocate(0 if self.policy == 'off' else self._initialCapacity)
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self.steps = np.zeros((capacity,), dtype=int)
+        self.arrays = {name: np.zeros((capacity,) + shape) for name, shape in self.shapes.items()}
+
+    def _grow(self):
+        steps, arrays = self.steps, self.arrays
+        self._allocate(2 * self.capacity)
+        self.steps[:steps.size] = steps
+        for name, array in arrays.items():
+            self.arrays[name][:array.shape[0]] = array
+
+    def isDue(self):
+        """isDue Returns True if the current step is going to be recorded. Allows to skip the
+        computation of values that are only required for recording.
+        """
+        return self.policy != 'off' and self.stepCount % self.every == 0
+
+    def isActive(self):
+        """isActive Returns True if the values of the current step are used at all, i.e. the
+        step is due or a sink is attached.
+        """
+        return self.isDue() or bool(self.sinks)
+
+    def record(self, **values):
+        """record Records the values of one step, if the step is due according to the
+        policy, and advances the step counter. Values are reshaped to the shape of their
+        channel, so casadi DM objects may be passed directly.
+
+        :param values: Values of all channels as keyword arguments
+        """
+        if self.isDue():
+            if self.ring:
+                slot = self.numRecords % self.capacity
+            else:
+                if self.numRecords == self.capacity:
+                    self._grow()
+                slot = self.numRecords
+
+            self.steps[slot] = self.stepCount
+            for name, value in values.items():
+                self.arrays[name][slot] = np.asarray(value).reshape(self.shapes[name])
+            self.numRecords += 1
+
+        for sink in self.sinks:
+            sink.push(self.stepCount, values)
+
+        self.stepCount += 1
+
+    def __len__(self):
+        return min(self.numRecords, self.capacity)
+
+    def data(self):
+        """data Returns the records in chronological order.
+
+        Returns:
+            tuple: A 2-tuple (steps, arrays), where steps are the indices of the recorded
+            control steps and arrays a dictionary mapping channel names to arrays whose first
+            dimension is the record index. All arrays are copies of the internal buffers.
+        """
+        if self.ring and self.numRecords > self.capacity:
+            order = np.roll(np.arange(self.capacity), -(self.numRecords % self.capacity))
+            return self.steps[order], {name: a[order] for name, a in self.arrays.items()}
+
+        n = len(self)
+        return self.steps[:n].copy(), {name: a[:n].copy() for name, a in self.arrays.items()}
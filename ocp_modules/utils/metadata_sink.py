@@ -0,0 +1,159 @@
+import importlib
+import json
+import os
+import queue
+import threading
+import numpy as np
+
+
+class MetadataSink:
+    """Streams the per-step metadata of a controller to disk.
+
+    Values are copied into preallocated chunks on the control thread. Full chunks are handed
+    to a background thread that appends them to one raw binary file per channel, so the
+    control step never waits for disk I/O. The files can be opened as the xarray dataset
+    returned by the controller's get_metadata via :func:`openMetadata`, also while the
+    controller is still running. Usage::
+
+        sink = MetadataSink('run_001')
+        sink.attach(controller)
+        ...  # control loop
+        sink.close()
+        meta = openMetadata('run_001')
+
+    :param directory: Directory the files are written to. Created if it does not exist.
+    :param chunkSize: Number of steps buffered in memory before they are flushed
+    """
+
+    def __init__(self, directory, chunkSize=256):
+        self.directory = directory
+        self.chunkSize = chunkSize
+        self.shapes = None
+
+        self._queue = queue.Queue()
+        self._freeChunks = queue.SimpleQueue()
+        self._thread = None
+
+    def attach(self, controller):
+        """attach Starts streaming the metadata recorded by a controller. The controller
+        must provide a MetadataRecorder as member recorder and a static method
+        metadata_from_records that assembles the metadata dataset.
+
+        :param controller: The controller object
+        """
+        if self.shapes is not None:
+            raise RuntimeError('Sink is already attached to a controller')
+
+        self.shapes = dict(controller.recorder.shapes)
+
+        os.makedirs(self.directory, exist_ok=True)
+        header = {'builder': '%s:%s' % (type(controller).__module__, type(controller).__name__),
+                  'static': controller.metadata_attributes(),
+                  'channels': {name: list(shape) for name, shape in self.shapes.items()}}
+        with open(os.path.join(self.directory, 'header.json'), 'w') as f:
+            json.dump(header, f)
+
+        self._files = {name: open(self._path(self.directory, name), 'wb')
+                       for name in list(self.shapes) + ['control_step']}
+        self._chunk = self._newChunk()
+        self._fill = 0
+
+        self._thread = threading.Thread(target=self._write, daemon=True)
+        self._thread.start()
+
+        controller.recorder.addSink(self)
+
+    @staticmethod
+    def _path(directory, name):
+        return os.path.join(directory, name + '.bin')
+
+    def _newChunk(self):
+        try:
+            return self._freeChunks.get_nowait()
+        except queue.Empty:
+            chunk = {name: np.zeros((self.chunkSize,) + shape)
+                     for name, shape in self.shapes.items()}
+            chunk['control_step'] = np.zeros((self.chunkSize,), dtype=np.int64)
+            return chunk
+
+    def push(self, step, values):
+        """push Copies the values of one step into the current chunk and hands the chunk to
+        the writer thread if it is full. Called by the MetadataRecorder.
+
+        :param step: Index of the control step
+        :param values: A dictionary mapping channel names to values
+        """
+        chunk = self._chunk
+        chunk['control_step'][self._fill] = step
+        for name, value in values.items():
+            chunk[name][self._fill] = np.asarray(value).reshape(self.shapes[name])
+
+        self._fill += 1
+        if self._fill == self.chunkSize:
+            self.flush()
+
+    def flush(self, wait=False):
+        """flush Hands the buffered steps to the writer thread.
+
+        :param wait: Blocks until the writer thread has written all steps handed to it
+        """
+        if self._fill:
+            self._queue.put((self._chunk, self._fill))
+            self._chunk = self._newChunk()
+            self._fill = 0
+        if wait:
+            self._queue.join()
+
+    def close(self):
+        """close Writes all buffered steps, waits for the writer thread and closes the files."""
+        if self._thread is None:
+            return
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        for f in self._files.values():
+            f.close()
+
+    def _write(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            chunk, fill = item
+            for name, f in self._files.items():
+                chunk[name][:fill].tofile(f)
+                f.flush()
+            self._freeChunks.put(chunk)
+            self._queue.task_done()
+
+
+def openMetadata(directory):
+    """openMetadata Opens metadata written by a MetadataSink as a xarray dataset with the
+    layout of the controller's get_metadata. The data is memory-mapped, i.e. only read from
+    disk when accessed.
+
+    :param directory: Directory the sink has written to
+    :returns: A xarray.Dataset
+    """
+
+    with open(os.path.join(directory, 'header.json')) as f:
+        header = json.load(f)
+
+    def memmap(name, shape, dtype):
+        path = MetadataSink._path(directory, name)
+        rowSize = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        numRows = os.path.getsize(path) // rowSize
+        if numRows == 0:
+            return np.zeros((0,) + shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', shape=(numRows,) + shape)
+
+    steps = memmap('control_step', (), np.int64)
+    records = {name: memmap(name, tuple(shape), np.float64)[:steps.size]
+               for name, shape in header['channels'].items()}
+
+    moduleName, className = header['builder'].split(':')
+    builder = getattr(importlib.import_module(moduleName), className)
+
+    return builder.metadata_from_records(header['static'], steps, records)
@@ -0,0 +1,254 @@
+import itertools
+import math
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import xarray as xr
+
+from ocp_modules.utils.closed_loop_simulator import ClosedLoopSimulator
+
+
+def gridScenarios(values):
+    """gridScenarios Returns the scenario configurations of a full grid, i.e. all combinations
+    of the given values. The last key varies fastest.
+
+    :param values: A dictionary mapping configuration keys to sequences of values
+    :returns: A list of dictionaries, one per scenario
+    """
+
+    keys = list(values)
+    return [dict(zip(keys, combination))
+            for combination in itertools.product(*(values[key] for key in keys))]
+
+
+def randomScenarios(distributions, numScenarios, seed=None):
+    """randomScenarios Returns randomly sampled scenario configurations.
+
+    :param distributions: A dictionary mapping configuration keys to either a tuple (low, high)
+    of a uniform distribution, a callable which takes a numpy.random.Generator and returns a
+    value, or a constant value
+    :param numScenarios: Number of scenarios
+    :param seed: Seed of the random generator
+    :returns: A list of dictionaries, one per scenario
+    """
+
+    rng = np.random.default_rng(seed)
+    scenarios = []
+    for _ in range(numScenarios):
+        config = {}
+        for key, distribution in distributions.items():
+            if callable(distribution):
+                config[key] = distribution(rng)
+            elif isinstance(distribution, tuple) and len(distribution) == 2:
+                config[key] = rng.uniform(*distribution)
+            else:
+                config[key] = distribution
+        scenarios.append(config)
+
+    return scenarios
+
+
+# state of a worker process, set up by _initWorker
+_worker = {}
+
+
+def _attach(name, shape):
+    memory = shared_memory.SharedMemory(name=name)
+    return memory, np.ndarray(shape, dtype=np.float64, buffer=memory.buf)
+
+
+def _initWorker(sweep, x0, stateRef, controlRef, buffers):
+    _worker.clear()
+    _worker['sweep'] = sweep
+    _worker['references'] = (x0, stateRef, controlRef)
+    _worker['controllers'] = {}
+    _worker['memory'] = []
+    for name, (memoryName, shape) in buffers.items():
+        memory, array = _attach(memoryName, shape)
+        _worker['memory'].append(memory)
+        _worker[name] = array
+
+
+def _runScenarios(indices, configs):
+    """Simulates the given scenarios in a worker and writes the trajectories into the shared
+    buffers. Returns the error messages of failed scenarios by index."""
+
+    sweep = _worker['sweep']
+    x0, stateRef, controlRef = _worker['references']
+    errors = {}
+    for index, config in zip(indices, configs):
+        try:
+            key = sweep.controllerKey(config)
+            controller = _worker['controllers'].get(key)
+            if controller is None:
+                controller = sweep.buildController(config)
+                _worker['controllers'][key] = controller
+            elif hasattr(controller, 'reset'):
+                controller.reset()
+
+            simulator = ClosedLoopSimulator(
+                sweep.buildModel(config), controller, sweep.samplingTime,
+                config.get('horizon_length', sweep.horizonLength), sweep.Nsim,
+                sweep.integratorType, sweep.processNoise,
+                None if sweep.seed is None else [sweep.seed, index])
+            states, controls, durations = simulator.run(config.get('x0', x0), stateRef,
+                                                        controlRef)
+            _worker['states'][index] = states
+            _worker['controls'][index] = controls
+            _worker['computation_times'][index] = durations
+        except Exception:
+            errors[index] = traceback.format_exc()
+            for name in ('states', 'controls', 'computation_times'):
+                _worker[name][index] = np.nan
+
+    return errors
+
+
+class ParameterSweep:
+    """Runs closed loop simulations of many scenarios (e.g. a parameter grid or a Monte Carlo
+    sample) in parallel on a pool of worker processes.
+
+    A scenario is a configuration dictionary, e.g. {'mass': 1.2, 'horizon_length': 20}, which
+    is passed to <buildController> and <buildModel>. Each worker builds a controller once per
+    distinct value of the configuration entries <controllerKeys> and reuses it, after
+    resetting it, for all of its scenarios with that value. Thus, the keys must contain
+    everything the controller depends on, while e.g. parameters of the plant model do not
+    need to be part of it. Scenarios are grouped by these keys before being distributed, such
+    that a worker rarely builds more than one controller per group. To share compiled solvers
+    between workers, build the controller with a SolverCache.
+
+    The trajectories are written directly into shared memory by the workers instead of being
+    pickled back, only the scenario indices and error messages are sent between processes.
+    <buildController> and <buildModel> must be picklable, i.e. module level functions, if the
+    workers are not forked.
+
+    The configuration entries 'horizon_length' and 'x0' override the horizon length and the
+    initial state of a scenario. With <processNoise>, the noise of a scenario is seeded by
+    <seed> and the scenario index, i.e. results do not depend on the distribution of the
+    scenarios to the workers.
+
+    :param buildController: Function (config) -> controller, e.g. an Nmpc
+    :param buildModel: Function (config) -> model of the plant, e.g. a ModelBase
+    :param samplingTime: Sampling time of the controller
+    :param horizonLength: Horizon length of the controller
+    :param Nsim: Number of simulated steps per scenario
+    :param controllerKeys: Configuration keys which determine the controller
+    :param integratorType: Integrator of the plant, see ClosedLoopSimulator
+    :param processNoise: Standard deviation of the process noise per state, or None
+    :param seed: Seed of the process noise
+    :param maxWorkers: Number of worker processes, defaults to the number of processors
+    """
+
+    def __init__(self, buildController, buildModel, samplingTime, horizonLength, Nsim,
+                 controllerKeys=(), integratorType='rk', processNoise=None, seed=None,
+                 maxWorkers=None):
+        self.buildController = buildController
+        self.buildModel = buildModel
+        self.samplingTime = samplingTime
+        self.horizonLength = horizonLength
+        self.Nsim = Nsim
+        self.controllerKeys = tuple(controllerKeys)
+        self.integratorType = integratorType
+        self.processNoise = processNoise
+        self.seed = seed
+        self.maxWorkers = maxWorkers
+
+    def controllerKey(self, config):
+        """controllerKey Returns the key of the controller of a scenario configuration."""
+
+        return repr(tuple(config[key] for key in self.controllerKeys))
+
+    def _chunks(self, scenarios, numWorkers):
+        """Splits the scenario indices into chunks, grouped by controller key."""
+
+        groups = {}
+        for index, config in enumerate(scenarios):
+            groups.setdefault(self.controllerKey(config), []).append(index)
+        indices = list(itertools.chain.from_iterable(groups.values()))
+
+        # several chunks per worker balance the load if scenarios take different times
+        size = max(1, math.ceil(len(indices) / (4 * numWorkers)))
+        return [indices[i:i + size] for i in range(0, len(indices), size)]
+
+    def run(self, scenarios, x0, stateRef, controlRef):
+        """run Simulates all scenarios and returns the results.
+
+        :param scenarios: List of scenario configurations with identical keys, e.g. from
+        gridScenarios or randomScenarios
+        :param x0: Initial state
+        :param stateRef: <NX>x<Nsim+M+1> matrix of reference states
+        :param controlRef: <NU>x<Nsim+M> matrix of reference controls
+        :returns: A xarray.Dataset with the dimension 'scenario'. Scalar configuration entries
+        are coordinates along it, other entries data variables. Failed scenarios contain NaNs
+        and the traceback in 'errors'.
+        """
+
+        if not scenarios:
+            raise ValueError('No scenarios given')
+        keys = list(scenarios[0])
+        if any(list(config) != keys for config in scenarios):
+            raise ValueError('All scenarios must have the same configuration keys')
+        missing = set(self.controllerKeys) - set(keys)
+        if missing:
+            raise ValueError('Controller keys %s are missing in the scenarios' % sorted(missing))
+
+        NX = stateRef.shape[0]
+        NU = controlRef.shape[0]
+        numScenarios = len(scenarios)
+        shapes = {'states': (numScenarios, NX, self.Nsim + 1),
+                  'controls': (numScenarios, NU, self.Nsim),
+                  'computation_times': (numScenarios, self.Nsim)}
+
+        memory = {}
+        try:
+            for name, shape in shapes.items():
+                memory[name] = shared_memory.SharedMemory(
+                    create=True, size=max(1, 8 * math.prod(shape)))
+            buffers = {name: (memory[name].name, shape) for name, shape in shapes.items()}
+
+            numWorkers = self.maxWorkers or os.cpu_count()
+            errors = {}
+            with ProcessPoolExecutor(numWorkers, initializer=_initWorker,
+                                     initargs=(self, np.asarray(x0, dtype=float),
+                                               np.asarray(stateRef, dtype=float),
+                                               np.asarray(controlRef, dtype=float),
+                                               buffers)) as pool:
+                futures = [pool.submit(_runScenarios, chunk, [scenarios[i] for i in chunk])
+                           for chunk in self._chunks(scenarios, numWorkers)]
+                for future in futures:
+                    errors.update(future.result())
+
+            results = {name: np.ndarray(shape, dtype=np.float64, buffer=memory[name].buf).copy()
+                       for name, shape in shapes.items()}
+        finally:
+            for shm in memory.values():
+                shm.close()
+                shm.unlink()
+
+        return self._dataset(scenarios, results, errors)
+
+    def _dataset(self, scenarios, results, errors):
+        meta = {}
+        meta['sampling_time'] = xr.DataArray(self.samplingTime)
+        meta['states'] = xr.DataArray(results['states'],
+                                      dims=('scenario', 'state', 'simulation_step'))
+        meta['controls'] = xr.DataArray(results['controls'],
+                                        dims=('scenario', 'control', 'control_step'))
+        meta['computation_times'] = xr.DataArray(results['computation_times'],
+                                                 dims=('scenario', 'control_step'))
+        meta['errors'] = xr.DataArray(
+            np.array([errors.get(i, '') for i in range(len(scenarios))], dtype=object),
+            dims=('scenario',))
+
+        coords = {'scenario': np.arange(len(scenarios))}
+        for key in scenarios[0]:
+            values = np.array([np.asarray(config[key]) for config in scenarios])
+            if values.ndim == 1:
+                coords[key] = ('scenario', values)
+            else:
+                meta[key] = xr.DataArray(values, dims=('scenario',) + tuple(
+                    '%s_dim_%d' % (key, i) for i in range(values.ndim - 1)))
+
+        return xr.Dataset(data_vars=meta, coords=coords)
@@ -0,0 +1,404 @@
+import time
+
+import numpy as np
+from scipy.linalg import lapack
+
+from ocp_modules.utils.condensing import definitionBlocks, stateDefinitions
+
+
+class RiccatiQpSolver:
+    """Interior point QP solver for the QPs of multiple shooting OCPs, which factorizes its
+    Newton systems by a Riccati recursion over the stages.
+
+    The decision variables are ordered as [x_0, ..., x_M, u_0, ..., u_M-1] (see OcpVars). The
+    QP
+
+        min 1/2 w'Hw + g'w  s.t.  lba <= Aw <= uba,  lbx <= w <= ubx
+
+    must have the stage-wise structure of a multiple shooting OCP:
+
+    * Every constraint is an equality that defines one state from the states and controls of
+      the previous stage (see ocp_modules.utils.condensing.stateDefinitions), i.e. the
+      constraints are the initial value and the multiple shooting constraints
+    * The Hessian only couples the states and controls of the same stage
+
+    The box constraints are handled by Mehrotra's predictor-corrector method. Each Newton
+    system is an equality constrained QP in the stage variables, which is solved by a Riccati
+    recursion in O(M (NX+NU)^3) operations: the recursion itself runs stage by stage, while
+    all operations that do not depend on the previous stage are batched over the stages.
+
+    The solver mimics a casadi conic solver evaluated on buffers (see BufferedFunction): the
+    QP data is passed via the arrays in <args>, which can be bound to other buffers via
+    :meth:`bindArg`, and the solution is returned in the arrays in <res>, both with the names
+    and nonzero layout of casadi's conic interface. Of the initial guess, only the primal
+    point x0 is used.
+
+    Supported options are
+
+    * 'tol': Tolerance of the residuals and the complementarity, default 1e-10
+    * 'max_iter': Maximum number of iterations, default 50
+    * 'error_on_fail': Raises a RuntimeError if the QP is not solved, default True
+
+    :param hSparsity: casadi Sparsity of the Hessian
+    :param aSparsity: casadi Sparsity of the constraint Jacobian
+    :param NX: Number of states
+    :param NU: Number of controls
+    :param M: Horizon length
+    :param opts: Dictionary of options
+
+    :raises ValueError: If the QP does not have the structure of a multiple shooting OCP
+    """
+
+    defaultOptions = {'tol': 1e-10, 'max_iter': 50, 'error_on_fail': True}
+
+    # fraction of the distance to the boundary taken by a step
+    stepScale = 0.995
+
+    # return status and the corresponding unified return status of casadi
+    returnStatuses = {'solved': 'SOLVER_RET_SUCCESS', 'max_iter': 'SOLVER_RET_LIMITED',
+                      'nan': 'SOLVER_RET_NAN', 'not_positive_definite': 'SOLVER_RET_UNKNOWN'}
+
+    def __init__(self, hSparsity, aSparsity, NX, NU, M, opts=None):
+        opts = dict(self.defaultOptions, **(opts or {}))
+        unknown = set(opts) - set(self.defaultOptions)
+        if unknown:
+            raise ValueError('Unknown options %s of the Riccati QP solver' % sorted(unknown))
+        self.tol = opts['tol']
+        self.maxIter = opts['max_iter']
+        self.errorOnFail = opts['error_on_fail']
+
+        self.NX = NX
+        self.NU = NU
+        self.M = M
+        numVars = NX * (M + 1) + NU * M
+        numConstr = aSparsity.size1()
+        if hSparsity.size() != (numVars, numVars) or aSparsity.size2() != numVars:
+            raise ValueError('The QP does not match the layout of %d states, %d controls and '
+                             'horizon length %d' % (NX, NU, M))
+        if numConstr != NX * (M + 1):
+            raise ValueError('The Riccati QP solver requires exactly one constraint per state, '
+                             'got %d constraints for %d states' % (numConstr, NX * (M + 1)))
+
+        # every constraint is the definition of a state, D_k x_k + E_k x_k-1 + F_k u_k-1 = b_k
+        self._definitions = stateDefinitions(aSparsity, np.ones((numConstr,), dtype=bool),
+                                             NX, NU, M)
+        self._nzD, self._nzE, self._nzF = definitionBlocks(aSparsity, self._definitions, NX,
+                                                           NU, M)
+
+        # Hessian blocks of the stages [x_k, u_k] and of the terminal state x_M
+        stageVars = np.hstack([NX * np.arange(M)[:, None] + np.arange(NX),
+                               NX * (M + 1) + NU * np.arange(M)[:, None] + np.arange(NU)])
+        self._nzH = np.array([np.reshape(hSparsity.get_nz(list(v), list(v)),
+                                         (NX + NU, NX + NU)).T for v in stageVars.tolist()],
+                             dtype=int).reshape((M, NX + NU, NX + NU))
+        terminalVars = list(range(NX * M, NX * (M + 1)))
+        self._nzHTerminal = np.reshape(hSparsity.get_nz(terminalVars, terminalVars),
+                                       (NX, NX)).T
+        covered = np.union1d(self._nzH[self._nzH >= 0], self._nzHTerminal[self._nzHTerminal >= 0])
+        if covered.size != hSparsity.nnz():
+            raise ValueError('The Riccati QP solver requires a Hessian that only couples the '
+                             'states and controls of the same stage')
+        self._nzH[self._nzH < 0] = hSparsity.nnz()
+        self._nzHTerminal[self._nzHTerminal < 0] = hSparsity.nnz()
+
+        self.args = {}
+        self.res = {}
+        for name, size in (('h', hSparsity.nnz()), ('g', numVars), ('a', aSparsity.nnz()),
+                           ('lba', numConstr), ('uba', numConstr), ('lbx', numVars),
+                           ('ubx', numVars), ('x0', numVars), ('lam_x0', numVars),
+                           ('lam_a0', numConstr)):
+            self.bindArg(name, np.zeros((size,)))
+        self.args['lbx'].fill(-np.inf)
+        self.args['ubx'].fill(np.inf)
+        for name, size in (('x', numVars), ('cost', 1), ('lam_a', numConstr),
+                           ('lam_x', numVars)):
+            self.res[name] = np.zeros((size,))
+
+        self._allocate()
+        self._stats = {'iter_count': 0, 'success': False, 'return_status': 'not solved',
+                       'unified_return_status': 'SOLVER_RET_UNKNOWN', 't_wall_solver': 0.,
+                       't_proc_solver': 0., 'n_call_solver': 0}
+
+    def _allocate(self):
+        NX, NU, M = self.NX, self.NU, self.M
+        numVars = NX * (M + 1) + NU * M
+        self._hExt = np.zeros((self.args['h'].size + 1,))
+        self._aExt = np.zeros((self.args['a'].size + 1,))
+
+        # dynamics x_k+1 = A_k x_k + B_k u_k + c_k, normalized by the diagonal blocks D_k
+        self._D = np.zeros((M + 1, NX))
+        self._AB = np.zeros((M, NX, NX + NU))
+        self._c = np.zeros((M, NX))
+        self._xInit = np.zeros((NX,))
+        self._H = np.zeros((M, NX + NU, NX + NU))
+        self._HTerminal = np.zeros((NX, NX))
+
+        # factorization of the Newton system
+        self._G = np.zeros((M, NX + NU, NX + NU))
+        self._P = np.zeros((M + 1, NX, NX))
+        self._K = np.zeros((M, NU, NX))
+        self._PhiT = np.zeros((M, NX, NX))
+        self._p = np.zeros((M + 1, NX))
+
+        # iterate, slacks and bound multipliers of all variables, the latter are zero for
+        # infinite bounds
+        self._w = np.zeros((numVars,))
+        self._nu = np.zeros((M + 1, NX))
+        self._sl = np.zeros((numVars,))
+        self._su = np.zeros((numVars,))
+        self._zl = np.zeros((numVars,))
+        self._zu = np.zeros((numVars,))
+        self._hasLower = np.zeros((numVars,))
+        self._hasUpper = np.zeros((numVars,))
+
+        # per stage views for the recursions, from the last to the first stage, which avoids
+        # creating them in every iteration
+        self._stageViews = list(zip(self._G, self._AB, self._P[:-1], self._P[1:], self._K,
+                                    self._G[:, :NX, :NX], self._G[:, :NX, NX:],
+                                    self._G[:, NX:, :NX], self._G[:, NX:, NX:]))[::-1]
+        self._closedLoopViews = list(zip(self._PhiT, self._p[:-1]))[::-1]
+
+    def bindArg(self, name, array):
+        """bindArg Uses <array> as buffer of input <name>. The array is not copied, i.e. the
+        solver reads its current content.
+        """
+
+        size = self.args[name].size if name in self.args else array.size
+        if array.dtype != np.float64 or not array.flags.c_contiguous or array.size != size:
+            raise ValueError('Buffer for %s must be a contiguous float64 array with %d elements'
+                             % (name, size))
+        self.args[name] = array
+
+    def _states(self, w):
+        return w[:self.NX * (self.M + 1)].reshape((self.M + 1, self.NX))
+
+    def _controls(self, w):
+        return w[self.NX * (self.M + 1):].reshape((self.M, self.NU))
+
+    def _stages(self, w):
+        return np.concatenate([self._states(w)[:-1], self._controls(w)], axis=1)
+
+    def _loadData(self):
+        args = self.args
+        if not np.array_equal(args['lba'], args['uba']):
+            raise RuntimeError('The Riccati QP solver requires equality constraints')
+
+        np.copyto(self._hExt[:-1], args['h'])
+        np.copyto(self._aExt[:-1], args['a'])
+        np.take(self._hExt, self._nzH, out=self._H)
+        np.take(self._hExt, self._nzHTerminal, out=self._HTerminal)
+
+        D = np.take(self._aExt, self._nzD, out=self._D)
+        b = args['lba'][self._definitions]
+        scale = -1. / D[1:, :, None]
+        np.multiply(self._aExt[self._nzE[1:]], scale, out=self._AB[:, :, :self.NX])
+        np.multiply(self._aExt[self._nzF[1:]], scale, out=self._AB[:, :, self.NX:])
+        np.divide(b[1:], D[1:], out=self._c)
+        np.divide(b[0], D[0], out=self._xInit)
+
+        lbx, ubx = args['lbx'], args['ubx']
+        np.isfinite(lbx, out=self._hasLower, casting='unsafe')
+        np.isfinite(ubx, out=self._hasUpper, casting='unsafe')
+        self._lbx = np.where(self._hasLower > 0, lbx, 0.)
+        self._ubx = np.where(self._hasUpper > 0, ubx, 0.)
+
+    def _hessianProduct(self, w):
+        product = np.zeros_like(w)
+        stages = np.einsum('kij,kj->ki', self._H, self._stages(w))
+        states = self._states(product)
+        states[:-1] = stages[:, :self.NX]
+        states[-1] = self._HTerminal @ self._states(w)[-1]
+        self._controls(product)[:] = stages[:, self.NX:]
+        return product
+
+    def _constraintTransposeProduct(self, nu):
+        # rows x_0 and x_k+1 - A_k x_k - B_k u_k of the normalized constraints
+        product = np.zeros_like(self._w)
+        stages = np.einsum('kij,ki->kj', self._AB, nu[1:])
+        states = self._states(product)
+        states[:] = nu
+        states[:-1] -= stages[:, :self.NX]
+        self._controls(product)[:] = -stages[:, self.NX:]
+        return product
+
+    def _primalResidual(self, w):
+        residual = np.empty((self.M + 1, self.NX))
+        states = self._states(w)
+        residual[0] = states[0] - self._xInit
+        residual[1:] = states[1:] - np.einsum('kij,kj->ki', self._AB, self._stages(w)) - \
+            self._c
+        return residual
+
+    def _factorize(self, sigma):
+        """Factorizes the Newton system with the barrier Hessian sigma by the backward Riccati
+        recursion P_k = Q_k + A_k'P_k+1 A_k - K_k'(R_k + B_k'P_k+1 B_k)K_k. Returns False if
+        the reduced Hessian R_k + B_k'P_k+1 B_k of a stage is not positive definite."""
+
+        NX, M = self.NX, self.M
+        G, P, K, AB = self._G, self._P, self._K, self._AB
+        np.copyto(G, self._H)
+        G.reshape((M, -1))[:, ::NX + self.NU + 1] += self._stages(sigma)
+        np.copyto(P[M], self._HTerminal)
+        P[M].reshape(-1)[::NX + 1] += self._states(sigma)[-1]
+
+        # ndarray.dot has less overhead than matmul for small matrices
+        for Gk, ABk, Pk, PNext, Kk, Gxx, Gxu, Gux, Guu in self._stageViews:
+            np.add(Gk, ABk.T.dot(PNext.dot(ABk)), out=Gk)
+            _, gain, info = lapack.dposv(Guu, Gux)
+            if info != 0:
+                return False
+            np.negative(gain, out=Kk)
+            np.add(Gxu.dot(Kk), Gxx, out=Pk)
+
+        # closed loop dynamics Phi_k = A_k + B_k K_k
+        np.matmul(AB[:, :, NX:], K, out=self._PhiT.transpose((0, 2, 1)))
+        self._PhiT.transpose((0, 2, 1))[:] += AB[:, :, :NX]
+        return True
+
+    def _solve(self, q, e, dxInit):
+        """Solves the Newton system for the stage gradient q and the dynamics offsets e by the
+        forward and backward recursions of the factorization. Returns the primal step and the
+        new multipliers of the normalized constraints."""
+
+        NX, M = self.NX, self.M
+        P, K, PhiT, AB, p = self._P, self._K, self._PhiT, self._AB, self._p
+        qx = self._states(q)
+        qu = self._controls(q)
+
+        # p_k = qx_k + K_k'qu_k + Phi_k'(P_k+1 e_k + p_k+1)
+        pConst = qx[:-1] + np.einsum('kij,ki->kj', K, qu) + \
+            np.einsum('kij,kj->ki', PhiT, np.einsum('kij,kj->ki', P[1:], e))
+        pNext = p[M]
+        np.copyto(pNext, qx[M])
+        for (PhiTk, pk), pConstk in zip(self._closedLoopViews, pConst[::-1]):
+            np.add(PhiTk.dot(pNext), pConstk, out=pk)
+            pNext = pk
+
+        # feedforward u_k = K_k x_k + kff_k
+        v = np.einsum('kij,kj->ki', P[1:], e) + p[1:]
+        kff = -np.linalg.solve(self._G[:, NX:, NX:],
+                               (qu + np.einsum('kij,ki->kj', AB[:, :, NX:], v))[:, :, None])[:, :, 0]
+
+        dw = np.empty_like(q)
+        dx = self._states(dw)
+        offsets = np.einsum('kij,kj->ki', AB[:, :, NX:], kff) + e
+        dx[0] = dxInit
+        for k, (PhiTk, offset) in enumerate(zip(PhiT, offsets)):
+            np.add(dx[k].dot(PhiTk), offset, out=dx[k + 1])
+        self._controls(dw)[:] = np.einsum('kij,kj->ki', K, dx[:-1]) + kff
+
+        nu = -(np.einsum('kij,kj->ki', P, dx) + p)
+        return dw, nu
+
+    def _stepLength(self, value, step):
+        decreasing = step < 0.
+        if not decreasing.any():
+            return 1.
+        return min(1., self.stepScale * np.min(-value[decreasing] / step[decreasing]))
+
+    def __call__(self):
+        """__call__ Solves the QP on the current input buffers.
+
+        :raises RuntimeError: If the QP is not solved and the option error_on_fail is set, or
+        if it has inequality constraints
+        """
+
+        tick = time.perf_counter()
+        procTick = time.process_time()
+        self._loadData()
+
+        hasLower, hasUpper = self._hasLower, self._hasUpper
+        lbx, ubx = self._lbx, self._ubx
+        numBounds = hasLower.sum() + hasUpper.sum()
+        g = self.args['g']
+        w, nu, sl, su, zl, zu = self._w, self._nu, self._sl, self._su, self._zl, self._zu
+
+        # start from the initial guess, with slacks and multipliers strictly inside the bounds
+        np.copyto(w, self.args['x0'])
+        np.copyto(sl, np.where(hasLower > 0, np.maximum(w - lbx, 1.), 1.))
+        np.copyto(su, np.where(hasUpper > 0, np.maximum(ubx - w, 1.), 1.))
+        np.copyto(zl, hasLower)
+        np.copyto(zu, hasUpper)
+        nu.fill(0.)
+
+        status = 'max_iter'
+        iteration = 0
+        for iteration in range(self.maxIter + 1):
+            gradient = self._hessianProduct(w) + g
+            dualResidual = gradient + self._constraintTransposeProduct(nu) - zl + zu
+            primalResidual = self._primalResidual(w)
+            lowerResidual = hasLower * (w - lbx - sl)
+            upperResidual = hasUpper * (ubx - w - su)
+            mu = (sl @ zl + su @ zu) / numBounds if numBounds else 0.
+            residual = max(np.max(np.abs(dualResidual)), np.max(np.abs(primalResidual)),
+                           np.max(np.abs(lowerResidual)), np.max(np.abs(upperResidual)))
+            if not np.isfinite(residual) or not np.isfinite(mu):
+                status = 'nan'
+                break
+            complementarity = max(np.max(sl * zl), np.max(su * zu))
+            if residual <= self.tol and complementarity <= self.tol:
+                status = 'solved'
+                break
+            if iteration == self.maxIter:
+                break
+
+            if not self._factorize(zl / sl + zu / su):
+                status = 'not_positive_definite'
+                break
+
+            def newtonStep(lowerComplementarity, upperComplementarity):
+                q = gradient - zl + zu - \
+                    (lowerComplementarity - zl * lowerResidual) / sl + \
+                    (upperComplementarity - zu * upperResidual) / su
+                dw, nuNext = self._solve(q, -primalResidual[1:], -primalResidual[0])
+                dsl = hasLower * (dw + lowerResidual)
+                dsu = hasUpper * (upperResidual - dw)
+                dzl = (lowerComplementarity - zl * dsl) / sl
+                dzu = (upperComplementarity - zu * dsu) / su
+                return dw, nuNext, dsl, dsu, dzl, dzu
+
+            # affine scaling predictor and centering corrector
+            dw, nuNext, dsl, dsu, dzl, dzu = newtonStep(-sl * zl, -su * zu)
+            if numBounds:
+                primalStep = min(self._stepLength(sl, dsl), self._stepLength(su, dsu))
+                dualStep = min(self._stepLength(zl, dzl), self._stepLength(zu, dzu))
+                muAffine = ((sl + primalStep * dsl) @ (zl + dualStep * dzl) +
+                            (su + primalStep * dsu) @ (zu + dualStep * dzu)) / numBounds
+                centering = (muAffine / mu) ** 3 * mu
+                dw, nuNext, dsl, dsu, dzl, dzu = newtonStep(
+                    hasLower * centering - sl * zl - dsl * dzl,
+                    hasUpper * centering - su * zu - dsu * dzu)
+
+            primalStep = min(self._stepLength(sl, dsl), self._stepLength(su, dsu))
+            dualStep = min(self._stepLength(zl, dzl), self._stepLength(zu, dzu))
+            w += primalStep * dw
+            sl += primalStep * dsl
+            su += primalStep * dsu
+            nu += dualStep * (nuNext - nu)
+            zl += dualStep * dzl
+            zu += dualStep * dzu
+
+        res = self.res
+        np.copyto(res['x'], w)
+        res['cost'][0] = 1. / 2. * w @ self._hessianProduct(w) + g @ w
+        res['lam_a'][self._definitions] = nu / self._D
+        np.subtract(zu, zl, out=res['lam_x'])
+
+        stats = self._stats
+        stats['iter_count'] = iteration
+        stats['success'] = status == 'solved'
+        stats['return_status'] = status
+        stats['unified_return_status'] = self.returnStatuses[status]
+        stats['t_wall_solver'] += time.perf_counter() - tick
+        stats['t_proc_solver'] += time.process_time() - procTick
+        stats['n_call_solver'] += 1
+
+        if status != 'solved' and self.errorOnFail:
+            raise RuntimeError('Riccati QP solver failed: %s after %d iterations'
+                               % (status, iteration))
+
+    def stats(self):
+        """stats Returns the statistics of the solver, like casadi.Function.stats. Times and
+        calls are accumulated over all calls."""
+
+        return dict(self._stats)
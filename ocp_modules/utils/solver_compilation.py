@@ -1,22 +1,255 @@
+import fcntl
+import hashlib
+import os
+import subprocess
+import tempfile
 import numpy as np
 from casadi import *
-import tempfile
-import os
 
-def getCompiledSolver(solver, solver_opts):
+def compileFunction(function, filename, compiler='gcc', flags=('-O2',)):
+    """compileFunction Generates C code for a casadi Function and compiles it into a shared
+    library. For nlpsol objects, the functions the solver depends on are compiled, such that
+    the library can be loaded via nlpsol(<name>, <plugin>, <filename>).
+
+    :param function: Function object to compile
+    :param filename: Path of the resulting shared library
+    :param compiler: Compiler executable
+    :param flags: Additional compiler flags, e.g. optimization flags
+
+    :raises RuntimeError: If compilation fails
+    """
+
+    with tempfile.TemporaryDirectory() as buildDir:
+        gen = CodeGenerator('functions.c', {'with_header': False})
+        if function.is_a('Nlpsol', True):
+            gen.add(function.oracle())
+            for name in function.get_function():
+                gen.add(function.get_function(name))
+        else:
+            gen.add(function)
+        cFilename = gen.generate(buildDir + os.sep)
+
+        cmd = [compiler, '-fPIC', '-shared'] + list(flags) + [cFilename, '-o', filename]
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        if proc.returncode != 0:
+            raise RuntimeError('Compilation of %s failed:\n%s' %
+                               (function.name(), proc.stdout.decode(errors='replace')))
+
+def getCompiledSolver(solver, solver_opts, flags=('-O2',), directory=None):
     """getCompiledSolver Compiles a casadi nlpsol object into a shared library
     and returns a new solver object based on this binary.
 
     :param solver: Solver object to compile
-    :param solver_opts: Compiled solver object
+    :param solver_opts: Options of the compiled solver object
+    :param flags: Compiler flags
+    :param directory: Directory the shared library is stored in. Defaults to the system's
+    temporary directory. Use a SolverCache to reuse compiled solvers.
     """
 
-    filename = 'casadi_solver_' + next(tempfile._get_candidate_names())
-    solver.generate_dependencies(filename + '.c')
+    fd, filename = tempfile.mkstemp(prefix='casadi_solver_', suffix='.so', dir=directory)
+    os.close(fd)
+
+    print('Compiling NLP into %s...this might take a while' % filename)
+    compileFunction(solver, filename, flags=flags)
+
+    return nlpsol('solver', 'ipopt', filename, solver_opts)
+
+
+class SolverCache:
+    """Persistent on-disk cache of compiled solvers.
+
+    Compiled solvers are stored as shared libraries, keyed by a hash of the serialized
+    problem, the solver plugin and options, the compiler flags and the casadi version. Thus,
+    constructing a solver for an unchanged problem only loads the library instead of
+    generating and compiling code. Several processes may share a cache directory: libraries
+    are compiled and loaded under a file lock per key and moved into place atomically. If the
+    total size of the cache exceeds <maxSize>, the least recently used libraries that are not
+    in use by another process are removed. A library that is missing when it is loaded is
+    compiled again.
+
+    :param directory: Cache directory. Defaults to $OCP_MODULES_CACHE or
+    ~/.cache/ocp_modules.
+    :param compiler: Compiler executable
+    :param flags: Compiler flags, e.g. ('-O3', '-march=native')
+    :param maxSize: Maximum total size of all cached libraries in bytes
+    """
+
+    def __init__(self, directory=None, compiler='gcc', flags=('-O2',), maxSize=2**30):
+        if directory is None:
+            directory = os.environ.get('OCP_MODULES_CACHE', os.path.join(
+                os.path.expanduser('~'), '.cache', 'ocp_modules'))
+        self.directory = directory
+        self.compiler = compiler
+        self.flags = tuple(flags)
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _key(self, kind, function, plugin, opts):
+        # callbacks do not affect the generated code and have no stable representation
+        opts = {k: v for k, v in opts.items() if k != 'iteration_callback'}
+        h = hashlib.sha256()
+        for item in (kind, plugin, repr(sorted(opts.items())), self.compiler, repr(self.flags),
+                     CasadiMeta.version()):
+            h.update(item.encode())
+        h.update(function.serialize().encode())
+        return h.hexdigest()[:32]
+
+    def _library(self, key, buildFun, loadFun):
+        """_library Loads the library for <key> via <loadFun> and compiles the function
+        returned by <buildFun> if it is not cached yet. The library is loaded under a shared
+        lock of its key, which protects it from eviction by other processes.
+        """
+
+        filename = os.path.join(self.directory, key + '.so')
+        with open(os.path.join(self.directory, key + '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            for attempt in range(2):
+                self._compile(filename, lock, buildFun)
+                try:
+                    loaded = loadFun(filename)
+                    break
+                except RuntimeError:
+                    # the library was removed before it was loaded, e.g. by hand
+                    if attempt > 0 or os.path.exists(filename):
+                        raise
+
+        self._evict(keep=filename)
+        return loaded
+
+    def _compile(self, filename, lock, buildFun):
+        """_compile Compiles the library <filename> if it does not exist, holding the shared
+        lock <lock> of its key.
+        """
+
+        if os.path.exists(filename):
+            self.hits += 1
+            os.utime(filename)
+            return
+
+        # converting the lock is not atomic, so another process might have compiled the
+        # library in the meantime
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if os.path.exists(filename):
+                self.hits += 1
+                return
+
+            self.misses += 1
+            fd, tmpFilename = tempfile.mkstemp(suffix='.so.tmp', dir=self.directory)
+            os.close(fd)
+            try:
+                compileFunction(buildFun(), tmpFilename, self.compiler, self.flags)
+                os.replace(tmpFilename, filename)
+            finally:
+                if os.path.exists(tmpFilename):
+                    os.remove(tmpFilename)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_SH)
+
+    def _evict(self, keep):
+        libraries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.so'):
+                libraries.append((entry.stat().st_mtime, entry.stat().st_size, entry.path))
+
+        # the builtin sum is shadowed by casadi's, which does not accept generators
+        totalSize = np.sum([size for _, size, _ in libraries])
+        for _, size, path in sorted(libraries):
+            if totalSize <= self.maxSize:
+                break
+            if path == keep:
+                continue
+            # lock files are never removed, since other processes might hold them. A library
+            # whose key is locked is being compiled or loaded and is skipped.
+            with open(path[:-len('.so')] + '.lock', 'w') as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            totalSize -= size
+
+    def nlpsol(self, name, plugin, nlp, opts={}):
+        """nlpsol Creates a solver like casadi.nlpsol, but based on a compiled library.
+
+        :param name: Name of the solver
+        :param plugin: Solver plugin, e.g. 'ipopt'
+        :param nlp: Problem dictionary with keys x, p, f and g
+        :param opts: Solver options
+        :returns: A casadi Function
+        """
+
+        nlp = {k: v.cat if hasattr(v, 'cat') else v for k, v in nlp.items()}
+        x = nlp['x']
+        p = nlp.get('p', type(x)(0, 1))
+        problemFun = Function('nlp', [x, p], [nlp.get('f', 0), nlp.get('g', type(x)(0, 1))])
+
+        key = self._key('nlpsol', problemFun, plugin, opts)
+        return self._library(key, lambda: nlpsol(name, plugin, nlp, opts),
+                             lambda filename: nlpsol(name, plugin, filename, opts))
+
+    def function(self, function):
+        """function Returns a compiled version of a casadi Function, loaded from the cache if
+        available.
+
+        :param function: casadi Function
+        :returns: A casadi Function with the same name, inputs and outputs
+        """
+
+        key = self._key('function', function, '', {})
+        return self._library(key, lambda: function,
+                             lambda filename: external(function.name(), filename))
+
+    def qpsol(self, name, plugin, qp, opts={}):
+        """qpsol Creates a solver like casadi.qpsol, whose QP matrices are evaluated by a
+        compiled library. The returned Function has the inputs and outputs of a qpsol
+        object, except that lam_p is always zero.
+
+        :param name: Name of the solver
+        :param plugin: QP solver plugin, e.g. 'qpoases'
+        :param qp: Problem dictionary with keys x, p, f and g
+        :param opts: Solver options
+        :returns: A casadi Function
+        """
+
+        qp = {k: v.cat if hasattr(v, 'cat') else v for k, v in qp.items()}
+        x = qp['x']
+        p = qp.get('p', type(x)(0, 1))
+        f = qp.get('f', type(x)(0))
+        g = qp.get('g', type(x)(0, 1))
+
+        # QP matrices: f = 1/2 x'Hx + c'x + f0, g = Ax + g0
+        zero = np.zeros(x.shape)
+        H = hessian(f, x)[0]
+        A = jacobian(g, x)
+        if depends_on(H, x) or depends_on(A, x):
+            raise ValueError('Problem passed to qpsol is not a QP')
+        c = substitute(gradient(f, x), x, zero)
+        f0 = substitute(f, x, zero)
+        g0 = substitute(g, x, zero)
+        dataFun = Function('qp_data', [p], [H, c, f0, A, g0])
+
+        compiledDataFun = self.function(dataFun)
 
-    print('Compiling NLP into %s.so...this might take a while' % filename)
-    compile_flag = os.system('gcc -fPIC -shared %s.c -o /tmp/%s.so' % (filename, filename))
+        solver = conic(name + '_conic', plugin, {'h': H.sparsity(), 'a': A.sparsity()}, opts)
 
-    os.remove(filename + '.c')
+        # wrap data function and QP solver into a function with the signature of qpsol
+        args = {n: MX.sym(n, sp) for n, sp in zip(
+            ('x0', 'p', 'lbx', 'ubx', 'lbg', 'ubg', 'lam_x0', 'lam_g0'),
+            (x.sparsity(), p.sparsity(), x.sparsity(), x.sparsity(), g.sparsity(),
+             g.sparsity(), x.sparsity(), g.sparsity()))}
+        Hv, cv, f0v, Av, g0v = compiledDataFun(args['p'])
+        sol = solver(h=Hv, g=cv, a=Av, lba=args['lbg'] - g0v, uba=args['ubg'] - g0v,
+                     lbx=args['lbx'], ubx=args['ubx'], x0=args['x0'], lam_x0=args['lam_x0'],
+                     lam_a0=args['lam_g0'])
+        res = {'x': sol['x'], 'f': sol['cost'] + f0v, 'g': mtimes(Av, sol['x']) + g0v,
+               'lam_x': sol['lam_x'], 'lam_g': sol['lam_a'], 'lam_p': MX.zeros(p.sparsity())}
 
-    return nlpsol('solver', 'ipopt', '/tmp/%s.so' % filename, solver_opts)
+        return Function(name, list(args.values()), list(res.values()), list(args.keys()),
+                        list(res.keys()))
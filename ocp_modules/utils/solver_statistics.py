@@ -0,0 +1,99 @@
+import numpy as np
+import xarray as xr
+
+# casadi's unified return status, common to all solver plugins
+returnStatuses = ('SOLVER_RET_SUCCESS', 'SOLVER_RET_UNKNOWN', 'SOLVER_RET_LIMITED',
+                  'SOLVER_RET_NAN', 'SOLVER_RET_INFEASIBLE', 'SOLVER_RET_EXCEPTION')
+
+
+class SolverStatistics:
+    """Collects the statistics of casadi solver calls (see casadi.Function.stats) of a control
+    step in preallocated arrays.
+
+    Per solver phase (e.g. 'nlp_f' for the cost evaluations of nlpsol or 'solver' for conic),
+    the processor time, wall time and number of calls are summed over all calls of a step.
+    Solvers evaluated via casadi's buffer API (see BufferedFunction) accumulate these over
+    their lifetime, so the values of a call are the differences to the previously added
+    statistics. The statistics of every call have to be added, also of steps that are not
+    recorded, so that the values of a step contain its own calls only. The iteration count is
+    summed as well, while the return status is the one of the last call. It is not a recorder
+    channel, since the controllers record their own iteration count.
+
+    :param phases: Names of the solver phases, i.e. the suffixes of the t_proc_*, t_wall_* and
+    n_call_* entries of the statistics
+    """
+
+    def __init__(self, phases):
+        self.phases = tuple(phases)
+        self.tProc = np.zeros((len(self.phases),))
+        self.tWall = np.zeros((len(self.phases),))
+        self.nCall = np.zeros((len(self.phases),))
+        # accumulated values of the last added statistics
+        self._accumulated = np.zeros((3, len(self.phases)))
+        self._current = np.zeros((3, len(self.phases)))
+        self.reset()
+
+    def reset(self):
+        """reset Discards the statistics of the previous step."""
+        self.tProc.fill(0.)
+        self.tWall.fill(0.)
+        self.nCall.fill(0.)
+        self.iterations = 0
+        self.returnStatus = returnStatuses.index('SOLVER_RET_UNKNOWN')
+        self.success = False
+
+    def add(self, stats):
+        """add Adds the statistics of a solver call.
+
+        :param stats: Dictionary returned by the stats method of the solver
+        """
+        for i, phase in enumerate(self.phases):
+            self._current[0, i] = stats.get('t_proc_' + phase, 0.)
+            self._current[1, i] = stats.get('t_wall_' + phase, 0.)
+            self._current[2, i] = stats.get('n_call_' + phase, 0)
+
+        # a decrease means that the solver reset its statistics
+        delta = np.where(self._current >= self._accumulated, self._current - self._accumulated,
+                         self._current)
+        self._accumulated[:] = self._current
+        self.tProc += delta[0]
+        self.tWall += delta[1]
+        self.nCall += delta[2]
+        self.iterations += stats.get('iter_count', 0)
+        status = stats.get('unified_return_status', 'SOLVER_RET_UNKNOWN')
+        self.returnStatus = returnStatuses.index(status) if status in returnStatuses else \
+            returnStatuses.index('SOLVER_RET_UNKNOWN')
+        self.success = bool(stats.get('success', False))
+
+    def channels(self):
+        """channels Returns the shapes of the recorder channels of the statistics."""
+        numPhases = len(self.phases)
+        return {'return_status': (), 'success': (),
+                'solver_t_proc': numPhases, 'solver_t_wall': numPhases,
+                'solver_n_call': numPhases}
+
+    def values(self):
+        """values Returns the values of the recorder channels of the statistics."""
+        return {'return_status': self.returnStatus, 'success': self.success,
+                'solver_t_proc': self.tProc,
+                'solver_t_wall': self.tWall, 'solver_n_call': self.nCall}
+
+
+def statisticsDataArrays(records, phases):
+    """statisticsDataArrays Returns the metadata variables of recorded SolverStatistics.
+
+    :param records: Recorded arrays per channel as returned by MetadataRecorder.data
+    :param phases: Names of the solver phases
+    :returns: A dictionary of xarray.DataArrays with the dimensions control_step and
+    solver_phase
+    """
+
+    meta = {}
+    meta['return_status'] = xr.DataArray(np.array(returnStatuses)[
+        records['return_status'].astype(int)], dims=('control_step'))
+    meta['success'] = xr.DataArray(records['success'].astype(bool), dims=('control_step'))
+    for name in ('solver_t_proc', 'solver_t_wall', 'solver_n_call'):
+        meta[name] = xr.DataArray(records[name].T, dims=('solver_phase', 'control_step'),
+                                  coords={'solver_phase': list(phases)})
+
+    return meta
@@ -0,0 +1,27 @@
+class StepHook:
+    """Base class of hooks that are called by a controller around the solver of every control
+    step, e.g. to forward timings and solver statistics to a metrics pipeline. Register a hook
+    via the addHook method of the controller. Hooks run on the control thread, i.e. their
+    duration adds to the step.
+
+    Both methods do nothing by default, so a hook only overrides what it needs.
+    """
+
+    def preSolve(self, controller, step):
+        """preSolve Called after the parameters of a step are set and before the solver runs.
+
+        :param controller: The controller performing the step
+        :param step: Index of the control step
+        """
+        pass
+
+    def postSolve(self, controller, step, values):
+        """postSolve Called at the end of a step with the values of all metadata channels of
+        the step, e.g. 'phase_times', 'iterations' or 'solver_t_wall'. The values are only
+        valid during the call, arrays may be reused by the next step.
+
+        :param controller: The controller performing the step
+        :param step: Index of the control step
+        :param values: Dictionary mapping channel names to values
+        """
+        pass
@@ -0,0 +1,258 @@
+import contextlib
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class WarmStartStore:
+    """Bounded store of converged primal-dual solutions, indexed by a feature vector of the
+    problem, e.g. the initial state and the reference window of the OCP parameters. A
+    controller retrieves the solution of the nearest previously solved problem as initial
+    guess (see the warmStartStore argument of Nmpc).
+
+    The features are a selection of the parameter vector, scaled per element. The distance
+    between two problems is the euclidean distance of their scaled features. When the store is
+    full, the least recently used entry (stored or retrieved) is evicted. Solutions closer than
+    <minDistance> to a stored one replace it, which keeps consecutive steps of a slowly varying
+    problem from filling the store.
+
+    With <shared>, the entries are kept in shared memory, guarded by a lock. The store can then
+    be passed to processes started by multiprocessing (e.g. as argument of Process or as
+    initargs of a process pool), which attach to the same entries. The creating process owns
+    the memory and releases it on :meth:`close`.
+
+    :param numParameters: Size of the parameter vector the features are taken from
+    :param numVariables: Number of optimization variables
+    :param numConstraints: Number of constraints
+    :param capacity: Maximum number of entries
+    :param featureIndices: Indices of the features in the parameter vector, defaults to all
+    :param scale: Scale of the features, a scalar or one value per feature
+    :param minDistance: Solutions closer than this to a stored one replace it
+    :param shared: Keeps the entries in shared memory
+    """
+
+    def __init__(self, numParameters, numVariables, numConstraints, capacity=256,
+                 featureIndices=None, scale=1., minDistance=0., shared=False):
+        if capacity < 1:
+            raise ValueError('The capacity of a warm start store must be positive')
+        if featureIndices is None:
+            featureIndices = np.arange(numParameters)
+
+        self.numParameters = numParameters
+        self.numVariables = numVariables
+        self.numConstraints = numConstraints
+        self.capacity = capacity
+        self.featureIndices = np.asarray(featureIndices, dtype=int).ravel()
+        self.scale = np.broadcast_to(np.asarray(scale, dtype=float),
+                                     self.featureIndices.shape).copy()
+        self.minDistance = minDistance
+        self.shared = shared
+
+        self._memory = None
+        # the memory is released by the creating process only, also if inherited by a fork
+        self._ownerPid = os.getpid()
+        if shared:
+            self._memory = shared_memory.SharedMemory(create=True, size=8 * self._blockSize())
+            self._lock = multiprocessing.Lock()
+            block = np.ndarray((self._blockSize(),), dtype=np.float64, buffer=self._memory.buf)
+            block.fill(0.)
+        else:
+            self._lock = contextlib.nullcontext()
+            block = np.zeros((self._blockSize(),))
+        self._view(block)
+
+        self._feature = np.zeros((self.featureIndices.size,))
+        self._distances = np.zeros((capacity,))
+
+    def _layout(self):
+        numFeatures = self.featureIndices.size
+        return (('_counters', (4,)), ('_features', (self.capacity, numFeatures)),
+                ('_lastUsed', (self.capacity,)), ('_iterations', (self.capacity,)),
+                ('_x', (self.capacity, self.numVariables)),
+                ('_lamX', (self.capacity, self.numVariables)),
+                ('_lamG', (self.capacity, self.numConstraints)))
+
+    def _blockSize(self):
+        return sum(int(np.prod(shape)) for _, shape in self._layout())
+
+    def _view(self, block):
+        # all entries are views into a single block, which may be shared memory
+        offset = 0
+        for name, shape in self._layout():
+            size = int(np.prod(shape))
+            setattr(self, name, block[offset:offset + size].reshape(shape))
+            offset += size
+
+    def __getstate__(self):
+        if not self.shared:
+            return self.__dict__
+        state = {key: value for key, value in self.__dict__.items()
+                 if key not in ('_memory',) + tuple(name for name, _ in self._layout())}
+        state['_memoryName'] = self._memory.name
+        return state
+
+    def __setstate__(self, state):
+        memoryName = state.pop('_memoryName', None)
+        self.__dict__.update(state)
+        if memoryName is not None:
+            # attach to the entries of the creating process
+            self._memory = shared_memory.SharedMemory(name=memoryName)
+            self._ownerPid = None
+            self._view(np.ndarray((self._blockSize(),), dtype=np.float64,
+                                  buffer=self._memory.buf))
+
+    def close(self):
+        """close Detaches from the shared memory and releases it in the creating process. The
+        store can not be used afterwards.
+        """
+        if self._memory is not None:
+            for name, _ in self._layout():
+                setattr(self, name, None)
+            self._memory.close()
+            if self._ownerPid == os.getpid():
+                self._memory.unlink()
+            self._memory = None
+
+    def __len__(self):
+        return int(self._counters[0])
+
+    @property
+    def lookups(self):
+        """Number of lookups of all processes sharing the store."""
+        return int(self._counters[2])
+
+    @property
+    def hits(self):
+        """Number of lookups that returned an entry."""
+        return int(self._counters[3])
+
+    def hitRate(self):
+        """hitRate Returns the fraction of lookups that returned an entry, or 0 without
+        lookups.
+        """
+        lookups = self.lookups
+        return self.hits / lookups if lookups else 0.
+
+    def features(self, parameters, out=None):
+        """features Returns the scaled feature vector of a parameter vector.
+
+        :param parameters: OCP parameter vector
+        :param out: Optional array the features are written to
+        :returns: The feature vector. Unless <out> is given, the array is reused by the next
+        call.
+        """
+        out = self._feature if out is None else out
+        np.take(np.asarray(parameters).ravel(), self.featureIndices, out=out)
+        out *= self.scale
+        return out
+
+    def _nearest(self, features):
+        n = len(self)
+        if n == 0:
+            return -1, np.inf
+        distances = self._distances[:n]
+        distances[:] = np.linalg.norm(self._features[:n] - features, axis=1)
+        index = int(np.argmin(distances))
+        return index, distances[index]
+
+    def lookup(self, features, maxDistance=np.inf, x=None, lamX=None, lamG=None):
+        """lookup Retrieves the entry nearest to the given features, if it is closer than
+        <maxDistance>, and marks it as recently used.
+
+        :param features: Scaled features of the problem, see :meth:`features`
+        :param maxDistance: Entries at this or a larger distance are ignored
+        :param x: Array the primal solution of the entry is copied to
+        :param lamX: Array the bound multipliers of the entry are copied to
+        :param lamG: Array the constraint multipliers of the entry are copied to
+        :returns: A 2-tuple (hit, distance) with the distance of the nearest entry, which is
+        infinite for an empty store
+        """
+        with self._lock:
+            index, distance = self._nearest(features)
+            hit = distance < maxDistance
+            self._counters[2] += 1
+            if hit:
+                self._counters[3] += 1
+                self._counters[1] += 1
+                self._lastUsed[index] = self._counters[1]
+                for target, source in ((x, self._x), (lamX, self._lamX), (lamG, self._lamG)):
+                    if target is not None:
+                        np.copyto(target, source[index])
+        return hit, distance
+
+    def insert(self, features, x, lamX, lamG, iterations=0):
+        """insert Stores a converged solution. It replaces the nearest entry if that is closer
+        than minDistance, or else the least recently used entry if the store is full.
+
+        :param features: Scaled features of the problem, see :meth:`features`
+        :param x: Primal solution
+        :param lamX: Bound multipliers
+        :param lamG: Constraint multipliers
+        :param iterations: Number of solver iterations of the solution
+        """
+        with self._lock:
+            index, distance = self._nearest(features)
+            n = len(self)
+            if index < 0 or distance > self.minDistance:
+                if n < self.capacity:
+                    index = n
+                    self._counters[0] += 1
+                else:
+                    index = int(np.argmin(self._lastUsed))
+
+            self._counters[1] += 1
+            self._lastUsed[index] = self._counters[1]
+            self._features[index] = features
+            self._iterations[index] = iterations
+            self._x[index] = np.asarray(x).ravel()
+            self._lamX[index] = np.asarray(lamX).ravel()
+            self._lamG[index] = np.asarray(lamG).ravel()
+
+    def clear(self):
+        """clear Removes all entries and resets the lookup counters."""
+        with self._lock:
+            self._counters.fill(0.)
+            self._lastUsed.fill(0.)
+
+    def save(self, filename):
+        """save Stores the entries and the feature configuration in a .npz file, ordered from
+        least to most recently used.
+
+        :param filename: Path of the file
+        """
+        with self._lock:
+            order = np.argsort(self._lastUsed[:len(self)], kind='stable')
+            np.savez(filename, features=self._features[order], iterations=self._iterations[order],
+                     x=self._x[order], lamX=self._lamX[order], lamG=self._lamG[order],
+                     sizes=np.array([self.numParameters, self.numVariables,
+                                     self.numConstraints]),
+                     featureIndices=self.featureIndices, scale=self.scale,
+                     minDistance=self.minDistance)
+
+    @classmethod
+    def load(cls, filename, capacity=None, shared=False):
+        """load Restores a store saved via :meth:`save`. If the capacity is smaller than the
+        number of saved entries, the most recently used ones are kept.
+
+        :param filename: Path of the file
+        :param capacity: Capacity of the store, defaults to the number of saved entries
+        :param shared: Keeps the entries in shared memory
+        :returns: A WarmStartStore object
+        """
+        with np.load(filename) as data:
+            numEntries = data['x'].shape[0]
+            capacity = capacity or max(numEntries, 1)
+            store = cls(*(int(size) for size in data['sizes']), capacity=capacity,
+                        featureIndices=data['featureIndices'], scale=data['scale'],
+                        minDistance=float(data['minDistance']), shared=shared)
+            keep = slice(max(numEntries - capacity, 0), numEntries)
+            n = keep.stop - keep.start
+            for name, key in (('_features', 'features'), ('_iterations', 'iterations'),
+                              ('_x', 'x'), ('_lamX', 'lamX'), ('_lamG', 'lamG')):
+                getattr(store, name)[:n] = data[key][keep]
+        store._counters[0] = n
+        store._counters[1] = n
+        store._lastUsed[:n] = np.arange(1, n + 1)
+        return store
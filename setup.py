@@ -22,8 +22,9 @@ setuptools.setup(
     setup_requires=['setuptools_scm'],
     install_requires=[
         'numpy',
-        'casadi',
+        'casadi>=3.6',
+        'scipy',
         'xarray'
     ],
-    python_requires='>=3.6',
+    python_requires='>=3.9',
 )
@@ -0,0 +1,81 @@
+"""OCP of a discrete-time pendulum with two states (angle and angular velocity) and one
+control, shared by the controller tests."""
+
+import types
+import numpy as np
+import casadi as ca
+from ocp_modules.controllers.Nmpc import Nmpc
+from ocp_modules.controllers.RtiNmpc import RtiNmpc
+from ocp_modules.modules import OcpVars
+from ocp_modules.modules import OcpParams
+from ocp_modules.modules import TrackingCosts
+from ocp_modules.modules import InitialValueConstraints
+from ocp_modules.modules import DirectMultipleShootingConstraints
+
+num_states = 2
+num_controls = 1
+state_weight = np.array([1., 0.1])
+control_weight = np.array([0.01])
+control_limits = np.array([[-1.], [1.]])
+
+# default IPOPT options without output
+solver_opts = dict(Nmpc.defaultSolverOptions,
+                   ipopt=dict(Nmpc.defaultSolverOptions['ipopt'], print_level=0))
+
+
+def build_ocp(horizon_length=10, state_limits=None, sym_type='SX', linear=False,
+              terminal_weight=None):
+    """Returns the variables, bounds, parameters, costs, cost residuals, constraints and the
+    discrete model of the OCP as attributes of a namespace. With <linear>, gravity is
+    neglected, i.e. the dynamics are linear. <terminal_weight> replaces the state weight of the
+    last stage."""
+
+    x = ca.SX.sym('x', num_states)
+    u = ca.SX.sym('u', num_controls)
+    gravity = 0. if linear else 0.1 * ca.sin(x[0])
+    model = ca.Function('F', [x, u], [ca.vertcat(x[0] + 0.1 * x[1],
+                                                 x[1] + gravity + 0.1 * u[0])])
+
+    var, lbw, ubw = OcpVars.gen(num_states, num_controls, horizon_length, state_limits,
+                                control_limits, sym_type)
+    params = OcpParams.gen(num_states, num_controls, horizon_length, sym_type)
+    costs = TrackingCosts.gen(var['x'][:], params['x_ref'][:], state_weight,
+                              terminalWeight=terminal_weight)
+    costs += TrackingCosts.gen(var['u'][:], params['u_ref'][:], control_weight)
+    residuals = TrackingCosts.residuals(var['x'][:], params['x_ref'][:], state_weight,
+                                        terminalWeight=terminal_weight)
+    residuals += TrackingCosts.residuals(var['u'][:], params['u_ref'][:], control_weight)
+    constraints = InitialValueConstraints.gen(var, params)
+    constraints += DirectMultipleShootingConstraints.gen(var, model, horizon_length)
+
+    return types.SimpleNamespace(horizon_length=horizon_length, var=var, lbw=lbw, ubw=ubw,
+                                 params=params, costs=costs, residuals=residuals,
+                                 constraints=constraints, model=model)
+
+
+def parameters(ocp, x_cur=(1., 0.), x_ref=None):
+    """Returns the parameter vector of the OCP, tracking the origin by default."""
+
+    if x_ref is None:
+        x_ref = np.zeros((num_states, ocp.horizon_length + 1))
+    return OcpParams.fill(ocp.params, {
+        'x_cur': np.array(x_cur), 'x_ref': x_ref,
+        'u_ref': np.zeros((num_controls, ocp.horizon_length))})
+
+
+def nmpc(ocp, **kwargs):
+    """Returns an Nmpc of the OCP, the keyword arguments are passed to its constructor."""
+
+    kwargs.setdefault('solvOpts', solver_opts)
+    return Nmpc(ocp.var, ocp.lbw, ocp.ubw, ocp.params, ocp.costs, ocp.constraints, num_states,
+                num_controls, ocp.horizon_length, **kwargs)
+
+
+def rti_nmpc(ocp, constraints=None, **kwargs):
+    """Returns an RtiNmpc of the OCP starting from zeros, optionally with other constraints.
+    The keyword arguments are passed to its constructor."""
+
+    return RtiNmpc(ocp.var, ocp.lbw, ocp.ubw, ocp.params, ocp.costs,
+                   ocp.constraints if constraints is None else constraints, num_states,
+                   num_controls, ocp.horizon_length, np.zeros(ocp.var.size), state_weight,
+                   control_weight, **kwargs)
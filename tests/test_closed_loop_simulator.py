@@ -0,0 +1,69 @@
+import numpy as np
+from ocp_modules.controllers.Nmpc import Nmpc
+from ocp_modules.modules import OcpVars
+from ocp_modules.modules import OcpParams
+from ocp_modules.modules import TrackingCosts
+from ocp_modules.modules import InitialValueConstraints
+from ocp_modules.modules import DirectMultipleShootingConstraints
+from ocp_modules.utils.closed_loop_simulator import ClosedLoopSimulator
+from ocp_modules.models.Rocket import Rocket
+
+
+def test_closed_loop_simulator():
+    sampling_time = 0.1
+    horizon_length = 5
+    num_steps = 5
+
+    model = Rocket()
+    num_states = model.NUMSTATES()
+    num_controls = model.NUMCONTROLS()
+    model_discrete = model.createTimeDiscreteFun(model.ode, sampling_time, num_states,
+                                                 num_controls)
+
+    def build():
+        var, lbw, ubw = OcpVars.gen(num_states, num_controls, horizon_length, None,
+                                    np.array([[0, -2e1], [2e3, 2e1]]))
+        params = OcpParams.gen(num_states, num_controls, horizon_length)
+        costs = TrackingCosts.gen(var['x'][:], params['x_ref'][:],
+                                  np.array([1., 1., 0., 0., 0., 0.1]) * 1e-2)
+        costs += TrackingCosts.gen(var['u'][:], params['u_ref'][:], np.array([0.01, 1.]) * 1e-4)
+        constr = InitialValueConstraints.gen(var, params)
+        constr += DirectMultipleShootingConstraints.gen(var, model_discrete, horizon_length)
+        solver_opts = {'ipopt': dict(Nmpc.defaultSolverOptions['ipopt'], print_level=0),
+                       'print_time': 0}
+        return Nmpc(var, lbw, ubw, params, costs, constr, num_states, num_controls,
+                    horizon_length, solvOpts=solver_opts), params
+
+    x0 = np.zeros((num_states,))
+    state_ref = np.zeros((num_states, num_steps + horizon_length + 1))
+    state_ref[:2] = 10.
+    control_ref = np.zeros((num_controls, num_steps + horizon_length))
+
+    controller, _ = build()
+    simulator = ClosedLoopSimulator(model, controller, sampling_time, horizon_length, num_steps)
+    states, controls, durations = simulator.run(x0, state_ref, control_ref)
+
+    # reference: loop with a separate controller
+    controller, params = build()
+    x = x0
+    for i in range(num_steps):
+        ocp_parameters = OcpParams.fill(params, {'x_cur': x,
+                                                 'x_ref': state_ref[:, i:i + horizon_length + 1],
+                                                 'u_ref': control_ref[:, i:i + horizon_length]})
+        u = controller.step(ocp_parameters)[:, 0]
+        assert np.allclose(controls[:, i], u)
+        x = np.array(model_discrete(x, u)).ravel()
+        assert np.allclose(states[:, i + 1], x)
+
+    assert durations.shape == (num_steps,) and np.all(durations > 0)
+
+    # process noise is reproducible by the seed
+    noisy_states = []
+    for _ in range(2):
+        controller, _ = build()
+        simulator = ClosedLoopSimulator(model, controller, sampling_time, horizon_length,
+                                        num_steps, processNoise=0.01 * np.ones(num_states),
+                                        seed=3)
+        noisy_states.append(simulator.run(x0, state_ref, control_ref)[0].copy())
+    assert np.array_equal(noisy_states[0], noisy_states[1])
+    assert not np.allclose(noisy_states[0], states)
@@ -0,0 +1,31 @@
+import numpy as np
+import casadi as ca
+from ocp_modules.modules import DirectMultipleShootingConstraints
+from ocp_modules.modules import OcpVars
+
+
+def test_mapped_constraints():
+    num_states = 2
+    num_controls = 1
+    horizon_length = 4
+
+    def model(x, u):
+        return ca.vertcat(x[0] + 0.1 * ca.sin(x[1]), x[1] + 0.1 * u[0])
+
+    var, _, _ = OcpVars.gen(num_states, num_controls, horizon_length)
+
+    constr = DirectMultipleShootingConstraints.gen(var, model, horizon_length)
+    g = ca.vertcat(*[c[0] for c in constr])
+
+    for parallelization in ['serial', 'thread']:
+        mapped = DirectMultipleShootingConstraints.genMapped(var, model, horizon_length,
+                                                             parallelization)
+        assert len(mapped) == 1
+        g_mapped, lbg, ubg = mapped[0]
+        assert g_mapped.shape == g.shape
+        assert (lbg == 0).all() and (ubg == 0).all()
+
+        w = np.random.rand(var.size)
+        g_fun = ca.Function('g_fun', [var], [g, g_mapped])
+        g_value, g_mapped_value = g_fun(w)
+        assert np.allclose(g_value.full(), g_mapped_value.full())
@@ -0,0 +1,64 @@
+import numpy as np
+from ocp_modules.controllers.ExplicitNmpc import ExplicitNmpc
+from ocp_modules.modules import OcpParams
+from tests import pendulum
+from tests.pendulum import num_states, num_controls
+
+horizon_length = 10
+
+
+def build_controller():
+    return pendulum.nmpc(pendulum.build_ocp(horizon_length))
+
+
+def online_control(x, x_ref):
+    controller = build_controller()
+    packer = OcpParams.ParamPacker(controller.params)
+    return controller.step(packer.pack({'x_cur': x, 'x_ref': x_ref,
+                                        'u_ref': np.zeros((num_controls, horizon_length))}))[:, 0]
+
+
+def test_explicit_nmpc(tmp_path):
+    x_refs = np.zeros((num_states, horizon_length + 1))
+    u_refs = np.zeros((num_controls, horizon_length))
+
+    # law of the first state and the setpoint of the first state
+    axes = [np.linspace(-1., 1., 9), np.linspace(-0.5, 0.5, 3)]
+    controller = ExplicitNmpc.fromGrid(build_controller, axes, [0], [0], maxWorkers=2)
+    assert controller.valid.all()
+    assert controller.solutions.shape == (27, controller.onlineController.var.size)
+
+    # the law is exact at the samples and interpolated in between
+    x_refs[0] = 0.5
+    u, data = controller.step(np.array([0.25, 0.]), x_refs, u_refs)
+    assert np.allclose(u, online_control(np.array([0.25, 0.]), x_refs), atol=1e-6)
+    assert not data['fallback']
+    u, data = controller.step(np.array([0.375, 0.]), x_refs, u_refs)
+    assert np.allclose(u, controller.controls[[17, 20]].mean(0))
+    assert abs(u - online_control(np.array([0.375, 0.]), x_refs)) < data['error_estimate']
+
+    # outside of the grid or with a large error estimate, the online controller is used
+    u, data = controller.step(np.array([2., 0.]), x_refs, u_refs)
+    assert data['fallback'] and controller.numFallbacks == 1
+    assert np.allclose(u, online_control(np.array([2., 0.]), x_refs), atol=1e-6)
+    controller.errorTolerance = 0.5
+    u, data = controller.step(np.array([0.375, 0.]), x_refs, u_refs)
+    assert data['fallback'] and controller.numFallbacks == 2
+    assert np.allclose(u, online_control(np.array([0.375, 0.]), x_refs), atol=1e-6)
+
+    filename = tmp_path / 'law.npz'
+    controller.save(filename)
+    restored = ExplicitNmpc.load(filename)
+    assert np.allclose(restored.step(np.array([0.375, 0.]), x_refs, u_refs)[0],
+                       controller.controls[[17, 20]].mean(0))
+
+    # scattered samples
+    points = np.random.default_rng(0).uniform(-1., 1., (30, 2))
+    controller = ExplicitNmpc.fromSamples(build_controller, points, [0, 1], maxWorkers=2,
+                                          maxDistance=0.3)
+    x_refs[0] = 0.
+    u, data = controller.step(points[3], x_refs, u_refs)
+    assert np.allclose(u, online_control(points[3], x_refs), atol=1e-6)
+    assert not data['fallback'] and data['error_estimate'] == 0.
+    u, data = controller.step(np.array([3., 0.]), x_refs, u_refs)
+    assert data['fallback']
@@ -0,0 +1,29 @@
+import numpy as np
+import casadi as ca
+import pytest
+from ocp_modules.utils.function_buffer import BufferedFunction
+
+
+def test_buffered_function():
+    x = ca.SX.sym('x', 3)
+    p = ca.SX.sym('p')
+    f = ca.Function('f', [x, p], [ca.sin(x) * p, ca.diag(x)], ['x', 'p'], ['y', 'd'])
+    g = ca.Function('g', [x], [ca.sum1(x)], ['y'], ['s'])
+
+    f_buffered = BufferedFunction(f)
+    g_buffered = BufferedFunction(g)
+    g_buffered.bindArg('y', f_buffered.res['y'])
+
+    f_buffered.args['x'][:] = [1., 2., 3.]
+    f_buffered.args['p'][:] = 2.
+    f_buffered()
+    g_buffered()
+
+    res = f(f_buffered.args['x'], 2.)
+    assert np.allclose(f_buffered.res['y'], np.array(res[0]).ravel())
+    # sparse outputs are stored as nonzeros
+    assert np.allclose(f_buffered.res['d'], [1., 2., 3.])
+    assert np.isclose(g_buffered.res['s'][0], np.sum(np.sin([1., 2., 3.]) * 2.))
+
+    with pytest.raises(ValueError):
+        f_buffered.bindArg('x', np.zeros((3,), dtype=np.float32))
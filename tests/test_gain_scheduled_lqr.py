@@ -0,0 +1,44 @@
+import numpy as np
+from ocp_modules.controllers.GainScheduledLqr import GainScheduledLqr
+from ocp_modules.controllers.Lqr import Lqr
+
+
+def linearization(x, u):
+    # double integrator whose input gain depends on the first state
+    A = np.array([[1., 0.1], [0., 1.]])
+    B = np.array([[0.], [0.1 * (1. + x[0] ** 2)]])
+    return A, B
+
+
+def operating_point(scheduling_values):
+    return np.array([scheduling_values[0], 0.]), np.zeros((1,))
+
+
+def test_gain_schedule(tmp_path):
+    Q = np.eye(2)
+    R = np.eye(1)
+    axes = [np.linspace(-1., 1., 5)]
+
+    controller = GainScheduledLqr.fromLinearizations(linearization, operating_point, axes, [0],
+                                                     Q, R)
+    assert controller.gains.shape == (5, 1, 2)
+
+    # gains at grid points match a plain LQR
+    for p in axes[0]:
+        K = Lqr.solveRiccati(*linearization(*operating_point([p])), Q, R, method='schur')
+        assert np.allclose(controller.gain([p]), K)
+
+    # gains in between are interpolated, outside they are clamped
+    assert np.allclose(controller.gain([-0.75]),
+                       (controller.gains[0] + controller.gains[1]) / 2)
+    assert np.allclose(controller.gain([3.]), controller.gains[-1])
+
+    x = np.array([0.3, 0.2])
+    u, data = controller.step(x, np.zeros((2, 1)), np.zeros((1, 1)))
+    assert np.allclose(u, -controller.gain([0.3]) @ x)
+
+    filename = tmp_path / 'gains.npz'
+    controller.save(filename)
+    restored = GainScheduledLqr.load(filename)
+    assert np.array_equal(restored.gains, controller.gains)
+    assert np.allclose(restored.step(x, np.zeros((2, 1)), np.zeros((1, 1)))[0], u)
@@ -0,0 +1,64 @@
+import numpy as np
+from ocp_modules.controllers.GainScheduledLqr import GainScheduledLqr
+from ocp_modules.utils.linearization import Linearization
+from ocp_modules.models.Chain import Chain
+
+sampling_time = 0.1
+
+
+def finite_differences(fun, x, u, eps=1e-6):
+    x_next = np.array(fun(x, u)).ravel()
+    z = np.concatenate((x, u))
+    jac = np.zeros((x.size, z.size))
+    for i in range(z.size):
+        dz = z.copy()
+        dz[i] += eps
+        jac[:, i] = (np.array(fun(dz[:x.size], dz[x.size:])).ravel() - x_next) / eps
+    return jac[:, :x.size], jac[:, x.size:]
+
+
+def test_linearization():
+    model = Chain(4, 1, nonlinear=True)
+    x = np.array([0.3, -0.2, 0.1, 0.4])
+    u = np.array([0.5])
+
+    for integrator_type in ('rk', 'cvodes'):
+        linearization = Linearization.fromModel(model, sampling_time, integrator_type)
+        fun = model.createTimeDiscreteFun(model.ode, sampling_time, 4, 1, integrator_type)
+        A, B = linearization(x, u)
+        A_fd, B_fd = finite_differences(fun, x, u)
+        assert np.allclose(A, A_fd, atol=1e-4) and np.allclose(B, B_fd, atol=1e-4)
+        assert np.allclose(linearization.nextState(), np.array(fun(x, u)).ravel())
+
+    # batches match single evaluations
+    linearization = Linearization.fromModel(model, sampling_time)
+    xs = np.stack((x, -x, 2 * x), axis=1)
+    us = np.array([[0.5, 0., -1.]])
+    A, B = linearization.batch(xs, us)
+    assert A.shape == (3, 4, 4) and B.shape == (3, 4, 1)
+    for i in range(3):
+        A_i, B_i = linearization(xs[:, i], us[:, i])
+        assert np.allclose(A[i], A_i) and np.allclose(B[i], B_i)
+
+    # the euler approximation depends on the linearization point after the first call
+    A_euler = model.getDiscreteLinearSystem(model.ode, x, u, sampling_time)[0]
+    assert not np.allclose(A_euler, model.getDiscreteLinearSystem(model.ode, 2 * x, u,
+                                                                  sampling_time)[0])
+    assert np.allclose(A_euler, linearization(x, u)[0], atol=0.1)
+
+
+def test_gain_schedule_from_linearization():
+    model = Chain(4, 1, nonlinear=True)
+    linearization = Linearization.fromModel(model, sampling_time)
+
+    def operating_point(scheduling_values):
+        return np.array([scheduling_values[0], 0., 0., 0.]), np.zeros((1,))
+
+    def single(x, u):
+        A, B = linearization(x, u)
+        return A.copy(), B.copy()
+
+    axes = [np.linspace(-1., 1., 5)]
+    args = (operating_point, axes, [0], np.eye(4), np.eye(1))
+    batched = GainScheduledLqr.fromLinearizations(linearization, *args)
+    assert np.allclose(batched.gains, GainScheduledLqr.fromLinearizations(single, *args).gains)
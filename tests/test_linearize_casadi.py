@@ -0,0 +1,40 @@
+import numpy as np
+import casadi as ca
+import pytest
+from ocp_modules.utils.linearize_casadi import linearize_casadi, valueAndJacobian
+
+
+def test_linearization_modes():
+    """Tests if both modes yield the first order approximation, also with parameters, and if the
+    Jacobian keeps its structural sparsity."""
+
+    x = ca.SX.sym('x', 3)
+    p = ca.SX.sym('p')
+    f = ca.vertcat(ca.sin(x[0]) * x[1], p * x[2] ** 2, x[0])
+    x_lin = ca.SX.sym('x_lin', 3)
+    values = ([1., 2., 3.], [0.5, 1., 2.], 2.)
+
+    dx = np.array(values[0]) - np.array(values[1])
+    jacobian = np.array([[np.cos(0.5), np.sin(0.5), 0.], [0., 0., 8.], [1., 0., 0.]])
+    expected = np.array([np.sin(0.5), 8., 0.5]) + jacobian @ dx
+
+    for mode in ('jacobian', 'jtimes'):
+        f_lin = linearize_casadi(f, x, x_lin, mode=mode)
+        result = ca.Function('f_lin', [x, x_lin, p], [f_lin])(*values)
+        assert np.allclose(np.array(result).ravel(), expected)
+
+    _, jac = valueAndJacobian(f, x)
+    assert jac.nnz() == 4
+
+    with pytest.raises(ValueError):
+        linearize_casadi(f, x, x_lin, mode='adjoint')
+
+
+def test_linearization_function():
+    x = ca.SX.sym('x', 2)
+    f = ca.vertcat(ca.exp(x[0]) * x[1], x[1] ** 2)
+    fun = linearize_casadi(f, x, mode='jtimes', asFunction=True)
+    assert fun.name_in() == ['x', 'x_lin']
+    x_lin = np.array([0.1, -0.3])
+    assert np.allclose(np.array(fun(x_lin, x_lin)).ravel(),
+                       [np.exp(0.1) * -0.3, 0.09])
@@ -29,3 +29,48 @@ def test_step():
 
     assert np.allclose(u, np.zeros((2,)))
     assert data['f'] is None
+
+
+def test_riccati_methods():
+    A = np.array([[1., 0.1], [0., 1.]])
+    B = np.array([[0.], [0.1]])
+    Q = np.eye(2)
+    R = np.eye(1)
+
+    K_iteration = Lqr.solveRiccati(A, B, Q, R, eps=1e-12)
+
+    for method in ['doubling', 'schur']:
+        K, P, info = Lqr.solveRiccati(A, B, Q, R, method=method, fullOutput=True)
+        assert np.allclose(K, K_iteration)
+        assert info['converged']
+        assert info['residual'] < 1e-8
+
+        # warm start from a perturbed solution
+        K, _, info = Lqr.solveRiccati(A, B, Q, R, method=method, P0=P * 1.1, fullOutput=True)
+        assert np.allclose(K, K_iteration)
+
+
+def test_step_batch():
+    A = np.array([[1., 0.1, 0.], [0., 1., 0.1], [0., 0., 1.]])
+    B = np.array([[0., 0.], [0.1, 0.], [0., 0.1]])
+    Q = np.eye(3)
+    R = np.eye(2)
+    num_samples = 50
+
+    lqr = Lqr(A, B, Q, R)
+
+    rng = np.random.default_rng(0)
+    x = rng.standard_normal((num_samples, 3))
+    x_ref = rng.standard_normal((num_samples, 3))
+    u_ref = rng.standard_normal((num_samples, 2))
+
+    u_single = np.array([lqr.step(x[i], x_ref[i:i+1].T, u_ref[i:i+1].T)[0]
+                         for i in range(num_samples)])
+
+    u_batch = lqr.stepBatch(x, x_ref, u_ref)
+    assert u_batch.shape == (num_samples, 2)
+    assert np.allclose(u_batch, u_single, rtol=1e-12, atol=1e-12)
+
+    out = np.empty((num_samples, 2))
+    assert lqr.stepBatch(x, x_ref, u_ref, out=out) is out
+    assert np.array_equal(out, u_batch)
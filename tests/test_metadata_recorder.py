@@ -0,0 +1,39 @@
+import numpy as np
+from ocp_modules.utils.metadata_recorder import MetadataRecorder
+
+
+def record_steps(recorder, num_steps):
+    for i in range(num_steps):
+        recorder.record(vector=np.full((3,), i), scalar=i)
+
+
+def test_policies():
+    channels = {'vector': 3, 'scalar': ()}
+
+    recorder = MetadataRecorder(channels)
+    record_steps(recorder, 100)
+    steps, data = recorder.data()
+    assert np.array_equal(steps, np.arange(100))
+    assert data['vector'].shape == (100, 3)
+    assert np.array_equal(data['scalar'], np.arange(100))
+
+    recorder = MetadataRecorder(channels, policy='off')
+    record_steps(recorder, 10)
+    steps, data = recorder.data()
+    assert steps.size == 0
+    assert data['vector'].shape == (0, 3)
+
+    recorder = MetadataRecorder(channels, policy='last', capacity=8)
+    record_steps(recorder, 21)
+    steps, data = recorder.data()
+    assert np.array_equal(steps, np.arange(13, 21))
+    assert np.array_equal(data['vector'][:, 0], np.arange(13, 21))
+
+    recorder = MetadataRecorder(channels, policy='every', every=5)
+    record_steps(recorder, 21)
+    steps, data = recorder.data()
+    assert np.array_equal(steps, [0, 5, 10, 15, 20])
+    assert np.array_equal(data['scalar'], [0, 5, 10, 15, 20])
+
+    recorder.reset()
+    assert len(recorder) == 0
@@ -0,0 +1,41 @@
+import numpy as np
+import casadi as ca
+import xarray as xr
+from ocp_modules.controllers.RtiNmpc import RtiNmpc
+from ocp_modules.modules import OcpVars
+from ocp_modules.modules import OcpParams
+from ocp_modules.utils.metadata_sink import MetadataSink, openMetadata
+
+
+def test_stream_metadata(tmp_path):
+    horizon_length = 5
+    num_states = 3
+    num_controls = 2
+
+    bounds = np.array([[-10.], [10.]])
+    var, lbw, ubw = OcpVars.gen(num_states, num_controls, horizon_length,
+                                bounds * np.ones((2, num_states)), bounds * np.ones((2, num_controls)))
+    ocp_params = OcpParams.gen(num_states, num_controls, horizon_length)
+    costs = [ca.sumsqr(var['x'] - ocp_params['x_ref']) + ca.sumsqr(var['u'])]
+    constraints = [(var['u'][0], -1, 1)]
+    w0 = np.zeros((var.size,))
+
+    controller = RtiNmpc(var, lbw, ubw, ocp_params, costs, constraints, num_states, num_controls,
+                         horizon_length, w0, np.ones((num_states,)), np.ones((num_controls,)))
+
+    sink = MetadataSink(str(tmp_path / 'meta'), chunkSize=2)
+    sink.attach(controller)
+
+    packer = OcpParams.ParamPacker(ocp_params)
+    for i in range(4):
+        controller.step(packer.pack({'x_cur': np.full((num_states,), i)}).copy())
+    sink.flush(wait=True)
+    assert openMetadata(str(tmp_path / 'meta')).residuals.size == 4
+
+    # only full chunks are written before flushing or closing
+    controller.step(packer.pack({'x_cur': np.full((num_states,), 4)}).copy())
+    assert openMetadata(str(tmp_path / 'meta')).residuals.size == 4
+
+    sink.close()
+    streamed = openMetadata(str(tmp_path / 'meta'))
+    xr.testing.assert_identical(streamed, controller.get_metadata())
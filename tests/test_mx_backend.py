@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from ocp_modules.modules import OcpVars
+from tests import pendulum
+from tests.pendulum import num_states, num_controls
+
+
+def test_mx_backend():
+    """Tests if controllers built on MX variables and parameters solve the OCP of the SX
+    backend with the same layout."""
+
+    horizon_length = 10
+    solutions = {}
+    for sym_type in ('SX', 'MX'):
+        ocp = pendulum.build_ocp(horizon_length, sym_type=sym_type)
+        parameters = pendulum.parameters(ocp)
+        controller = pendulum.nmpc(ocp, warmStart='reuse')
+        controller.step(parameters)
+        rti = pendulum.rti_nmpc(ocp)
+        rti.step(parameters, maxIterations=20)
+
+        solutions[sym_type] = (controller.w0.copy(), controller.lagrMulConstr.copy(),
+                               rti.w0.copy(), rti.lagrMulConstr.copy())
+        # the shooting constraints are a single mapped expression
+        assert len(ocp.constraints) == (1 + horizon_length if sym_type == 'SX' else 2)
+
+    for sx, mx in zip(solutions['SX'], solutions['MX']):
+        assert np.allclose(sx, mx, atol=1e-8)
+    assert np.allclose(solutions['MX'][0], solutions['MX'][2], atol=1e-6)
+
+    with pytest.raises(ValueError):
+        OcpVars.gen(num_states, num_controls, horizon_length, symType='DM')
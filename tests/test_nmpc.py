@@ -0,0 +1,149 @@
+import numpy as np
+import casadi as ca
+from ocp_modules.controllers.Nmpc import Nmpc
+from ocp_modules.modules import DirectMultipleShootingConstraints
+from ocp_modules.utils.horizon_shift import primalShiftIndices, constraintShiftIndices
+from ocp_modules.utils.step_hooks import StepHook
+from tests import pendulum
+from tests.pendulum import num_states, num_controls
+
+
+def test_shift_indices():
+    horizon_length = 5
+    ocp = pendulum.build_ocp(horizon_length)
+    controller, constraints = pendulum.nmpc(ocp), ocp.constraints
+
+    w = np.arange(controller.var.size)
+    x = w[:num_states * (horizon_length + 1)]
+    u = w[num_states * (horizon_length + 1):]
+    shifted = np.concatenate((x[num_states:], x[-num_states:], u[num_controls:],
+                              u[-num_controls:]))
+    assert np.array_equal(w[primalShiftIndices(num_states, num_controls, horizon_length)],
+                          shifted)
+
+    # initial value constraints and the last shooting constraint keep their multipliers, the
+    # other shooting constraints take the ones of the next stage, also if all shooting
+    # constraints form a single expression
+    mapped_constraints = constraints[:1] + DirectMultipleShootingConstraints.genMapped(
+        controller.var, ocp.model, horizon_length)
+
+    expected = np.arange(num_states * (horizon_length + 1))
+    expected[num_states:-num_states] += num_states
+    for c in (constraints, mapped_constraints):
+        indices = constraintShiftIndices([g for g, _, _ in c], controller.var.cat, num_states,
+                                         num_controls, horizon_length)
+        assert np.array_equal(indices, expected)
+
+
+def test_warm_start():
+    """Tests if reusing the primal-dual solution of an unchanged problem saves iterations."""
+
+    ocp = pendulum.build_ocp()
+    nlp_parameters = pendulum.parameters(ocp)
+    iterations = {}
+    for warm_start in ('reuse', 'none'):
+        controller = pendulum.nmpc(ocp, warmStart=warm_start)
+        u = [controller.step(nlp_parameters)]
+        # the solver with the warm start options is built for the first warm started step
+        assert controller.warmSolver is None
+        u.append(controller.step(nlp_parameters))
+        iterations[warm_start] = controller.get_metadata().iterations.values
+
+        # only the warm started step is solved with the warm start options
+        if warm_start == 'none':
+            assert controller.warmSolver is None
+        else:
+            assert controller._solverBuffer.stats()['iter_count'] == iterations[warm_start][0]
+            assert controller._warmSolverBuffer.stats()['iter_count'] == iterations[warm_start][1]
+
+        assert isinstance(controller.w0, np.ndarray)
+        assert np.allclose(u[0], u[1], atol=1e-6)
+        # returned controls are copies unless a view into the solution buffer is requested
+        assert not np.shares_memory(u[0], u[1])
+        assert np.shares_memory(controller.step(nlp_parameters, copy=False),
+                                controller.step(nlp_parameters, copy=False))
+
+    assert iterations['reuse'][1] < iterations['none'][1]
+
+
+def test_anytime():
+    """Tests if a step stopped by the maximum number of iterations returns a fallback and
+    records it."""
+
+    ocp = pendulum.build_ocp()
+    controller = pendulum.nmpc(ocp, warmStart='none', anytime=True)
+    nlp_parameters = pendulum.parameters(ocp)
+
+    controller.step(nlp_parameters, maxIterations=2)
+    fallback = controller.fallback
+    assert fallback in ('best_feasible', 'last_iterate')
+    controller.step(nlp_parameters, deadline=10.)
+    assert controller.fallback == 'none'
+
+    metadata = controller.get_metadata()
+    assert metadata.iterations.values[0] == 2
+    assert list(metadata.fallback.values) == [fallback, 'none']
+    assert not metadata.deadline_missed.values.any()
+
+    # after a reference jump, the previous solution is feasible, but the following iterates
+    # are not. The objective and constraint values of the solver output belong to the best
+    # feasible iterate rather than to the last one.
+    controller = pendulum.nmpc(ocp, warmStart='reuse', anytime=True)
+    controller.step(nlp_parameters)
+    nlp_parameters = pendulum.parameters(ocp, x_ref=np.tile([[2.], [0.]],
+                                                            (1, ocp.horizon_length + 1)))
+    controller.step(nlp_parameters, maxIterations=2)
+    assert controller.fallback == 'best_feasible'
+    res = controller._solverBuffer.res
+    nlp = ca.Function('nlp', [controller.var, controller.params],
+                      [controller.costs, controller.g])
+    f, g = nlp(res['x'], nlp_parameters)
+    assert np.isclose(float(f), res['f'][0])
+    assert np.allclose(np.array(g).ravel(), res['g'])
+
+
+def test_step_statistics():
+    """Tests if phase timings and solver statistics are recorded and passed to hooks."""
+
+    class Hook(StepHook):
+        def __init__(self):
+            self.calls = []
+
+        def preSolve(self, controller, step):
+            self.calls.append(('pre', step))
+
+        def postSolve(self, controller, step, values):
+            self.calls.append(('post', step, values['solver_n_call'].copy()))
+
+    ocp = pendulum.build_ocp()
+    controller = pendulum.nmpc(ocp)
+    hook = Hook()
+    controller.addHook(hook)
+    nlp_parameters = pendulum.parameters(ocp)
+    for _ in range(2):
+        controller.step(nlp_parameters)
+
+    metadata = controller.get_metadata()
+    assert list(metadata.step_phase.values) == list(Nmpc.stepPhases)
+    assert (metadata.phase_times.values >= 0).all()
+    assert np.allclose(metadata.phase_times.sel(step_phase='solve'), metadata.computation_times)
+    assert list(metadata.return_status.values) == ['SOLVER_RET_SUCCESS'] * 2
+    assert metadata.success.values.all()
+    assert (metadata.solver_t_wall.sel(solver_phase='nlp_hess_l') > 0).all()
+    assert (metadata.solver_n_call.sel(solver_phase='nlp_hess_l') ==
+            metadata.iterations).all()
+
+    assert [call[:2] for call in hook.calls] == [('pre', 0), ('post', 0), ('pre', 1),
+                                                 ('post', 1)]
+    assert np.array_equal(hook.calls[3][2], metadata.solver_n_call.values[:, 1])
+
+    # steps skipped by the recording policy do not add to the statistics of recorded steps
+    controller = pendulum.nmpc(ocp, warmStart='none',
+                               recordOpts={'policy': 'every', 'every': 3})
+    for _ in range(7):
+        controller.step(nlp_parameters)
+
+    metadata = controller.get_metadata()
+    assert list(metadata.control_step.values) == [0, 3, 6]
+    assert (metadata.solver_n_call.sel(solver_phase='nlp_hess_l') ==
+            metadata.iterations).all()
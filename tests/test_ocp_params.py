@@ -0,0 +1,26 @@
+import numpy as np
+from ocp_modules.modules import OcpParams
+
+
+def test_param_packer():
+    num_states = 3
+    num_controls = 2
+    horizon_length = 4
+
+    params = OcpParams.gen(num_states, num_controls, horizon_length)
+    packer = OcpParams.ParamPacker(params)
+
+    value_map = {'x_cur': np.arange(num_states),
+                 'x_ref': np.random.rand(num_states, horizon_length + 1),
+                 'u_ref': np.random.rand(num_controls, horizon_length)}
+
+    assert np.array_equal(packer.pack(value_map), OcpParams.fill(params, value_map))
+
+    # partial update only rewrites the passed entries
+    value_map['x_cur'] = np.ones((num_states,))
+    assert np.array_equal(packer.pack({'x_cur': value_map['x_cur']}),
+                          OcpParams.fill(params, value_map))
+
+    # columns are broadcast like in fill
+    value_map['x_ref'] = np.arange(num_states)
+    assert np.array_equal(packer.pack(value_map), OcpParams.fill(params, value_map))
@@ -0,0 +1,73 @@
+import numpy as np
+from ocp_modules.controllers.Nmpc import Nmpc
+from ocp_modules.modules import OcpVars
+from ocp_modules.modules import OcpParams
+from ocp_modules.modules import TrackingCosts
+from ocp_modules.modules import InitialValueConstraints
+from ocp_modules.modules import DirectMultipleShootingConstraints
+from ocp_modules.utils.closed_loop_simulator import ClosedLoopSimulator
+from ocp_modules.utils.parameter_sweep import ParameterSweep, gridScenarios, randomScenarios
+from ocp_modules.models.Rocket import Rocket
+
+sampling_time = 0.1
+horizon_length = 5
+num_steps = 4
+
+
+def build_model(config):
+    return Rocket({'mass': config['mass']})
+
+
+def build_controller(config):
+    model = Rocket()
+    num_states = model.NUMSTATES()
+    num_controls = model.NUMCONTROLS()
+    model_discrete = model.createTimeDiscreteFun(model.ode, sampling_time, num_states,
+                                                 num_controls)
+
+    var, lbw, ubw = OcpVars.gen(num_states, num_controls, horizon_length, None,
+                                np.array([[0, -2e1], [2e3, 2e1]]))
+    params = OcpParams.gen(num_states, num_controls, horizon_length)
+    costs = TrackingCosts.gen(var['x'][:], params['x_ref'][:],
+                              config['weight'] * np.array([1., 1., 0., 0., 0., 0.1]) * 1e-2)
+    costs += TrackingCosts.gen(var['u'][:], params['u_ref'][:], np.array([0.01, 1.]) * 1e-4)
+    constr = InitialValueConstraints.gen(var, params)
+    constr += DirectMultipleShootingConstraints.gen(var, model_discrete, horizon_length)
+    solver_opts = {'ipopt': dict(Nmpc.defaultSolverOptions['ipopt'], print_level=0),
+                   'print_time': 0}
+    return Nmpc(var, lbw, ubw, params, costs, constr, num_states, num_controls, horizon_length,
+                solvOpts=solver_opts)
+
+
+def test_parameter_sweep():
+    scenarios = gridScenarios({'weight': [1., 2.], 'mass': [0.8, 1.2]})
+    assert scenarios[1] == {'weight': 1., 'mass': 1.2}
+
+    x0 = np.zeros((6,))
+    state_ref = np.zeros((6, num_steps + horizon_length + 1))
+    state_ref[:2] = 10.
+    control_ref = np.zeros((2, num_steps + horizon_length))
+
+    sweep = ParameterSweep(build_controller, build_model, sampling_time, horizon_length,
+                           num_steps, controllerKeys=('weight',), maxWorkers=2)
+    results = sweep.run(scenarios, x0, state_ref, control_ref)
+
+    assert results.states.shape == (4, 6, num_steps + 1)
+    assert list(results.mass.values) == [0.8, 1.2, 0.8, 1.2]
+    assert np.all(results.errors.values == '')
+    assert np.all(results.computation_times.values > 0)
+
+    # each scenario matches a simulation with a separate controller, although the workers
+    # reuse their controllers
+    for i, config in enumerate(scenarios):
+        simulator = ClosedLoopSimulator(build_model(config), build_controller(config),
+                                        sampling_time, horizon_length, num_steps)
+        states, controls, _ = simulator.run(x0, state_ref, control_ref)
+        assert np.allclose(results.states[i], states)
+        assert np.allclose(results.controls[i], controls)
+
+    # failing scenarios are reported instead of aborting the sweep
+    scenarios = randomScenarios({'weight': 1., 'mass': (0.5, 1.5)}, 3, seed=0)
+    results = sweep.run(scenarios, x0, state_ref[:, :-1], control_ref)
+    assert all('References must cover' in error for error in results.errors.values)
+    assert np.all(np.isnan(results.states))
@@ -1,8 +1,12 @@
 import numpy as np
+import casadi as ca
+import pytest
 import xarray as xr
 from ocp_modules.controllers.RtiNmpc import RtiNmpc
 from ocp_modules.modules import OcpVars
 from ocp_modules.modules import OcpParams
+from ocp_modules.modules import TrackingCosts
+from tests import pendulum
 
 
 def test_get_metadata():
@@ -22,12 +26,13 @@ def test_get_metadata():
     var, lbw, ubw = OcpVars.gen(num_states, num_controls, horizon_length, None, None)
     ocp_params = OcpParams.gen(num_states, num_controls, horizon_length)
 
-    costs = [var['x'][0]]
-    constraints = [(var['u'][0], -1, 1)]
-
     state_weight = np.ones((num_states,))
     control_weight = np.ones((num_controls,))
 
+    costs = TrackingCosts.gen(var['x'][:], ocp_params['x_ref'][:], state_weight)
+    costs += TrackingCosts.gen(var['u'][:], ocp_params['u_ref'][:], control_weight)
+    constraints = [(var['u'][0], -1, 1)]
+
     controller = RtiNmpc(var, lbw, ubw, ocp_params, costs, constraints, num_states, num_controls,
                          horizon_length, w0, state_weight, control_weight)
 
@@ -57,3 +62,163 @@ def test_get_metadata():
     assert metadata.solution_states.shape == (num_states, horizon_length+1, 1)
     assert metadata.solution_controls.shape == (num_controls, horizon_length, 1)
     assert metadata.computation_times.shape == (1,)
+    assert metadata.preparation_times.shape == (1,)
+    assert metadata.feedback_times.shape == (1,)
+
+
+def test_prepare_feedback():
+    """Tests if the split preparation and feedback phases yield the same solution as a step,
+    even if the state passed to the preparation phase is only a prediction.
+    """
+
+    ocp = pendulum.build_ocp(linear=True)
+    controllers = [pendulum.rti_nmpc(ocp) for _ in range(2)]
+
+    x_cur = np.array([1., 0.])
+    predicted_parameters = pendulum.parameters(ocp, x_cur + 0.1)
+    parameters = pendulum.parameters(ocp, x_cur)
+
+    controllers[0].prepare(predicted_parameters)
+    u_split = controllers[0].feedback(x_cur)
+    u_step = controllers[1].step(parameters)
+
+    # linear dynamics: the QP is exact, i.e. the linearization point does not matter
+    assert np.allclose(u_split, u_step, atol=1e-6)
+
+    with pytest.raises(RuntimeError):
+        controllers[0].feedback(x_cur)
+
+    metadata = controllers[0].get_metadata()
+    assert metadata.preparation_times.shape == (1,)
+    assert metadata.feedback_times.shape == (1,)
+
+
+def test_sqp_iterations():
+    """Tests if further SQP iterations within a step converge to the solution of the NLP."""
+
+    ocp = pendulum.build_ocp()
+    controller = pendulum.rti_nmpc(ocp)
+    nlp = {'x': ocp.var, 'f': sum(ocp.costs),
+           'g': ca.vertcat(*[c[0] for c in ocp.constraints]), 'p': ocp.params}
+    solver = ca.nlpsol('solver', 'ipopt', nlp, {'ipopt': {'print_level': 0, 'tol': 1e-10},
+                                                'print_time': 0})
+
+    parameters = pendulum.parameters(ocp)
+    solution = np.array(solver(p=parameters, lbx=ocp.lbw, ubx=ocp.ubw, lbg=0.,
+                               ubg=0.)['x']).ravel()
+
+    controller.step(parameters, maxIterations=20)
+    assert np.allclose(controller.w0, solution, atol=1e-6)
+
+    metadata = controller.get_metadata()
+    assert 1 < metadata.iterations.values[0] < 20
+    assert metadata.fallback.values[0] == 'none'
+    assert not metadata.deadline_missed.values[0]
+
+    # solver statistics are summed over the QPs of the step
+    assert metadata.solver_n_call.sel(solver_phase='solver').values[0] == \
+        metadata.iterations.values[0]
+    assert metadata.phase_times.sel(step_phase='iterations').values[0] > 0
+    assert metadata.return_status.values[0] == 'SOLVER_RET_SUCCESS'
+
+
+def final_iterate(controller, parameters):
+    """Returns the primal-dual iterate and the objective after a feedback phase on a perturbed
+    state without preparation, followed by a step with up to three SQP iterations."""
+
+    controller.prepare(parameters)
+    controller.feedback(np.array([0.9, 0.05]))
+    controller.step(parameters, maxIterations=3)
+    return (controller.w0.copy(), controller.lagrMulOptVars.copy(),
+            controller.lagrMulConstr.copy(), controller.get_metadata().residuals.values)
+
+
+def test_condensing():
+    """Tests if full and partial condensing yield the primal-dual iterate of the uncondensed
+    QP, with bounds on eliminated states and a state feedback differing from the prepared
+    state."""
+
+    ocp = pendulum.build_ocp(state_limits=np.array([[-np.inf, -0.1], [np.inf, np.inf]]))
+    parameters = pendulum.parameters(ocp)
+
+    iterates = {condensing: final_iterate(pendulum.rti_nmpc(ocp, condensing=condensing,
+                                                            condensingBlockSize=3), parameters)
+                for condensing in RtiNmpc.condensingModes}
+
+    # the state bound is active
+    assert np.isclose(iterates['none'][0][1:2 * (ocp.horizon_length + 1):2].min(), -0.1)
+    for condensing in ('full', 'partial'):
+        for condensed, full in zip(iterates[condensing], iterates['none']):
+            assert np.allclose(condensed, full, atol=1e-8)
+
+    # condensing requires multiple shooting constraints defining every state
+    with pytest.raises(ValueError):
+        pendulum.rti_nmpc(ocp, ocp.constraints[1:], condensing='full')
+
+
+def test_riccati_qp_solver():
+    """Tests if the Riccati QP solver yields the primal-dual iterate of qpOASES with an active
+    state bound, and if it rejects QPs without multiple shooting structure."""
+
+    ocp = pendulum.build_ocp(state_limits=np.array([[-np.inf, -0.1], [np.inf, np.inf]]))
+    parameters = pendulum.parameters(ocp)
+
+    iterates = {}
+    for qpsol in ('qpoases', 'riccati'):
+        controller = pendulum.rti_nmpc(ocp, solvOpts={'qpsol': qpsol})
+        iterates[qpsol] = final_iterate(controller, parameters)
+
+    assert np.isclose(iterates['riccati'][0][1:2 * (ocp.horizon_length + 1):2].min(), -0.1)
+    for riccati, qpoases in zip(iterates['riccati'], iterates['qpoases']):
+        assert np.allclose(riccati, qpoases, atol=1e-5)
+    assert controller.get_metadata().success.values.all()
+
+    # the initial value constraints are missing
+    with pytest.raises(ValueError):
+        pendulum.rti_nmpc(ocp, ocp.constraints[1:], solvOpts={'qpsol': 'riccati'})
+    with pytest.raises(ValueError):
+        pendulum.rti_nmpc(ocp, solvOpts={'qpsol': 'riccati'}, condensing='full')
+
+
+def test_hessian_modes():
+    """Tests if the Hessian approximations converge to the solution of the exact Hessian and if
+    a constant Hessian is not evaluated with the QP data."""
+
+    ocp = pendulum.build_ocp()
+    parameters = pendulum.parameters(ocp)
+
+    solutions = {}
+    hessians = {}
+    for hessian, cost_residuals in (('exact', None), ('gauss_newton', None),
+                                    ('gauss_newton', ocp.residuals), ('constant', None)):
+        controller = pendulum.rti_nmpc(ocp, hessian=hessian, costResiduals=cost_residuals)
+        controller.step(parameters, maxIterations=50)
+        key = (hessian, cost_residuals is not None)
+        solutions[key] = controller.w0.copy()
+        hessians[key] = controller._hessianValues.copy()
+
+    for key, solution in solutions.items():
+        assert np.allclose(solution, solutions[('exact', False)], atol=1e-6)
+    # the residuals of linear tracking errors yield the constant Hessian of the costs
+    assert np.allclose(hessians[('gauss_newton', True)], hessians[('gauss_newton', False)])
+    assert np.allclose(hessians[('constant', False)], hessians[('gauss_newton', False)])
+    assert 'h' not in controller.qpDataFun.name_out()
+
+    with pytest.raises(ValueError):
+        pendulum.rti_nmpc(ocp, hessian='newton')
+
+    # the QP gradient is the one of the costs, i.e. all modes converge to the solution of the
+    # NLP also with costs that differ from the stage weights of the constant Hessian, which
+    # then converges linearly only
+    ocp = pendulum.build_ocp(terminal_weight=10 * pendulum.state_weight)
+    nlp = {'x': ocp.var, 'f': sum(ocp.costs),
+           'g': ca.vertcat(*[c[0] for c in ocp.constraints]), 'p': ocp.params}
+    solver = ca.nlpsol('solver', 'ipopt', nlp, {'ipopt': {'print_level': 0, 'tol': 1e-10},
+                                                'print_time': 0})
+    solution = np.array(solver(p=parameters, lbx=ocp.lbw, ubx=ocp.ubw, lbg=0.,
+                               ubg=0.)['x']).ravel()
+    for hessian, cost_residuals in (('exact', None), ('gauss_newton', ocp.residuals),
+                                    ('constant', None)):
+        controller = pendulum.rti_nmpc(ocp, hessian=hessian, costResiduals=cost_residuals)
+        controller.step(parameters, maxIterations=200)
+        assert np.allclose(controller.w0, solution, atol=1e-6)
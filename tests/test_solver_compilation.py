@@ -0,0 +1,56 @@
+import fcntl
+import numpy as np
+import casadi as ca
+from ocp_modules.utils.solver_compilation import SolverCache
+
+
+def test_solver_cache(tmp_path):
+    x = ca.SX.sym('x', 2)
+    p = ca.SX.sym('p', 2)
+    problem = {'x': x, 'p': p, 'f': ca.sumsqr(x - p), 'g': x[0] + 2 * x[1]}
+    args = {'p': [1., 2.], 'lbx': -1., 'ubx': 1.5, 'lbg': -np.inf, 'ubg': 1.}
+
+    nlp_opts = {'ipopt': {'print_level': 0}, 'print_time': 0}
+    qp_opts = {'printLevel': 'none'}
+
+    reference_nlp = ca.nlpsol('solver', 'ipopt', problem, nlp_opts)(**args)
+    reference_qp = ca.qpsol('solver', 'qpoases', problem, qp_opts)(**args)
+
+    cache = SolverCache(str(tmp_path), flags=('-O1',))
+    for _ in range(2):
+        nlp_solver = cache.nlpsol('solver', 'ipopt', problem, nlp_opts)
+        qp_solver = cache.qpsol('solver', 'qpoases', problem, qp_opts)
+
+    # compiled once, loaded once from the cache
+    assert cache.misses == 2
+    assert cache.hits == 2
+
+    for solver, reference in ((nlp_solver, reference_nlp), (qp_solver, reference_qp)):
+        res = solver(**args)
+        for key in ('x', 'f', 'g', 'lam_x', 'lam_g'):
+            assert np.allclose(res[key].full(), reference[key].full(), atol=1e-6)
+
+
+def test_solver_cache_eviction(tmp_path):
+    x = ca.SX.sym('x')
+    functions = [ca.Function('f%d' % i, [x], [x + i]) for i in range(3)]
+    cache = SolverCache(str(tmp_path), flags=('-O1',), maxSize=0)
+    paths = [tmp_path / cache._key('function', f, '', {}) for f in functions]
+
+    # a library that is in use by another process is not evicted
+    cache.function(functions[0])
+    with open(str(paths[0]) + '.lock') as lock:
+        fcntl.flock(lock, fcntl.LOCK_SH)
+        cache.function(functions[1])
+        assert paths[0].with_suffix('.so').exists()
+
+    # otherwise, all libraries but the last one are evicted, while the lock files are kept
+    compiled = cache.function(functions[2])
+    assert [p.with_suffix('.so').exists() for p in paths] == [False, False, True]
+    assert all(p.with_suffix('.lock').exists() for p in paths)
+    assert float(compiled(1.)) == 3.
+
+    # evicted libraries are compiled again
+    misses = cache.misses
+    assert float(cache.function(functions[0])(1.)) == 1.
+    assert cache.misses == misses + 1
@@ -0,0 +1,55 @@
+import numpy as np
+import casadi as ca
+from ocp_modules.modules import TrackingCosts
+
+
+def test_weight_forms():
+    stage_size = 3
+    num_stages = 5
+    n = stage_size * num_stages
+
+    a = ca.SX.sym('a', n)
+    b = ca.SX.sym('b', n)
+    values = [np.random.rand(n), np.random.rand(n)]
+
+    stage_weight = np.random.rand(stage_size)
+    stage_block = np.random.rand(stage_size, stage_size)
+    stage_block = stage_block @ stage_block.T
+    terminal_weight = np.random.rand(stage_size)
+
+    def cost_value(*args, **kwargs):
+        cost = TrackingCosts.gen(a, b, *args, **kwargs)[0]
+        return float(ca.Function('cost', [a, b], [cost])(*values))
+
+    # dense reference values
+    dense_diag = np.kron(np.eye(num_stages), np.diag(stage_weight))
+    dense_block = np.kron(np.eye(num_stages), stage_block)
+    dense_terminal = dense_diag.copy()
+    dense_terminal[-stage_size:, -stage_size:] = np.diag(terminal_weight)
+    err = values[0] - values[1]
+
+    assert np.isclose(cost_value(2.), 2. * err @ err)
+    assert np.isclose(cost_value(np.float64(2.)), 2. * err @ err)
+    assert np.isclose(cost_value(dense_diag), err @ dense_diag @ err)
+    assert np.isclose(cost_value(stage_weight), err @ dense_diag @ err)
+    assert np.isclose(cost_value(np.diag(dense_diag)), err @ dense_diag @ err)
+    assert np.isclose(cost_value(stage_block), err @ dense_block @ err)
+    assert np.isclose(cost_value([stage_block] * num_stages), err @ dense_block @ err)
+    assert np.isclose(cost_value(ca.DM(dense_block)), err @ dense_block @ err)
+    assert np.isclose(cost_value(stage_weight, terminalWeight=terminal_weight),
+                      err @ dense_terminal @ err)
+
+    # the hessian is block-diagonal
+    cost = TrackingCosts.gen(a, b, stage_block)[0]
+    hessian = ca.hessian(cost, a)[0]
+    assert hessian.nnz() == num_stages * stage_size ** 2
+
+
+def test_row_vector():
+    """Row vectors, e.g. the controls of a single input system, are weighted element-wise."""
+
+    u = ca.SX.sym('u', 1, 4)
+    weight = np.array([2.])
+    cost = TrackingCosts.gen(u, ca.DM.zeros(1, 4), weight)[0]
+
+    assert float(ca.substitute(cost, u, ca.DM([[1., 2., 3., 4.]]))) == 2. * 30.
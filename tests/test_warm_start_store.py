@@ -0,0 +1,72 @@
+import multiprocessing
+import numpy as np
+from ocp_modules.utils.warm_start_store import WarmStartStore
+from tests import pendulum
+
+
+def _insert(store, value):
+    store.insert(np.full((1,), value), np.full((2,), value), np.zeros((2,)), np.zeros((1,)))
+
+
+def test_store(tmp_path):
+    store = WarmStartStore(3, 2, 1, capacity=2, featureIndices=[1], scale=2., minDistance=0.1)
+    assert np.array_equal(store.features(np.array([5., 1., 7.])), [2.])
+
+    _insert(store, 0.)
+    _insert(store, 1.)
+    # replaces the entry at 1, which is then the most recently used
+    _insert(store, 1.05)
+    x = np.zeros((2,))
+    assert store.lookup(np.zeros((1,)), 0.5, x=x) == (True, 0.)
+    # the least recently used entry at 1.05 is evicted
+    _insert(store, 3.)
+    assert len(store) == 2
+    hit, distance = store.lookup(np.ones((1,)), 0.5)
+    assert not hit and np.isclose(distance, 1.)
+    assert store.hitRate() == 0.5
+
+    store.save(tmp_path / 'store.npz')
+    loaded = WarmStartStore.load(tmp_path / 'store.npz', capacity=1)
+    assert len(loaded) == 1 and np.array_equal(loaded.featureIndices, [1])
+    assert loaded.lookup(np.full((1,), 3.), x=x) == (True, 0.)
+    assert np.array_equal(x, [3., 3.])
+
+
+def _insertInProcess(store):
+    _insert(store, 2.)
+    store.close()
+
+
+def test_shared_store():
+    store = WarmStartStore(1, 2, 1, shared=True)
+    try:
+        process = multiprocessing.Process(target=_insertInProcess, args=(store,))
+        process.start()
+        process.join()
+        assert process.exitcode == 0
+        x = np.zeros((2,))
+        assert store.lookup(np.full((1,), 2.), x=x) == (True, 0.)
+        assert np.array_equal(x, [2., 2.])
+    finally:
+        store.close()
+
+
+def test_nmpc_warm_start_store():
+    """Tests if a controller starts from a stored solution after a reference jump."""
+
+    ocp = pendulum.build_ocp()
+    store = WarmStartStore(ocp.params.size, ocp.var.size,
+                           sum(g.numel() for g, _, _ in ocp.constraints), minDistance=1e-6)
+    controller = pendulum.nmpc(ocp, warmStart='reuse', warmStartStore=store)
+
+    for setpoint in (0., 0.5, 0., 0.5):
+        x_ref = np.tile([[setpoint], [0.]], (1, ocp.horizon_length + 1))
+        controller.step(pendulum.parameters(ocp, x_ref=x_ref))
+
+    metadata = controller.get_metadata()
+    assert list(metadata.warm_start_hit.values) == [False, False, True, True]
+    assert metadata.warm_start_hit_rate == 0.5
+    iterations = metadata.iterations.values
+    assert (iterations[2:] < iterations[:2]).all()
+    assert metadata.warm_start_iteration_savings > 0
+    assert len(store) == 2